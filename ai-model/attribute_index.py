@@ -0,0 +1,176 @@
+"""
+Structured attribute index for medicine documents in the Medical RAG System
+Columnar NumPy arrays (prices, availability, dictionary-encoded categoricals and embeddings)
+built at ingest, used to select candidate rows before vector search
+"""
+import os
+import numpy as np
+from typing import Dict, List, Optional
+import config
+from document_batch import DocumentBatch
+
+MEDICINE_TYPES = ("medicine_basic", "medicine_detailed")
+
+# Filter name -> metadata key of the categorical column it matches
+CATEGORICAL_FILTERS = {
+    "medicine_type": "medicine_type",
+    "dosage_form": "dosage_form",
+    "manufacturer": "manufacturer",
+    "category": "category"
+}
+NUMERIC_FILTERS = ("min_price", "max_price")
+FILTERS = ("available_only",) + NUMERIC_FILTERS + tuple(CATEGORICAL_FILTERS)
+
+INDEX_FILE = "attribute_index.npz"
+
+
+def normalize_value(value) -> str:
+    return " ".join(str(value).lower().split()) if value is not None else ""
+
+
+def validate_filters(filters: Dict) -> Dict:
+    """Check filter names and types, raising ValueError for bad input"""
+    unknown = set(filters) - set(FILTERS)
+    if unknown:
+        raise ValueError(f"Unknown filters: {', '.join(sorted(unknown))}. Supported: {', '.join(FILTERS)}")
+    for name in NUMERIC_FILTERS:
+        if filters.get(name) is not None:
+            try:
+                float(filters[name])
+            except (TypeError, ValueError):
+                raise ValueError(f"{name} must be a number")
+    return filters
+
+
+def encode_column(values: List[str]):
+    """Dictionary-encode strings: (codes, dictionary), with code -1 for missing"""
+    dictionary = sorted({v for v in values if v})
+    lookup = {v: i for i, v in enumerate(dictionary)}
+    codes = np.array([lookup.get(v, -1) for v in values], dtype=np.int32)
+    return codes, np.array(dictionary, dtype=str)
+
+
+class AttributeIndex:
+    """Medicine attributes stored column-wise, one row per document"""
+
+    def __init__(self, ids: np.ndarray, doc_types: np.ndarray, price: np.ndarray, available: np.ndarray,
+                 categoricals: Dict[str, tuple], embeddings: np.ndarray):
+        self.ids = ids
+        self.doc_types = doc_types
+        self.price = price
+        self.available = available
+        self.categoricals = categoricals  # name -> (codes, dictionary)
+        self.embeddings = embeddings
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def build(cls, documents: DocumentBatch) -> "AttributeIndex":
+        """Build from processed documents (with embeddings); non-medicine documents are skipped"""
+        rows = np.flatnonzero(documents.type_mask(MEDICINE_TYPES))
+        metadata = [documents.metadata(i) for i in rows]
+
+        price = np.array([m['price'] if m.get('price') else np.nan for m in metadata], dtype=np.float32)
+        # Only the detailed dataset records discontinuation; others count as available
+        available = np.array([not m.get('is_discontinued', False) for m in metadata], dtype=bool)
+        categoricals = {
+            column: encode_column([normalize_value(m.get(column)) for m in metadata])
+            for column in CATEGORICAL_FILTERS.values()
+        }
+        doc_types = np.array([MEDICINE_TYPES.index(m['type']) for m in metadata], dtype=np.int8)
+        if len(rows):
+            embeddings = np.ascontiguousarray(documents.embeddings[rows], dtype=np.float32)
+        else:
+            embeddings = np.zeros((0, config.EMBEDDING_DIM), dtype=np.float32)
+        return cls(np.array([documents.ids[i] for i in rows], dtype=str), doc_types, price, available,
+                   categoricals, embeddings)
+
+    def save(self, directory: str):
+        arrays = {"ids": self.ids, "doc_types": self.doc_types, "price": self.price,
+                  "available": self.available, "embeddings": self.embeddings}
+        for column, (codes, dictionary) in self.categoricals.items():
+            arrays[f"{column}_codes"] = codes
+            arrays[f"{column}_dictionary"] = dictionary
+        os.makedirs(directory, exist_ok=True)
+        np.savez(os.path.join(directory, INDEX_FILE), **arrays)
+        print(f"Saved attribute index with {len(self)} medicine rows to {directory}")
+
+    @classmethod
+    def load(cls, directory: str) -> Optional["AttributeIndex"]:
+        """Load the index saved next to a vector database, or None if there is none"""
+        path = os.path.join(directory, INDEX_FILE)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            categoricals = {column: (data[f"{column}_codes"], data[f"{column}_dictionary"])
+                            for column in CATEGORICAL_FILTERS.values()}
+            return cls(data["ids"], data["doc_types"], data["price"], data["available"],
+                       categoricals, data["embeddings"])
+
+    def candidates(self, filters: Dict, doc_types: Optional[List[str]] = None) -> np.ndarray:
+        """Row numbers matching every filter (and doc_types, if given)"""
+        mask = np.ones(len(self), dtype=bool)
+        if doc_types:
+            allowed = [MEDICINE_TYPES.index(t) for t in doc_types if t in MEDICINE_TYPES]
+            mask &= np.isin(self.doc_types, allowed)
+        if filters.get("available_only"):
+            mask &= self.available
+        # Rows without a price never match a price predicate (NaN comparisons are False)
+        if filters.get("min_price") is not None:
+            mask &= self.price >= float(filters["min_price"])
+        if filters.get("max_price") is not None:
+            mask &= self.price <= float(filters["max_price"])
+        for name, column in CATEGORICAL_FILTERS.items():
+            wanted = filters.get(name)
+            if wanted is None:
+                continue
+            codes, dictionary = self.categoricals[column]
+            values = wanted if isinstance(wanted, (list, tuple)) else [wanted]
+            wanted_codes = [i for i, v in enumerate(dictionary) if v in {normalize_value(w) for w in values}]
+            mask &= np.isin(codes, wanted_codes)
+        return np.flatnonzero(mask)
+
+    def search(self, query_embedding, rows: np.ndarray, n_results: int, space: str):
+        """Brute-force nearest rows among candidates: list of (id, similarity)
+
+        Similarity is 1 - Chroma's distance for the space, matching search_similar.
+        """
+        if len(rows) == 0:
+            return []
+        vectors = self.embeddings[rows]
+        query = np.asarray(query_embedding, dtype=np.float32)
+        if space == "cosine":
+            norms = np.linalg.norm(vectors, axis=1)
+            norms[norms == 0] = 1.0
+            scores = (vectors @ query) / (norms * max(float(np.linalg.norm(query)), 1e-12))
+        elif space == "ip":
+            scores = vectors @ query
+        else:  # squared L2
+            scores = 1.0 - ((vectors - query) ** 2).sum(axis=1)
+        k = min(n_results, len(rows))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(str(self.ids[rows[i]]), float(scores[i])) for i in top]
+
+
+def chroma_where(filters: Dict, doc_types: Optional[List[str]] = None) -> Optional[Dict]:
+    """Chroma where clause for databases built without an attribute index.
+
+    Close to candidates() but categorical values match case-sensitively.
+    """
+    clauses = [{"type": {"$in": list(doc_types or MEDICINE_TYPES)}}]
+    if filters.get("available_only"):
+        # Documents without is_discontinued never match a clause on it, so only detailed
+        # medicines (the only ones that record discontinuation) are checked
+        clauses.append({"$or": [{"type": {"$ne": "medicine_detailed"}}, {"is_discontinued": {"$ne": True}}]})
+    if filters.get("min_price") is not None:
+        clauses.append({"price": {"$gte": float(filters["min_price"])}})
+    if filters.get("max_price") is not None:
+        clauses.append({"price": {"$lte": float(filters["max_price"])}})
+    for name, column in CATEGORICAL_FILTERS.items():
+        wanted = filters.get(name)
+        if wanted is not None:
+            values = list(wanted) if isinstance(wanted, (list, tuple)) else [wanted]
+            clauses.append({column: {"$in": values}})
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
@@ -0,0 +1,315 @@
+"""
+Benchmark harness for the Medical RAG System
+Measures ingestion throughput per stage, search latency and peak memory on a synthetic corpus.
+Runs fully offline with the hashing embedding stand-in and writes JSON for comparing runs.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List, Tuple
+import numpy as np
+import config
+from dedup import compact
+from document_batch import DocumentBatch
+from embeddings import get_encoder
+from medical_rag_processor import MedicalDataProcessor
+from synthetic_corpus import generate_corpus, SYMPTOMS, DISEASES
+from vector_db_manager import MedicalVectorDB
+
+# Processor method and record cap argument for each source
+PROCESSORS = {
+    "dialogues": ("process_dialogues", False),
+    "descriptions": ("process_disease_descriptions", False),
+    "precautions": ("process_precautions", False),
+    "qna": ("process_qna", False),
+    "symptoms": ("process_symptom_patterns", False),
+    "medicines_basic": ("process_basic_medicines", True),
+    "medicines_detailed": ("process_detailed_medicines", True)
+}
+
+# Filters exercised by MedicalRAGClient.chat plus the unfiltered search
+QUERY_FILTERS = {
+    "none": None,
+    "dialogue": ["dialogue"],
+    "medicines": ["medicine_basic", "medicine_detailed"],
+    "general": ["faq", "symptom_pattern", "precaution", "disease_description"]
+}
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far, in MB"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def latency_summary(samples: List[float]) -> Dict:
+    """Summarize latencies (seconds) in milliseconds"""
+    if not samples:
+        return {}
+    ms = np.array(samples) * 1000.0
+    return {
+        "count": len(samples),
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p90_ms": float(np.percentile(ms, 90)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "max_ms": float(ms.max()),
+        "qps": float(len(samples) / (ms.sum() / 1000.0)) if ms.sum() else 0.0
+    }
+
+
+def directory_mb(path: str) -> float:
+    """Size of the files under path, in MB"""
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, names in os.walk(path) for name in names) / (1024 * 1024)
+
+
+def stage_result(seconds: float, items: int) -> Dict:
+    return {
+        "seconds": seconds,
+        "items": items,
+        "items_per_sec": items / seconds if seconds else 0.0,
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+
+@contextlib.contextmanager
+def quiet():
+    """Silence per-batch progress prints while timing"""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def benchmark_ingestion(processor: MedicalDataProcessor, paths: Dict[str, str], rows: int,
+                        db_path: str, encoder, compact_documents: bool = False) -> Tuple[Dict, DocumentBatch]:
+    """Run parse, chunk, (compact,) embed and insert stages and time each one.
+
+    parse reads the CSVs cold (cleaning and writing the source cache);
+    parse_cached reads the same sources back from the warm cache.
+    """
+    stages = {"parse": {}, "parse_cached": {}, "chunk": {}}
+    frames = {}
+
+    for key, path in paths.items():
+        with quiet():
+            start = time.perf_counter()
+            rows_read = len(processor.read_csv(path, key))
+            stages["parse"][key] = stage_result(time.perf_counter() - start, rows_read)
+            start = time.perf_counter()
+            frames[path] = processor.read_csv(path, key)
+        stages["parse_cached"][key] = stage_result(time.perf_counter() - start, len(frames[path]))
+
+    # Serve the already parsed frames so the chunk stage excludes CSV parsing
+    processor.read_csv = lambda path, key: frames[path]
+    batches = []
+    for key, path in paths.items():
+        method, capped = PROCESSORS[key]
+        func = getattr(processor, method)
+        start = time.perf_counter()
+        with quiet():
+            docs = DocumentBatch.from_dicts(func(path, max_records=rows) if capped else func(path))
+        stages["chunk"][key] = stage_result(time.perf_counter() - start, len(docs))
+        batches.append(docs)
+    frames.clear()
+    documents = DocumentBatch.concat(batches)
+
+    if compact_documents:
+        start = time.perf_counter()
+        with quiet():
+            documents, _, stats = compact(documents)
+        stages["compact"] = dict(stage_result(time.perf_counter() - start, stats["documents"]),
+                                 **{key: stats[key] for key in ("removed", "groups", "shrinkage", "removed_by_type")})
+
+    start = time.perf_counter()
+    with quiet():
+        documents = processor.generate_embeddings(documents)
+    stages["embed"] = stage_result(time.perf_counter() - start, len(documents))
+
+    start = time.perf_counter()
+    with quiet():
+        vector_db = MedicalVectorDB(db_path=db_path, encoder=encoder, server="")
+        vector_db.add_documents(documents)
+    stages["insert"] = stage_result(time.perf_counter() - start, len(documents))
+
+    return stages, documents
+
+
+def make_queries(count: int, seed: int = 0) -> List[str]:
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        symptoms = [s.replace('_', ' ') for s in rng.sample(SYMPTOMS, rng.randint(1, 3))]
+        template = rng.choice([
+            "I have {s}, what should I do?",
+            "what medicine helps with {s}",
+            "is {s} a sign of {d}?",
+            "precautions for {d}"
+        ])
+        queries.append(template.format(s=" and ".join(symptoms), d=rng.choice(DISEASES)))
+    return queries
+
+
+def benchmark_queries(vector_db: MedicalVectorDB, queries: List[str], n_results: int) -> Dict:
+    """Measure search_similar latency with and without doc-type filters"""
+    results = {}
+    with quiet():
+        vector_db.search_similar(queries[0], n_results)  # Warm up
+    for name, doc_types in QUERY_FILTERS.items():
+        samples = []
+        with quiet():
+            for query in queries:
+                start = time.perf_counter()
+                vector_db.search_similar(query, n_results, doc_types)
+                samples.append(time.perf_counter() - start)
+        results[name] = latency_summary(samples)
+    return results
+
+
+def run_benchmark(rows: int, queries: int, n_results: int, data_dir: str = None,
+                  keep: bool = False, seed: int = 0, compact_documents: bool = False,
+                  duplicate_rate: float = 0.0) -> Dict:
+    """Benchmark one corpus size"""
+    work_dir = tempfile.mkdtemp(prefix=f"rag_bench_{rows}_")
+    try:
+        corpus_dir = data_dir or os.path.join(work_dir, "data")
+        start = time.perf_counter()
+        with quiet():
+            paths = generate_corpus(corpus_dir, rows, seed, duplicate_rate=duplicate_rate)
+        generate_seconds = time.perf_counter() - start
+
+        encoder = get_encoder(config.EMBEDDING_BACKEND)
+        processor = MedicalDataProcessor(encoder=encoder,
+                                         source_cache_dir=os.path.join(work_dir, "source_cache"))
+        stages, documents = benchmark_ingestion(
+            processor, paths, rows, os.path.join(work_dir, "chroma"), encoder, compact_documents)
+        document_count = len(documents)
+        del documents
+
+        with quiet():
+            vector_db = MedicalVectorDB(db_path=os.path.join(work_dir, "chroma"), encoder=encoder, server="")
+        query_results = benchmark_queries(vector_db, make_queries(queries, seed), n_results)
+
+        return {
+            "rows_per_source": rows,
+            "documents": document_count,
+            "index_mb": directory_mb(os.path.join(work_dir, "chroma")),
+            "corpus_generation_seconds": generate_seconds,
+            "ingestion": stages,
+            "search": query_results,
+            "peak_rss_mb": peak_rss_mb()
+        }
+    finally:
+        if keep:
+            print(f"Kept benchmark files in {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def compare(baseline_file: str, candidate_file: str):
+    """Print relative changes between two benchmark JSON files"""
+    with open(baseline_file) as f:
+        baseline = json.load(f)
+    with open(candidate_file) as f:
+        candidate = json.load(f)
+
+    base_runs = {run["rows_per_source"]: run for run in baseline["runs"]}
+    for run in candidate["runs"]:
+        base = base_runs.get(run["rows_per_source"])
+        if not base:
+            continue
+        print(f"\nRows per source: {run['rows_per_source']}")
+        old, new = base["documents"], run["documents"]
+        print(f"  {'documents':<20} {old:8d} -> {new:8d} ({(new - old) / old * 100 if old else 0:+.1f}%)")
+        if "index_mb" in base and "index_mb" in run:
+            old, new = base["index_mb"], run["index_mb"]
+            print(f"  {'index size':<20} {old:8.1f}MB -> {new:8.1f}MB ({(new - old) / old * 100 if old else 0:+.1f}%)")
+        for stage in ("embed", "insert"):
+            old, new = base["ingestion"][stage]["seconds"], run["ingestion"][stage]["seconds"]
+            print(f"  {stage:<20} {old:8.2f}s -> {new:8.2f}s ({(new - old) / old * 100 if old else 0:+.1f}%)")
+        for name, summary in run["search"].items():
+            old, new = base["search"][name]["p95_ms"], summary["p95_ms"]
+            print(f"  search p95 [{name:<9}] {old:8.2f}ms -> {new:8.2f}ms ({(new - old) / old * 100 if old else 0:+.1f}%)")
+        old, new = base["peak_rss_mb"], run["peak_rss_mb"]
+        print(f"  {'peak rss':<20} {old:8.1f}MB -> {new:8.1f}MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark RAG ingestion and retrieval")
+    parser.add_argument("--rows", default="10000",
+                        help="Comma-separated rows per source file, e.g. 10000,100000,1000000")
+    parser.add_argument("--queries", type=int, default=200, help="Queries per filter")
+    parser.add_argument("--n-results", type=int, default=config.TOP_K_RESULTS)
+    parser.add_argument("--data-dir", help="Write the synthetic corpus here instead of a temp dir")
+    parser.add_argument("--output", help="JSON output file (default: benchmark_results/<commit>.json)")
+    parser.add_argument("--keep", action="store_true", help="Keep the generated corpus and index")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--compact", action="store_true",
+                        help="Index near-duplicates once (dedup.py); compare against a run without it")
+    parser.add_argument("--duplicate-rate", type=float, default=0.0,
+                        help="Fraction of dialogue, symptom and basic medicine rows generated as near-duplicates")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CANDIDATE"),
+                        help="Compare two result files instead of running")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    # Benchmarks must not touch the network
+    os.environ.setdefault("EMBEDDING_BACKEND", "hashing")
+    config.EMBEDDING_BACKEND = os.environ["EMBEDDING_BACKEND"]
+
+    commit = git_commit()
+    report = {
+        "meta": {
+            "git_commit": commit,
+            "timestamp": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "embedding_backend": config.EMBEDDING_BACKEND,
+            "batch_size": config.BATCH_SIZE,
+            "compact": args.compact,
+            "duplicate_rate": args.duplicate_rate
+        },
+        "runs": []
+    }
+
+    for rows in [int(r) for r in args.rows.split(",")]:
+        print(f"\n📊 Benchmarking with {rows} rows per source...")
+        run = run_benchmark(rows, args.queries, args.n_results, args.data_dir, args.keep, args.seed, args.compact,
+                            args.duplicate_rate)
+        report["runs"].append(run)
+        if args.compact:
+            print(f"🗜️  Compaction removed {run['ingestion']['compact']['removed']} near-duplicates "
+                  f"({run['ingestion']['compact']['shrinkage'] * 100:.1f}%)")
+        print(f"✅ {run['documents']} documents, embed {run['ingestion']['embed']['items_per_sec']:.0f} docs/s, "
+              f"insert {run['ingestion']['insert']['items_per_sec']:.0f} docs/s, "
+              f"search p95 {run['search']['none']['p95_ms']:.2f}ms, peak RSS {run['peak_rss_mb']:.0f}MB")
+
+    output = args.output or os.path.join("benchmark_results", f"{commit[:12]}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+"""
+Offline bulk consultation runner for the Medical RAG System
+Runs questions from a CSV or JSONL file through MedicalRAGClient.chat (or get_medical_advice):
+retrieval is batched across questions, generations run with bounded concurrency and a rate
+limit, and results stream to a JSONL file with per-item timings and estimated cost.
+Rerunning with the same output file resumes after the items it already holds.
+"""
+import argparse
+import contextlib
+import csv
+import json
+import math
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, List, Set
+import numpy as np
+import config
+from generation import create_provider
+from gemini_rag_client import MedicalRAGClient
+
+MODES = ("chat", "advice")
+CHARS_PER_TOKEN = 4  # Rough token estimate for cost reporting
+PROGRESS_EVERY = 25  # Items between progress lines
+
+
+class TokenBucket:
+    """Blocking rate limiter allowing `rate` acquisitions per second"""
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_seconds = (1 - self.tokens) / self.rate
+            time.sleep(wait_seconds)
+
+
+def read_items(path: str, mode: str) -> List[Dict]:
+    """Items from a CSV or JSONL file; ids default to the row number.
+
+    chat rows need a `question`; advice rows need `symptoms` and may have `additional_info`.
+    """
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        if path.endswith('.jsonl'):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+
+    items, seen = [], set()
+    for number, row in enumerate(rows, 1):
+        item = {'id': str(row.get('id') or number)}
+        if item['id'] in seen:
+            raise ValueError(f"Row {number}: duplicate id {item['id']}")
+        seen.add(item['id'])
+        if mode == 'advice':
+            if not row.get('symptoms'):
+                raise ValueError(f"Row {number}: missing symptoms")
+            item['symptoms'] = row['symptoms']
+            item['additional_info'] = row.get('additional_info') or ""
+        else:
+            if not row.get('question'):
+                raise ValueError(f"Row {number}: missing question")
+            item['question'] = row['question']
+        items.append(item)
+    return items
+
+
+def load_completed(output_file: str, retry_errors: bool = False) -> Set[str]:
+    """IDs already in the output file; a partly written last line (from a crash) is dropped"""
+    if not os.path.exists(output_file):
+        return set()
+    with open(output_file, 'rb') as f:
+        data = f.read()
+    complete = data[:data.rfind(b'\n') + 1]
+    if len(complete) < len(data):
+        with open(output_file, 'r+b') as f:
+            f.truncate(len(complete))
+
+    completed = set()
+    for line in complete.decode('utf-8').splitlines():
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        if record['status'] == 'ok' or not retry_errors:
+            completed.add(record['id'])
+    return completed
+
+
+def estimate_usage(client: MedicalRAGClient, result: Dict) -> Dict:
+    """Estimated tokens and cost of the generation call behind a result"""
+    if result['answer_source'] != 'generated':
+        return {'prompt_tokens': 0, 'completion_tokens': 0, 'cost_usd': 0.0}
+    prompt = client.system_prompt.format(context=result['context_used'], question=result['question'])
+    prompt_tokens = math.ceil(len(prompt) / CHARS_PER_TOKEN)
+    completion_tokens = math.ceil(len(result['response']) / CHARS_PER_TOKEN)
+    cost = (prompt_tokens * config.GENERATION_INPUT_COST_PER_1K
+            + completion_tokens * config.GENERATION_OUTPUT_COST_PER_1K) / 1000
+    return {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens, 'cost_usd': cost}
+
+
+def item_query(item: Dict) -> str:
+    if 'symptoms' in item:
+        return MedicalRAGClient.advice_query(item['symptoms'], item['additional_info'])
+    return item['question']
+
+
+def run_item(client: MedicalRAGClient, item: Dict, retrieved: Dict, bucket: TokenBucket,
+             retrieve_seconds: float, queued_at: float) -> Dict:
+    """Generate one answer from pre-retrieved context and build its output record"""
+    started = time.monotonic()
+    if retrieved['faq_match'] is None:
+        bucket.acquire()  # FAQ answers make no generation call
+    generate_start = time.monotonic()
+
+    record = {'id': item['id'], 'mode': 'advice' if 'symptoms' in item else 'chat', 'question': item_query(item)}
+    spans = []
+    try:
+        if 'symptoms' in item:
+            result = client.get_medical_advice(item['symptoms'], item['additional_info'], retrieved=retrieved)
+        else:
+            result = client.chat(item['question'], retrieved=retrieved)
+        spans = result['timings']
+        if result['answer_source'] == 'extractive':
+            # Never expected here (degradation is opt-in per call); keep it retryable if it happens
+            raise RuntimeError(f"Answer was built without generation ({result['degraded_reason']})")
+        record.update({
+            'status': 'ok',
+            'response': result['response'],
+            'answer_source': result['answer_source'],
+            'num_sources': result['num_sources'],
+            'sources': [{'id': doc['id'], 'type': doc['metadata'].get('type'),
+                         'similarity_score': doc['similarity_score']}
+                        for doc in result['retrieved_documents']],
+            'usage': estimate_usage(client, result)
+        })
+        if 'faq_match' in result:
+            record['faq_match'] = result['faq_match']
+    except Exception as e:
+        record.update({'status': 'error', 'error': f"{type(e).__name__}: {e}"})
+
+    finished = time.monotonic()
+    record['timings'] = {
+        'retrieve_ms': retrieve_seconds * 1000,  # Share of the batch's retrieval time
+        'queue_ms': (started - queued_at) * 1000,
+        'rate_limit_ms': (generate_start - started) * 1000,
+        'generate_ms': (finished - generate_start) * 1000,
+        'total_ms': (retrieve_seconds + finished - queued_at) * 1000,
+        'spans': spans
+    }
+    return record
+
+
+def run(client: MedicalRAGClient, items: List[Dict], output_file: str,
+        concurrency: int = config.BULK_CONCURRENCY, rate: float = config.BULK_REQUESTS_PER_SECOND,
+        batch_size: int = config.BULK_RETRIEVAL_BATCH_SIZE, retry_errors: bool = False,
+        verbose: bool = False) -> Dict:
+    """Run every item not yet in output_file and return a run summary"""
+    completed = load_completed(output_file, retry_errors)
+    pending = [item for item in items if item['id'] not in completed]
+    print(f"{len(items)} items: {len(items) - len(pending)} already done, {len(pending)} to run", file=sys.stderr)
+
+    bucket = TokenBucket(rate)
+    summary = {'items': len(pending), 'ok': 0, 'errors': 0, 'faq_answers': 0, 'cost_usd': 0.0,
+               'interrupted': False}
+    latencies = []
+    start = time.monotonic()
+
+    def record_done(futures):
+        for future in futures:
+            if future.cancelled():
+                continue
+            record = future.result()
+            out.write(json.dumps(record, ensure_ascii=False) + '\n')
+            out.flush()
+            latencies.append(record['timings']['total_ms'])
+            if record['status'] == 'ok':
+                summary['ok'] += 1
+                summary['cost_usd'] += record['usage']['cost_usd']
+                summary['faq_answers'] += record['answer_source'] == 'faq'
+            else:
+                summary['errors'] += 1
+            done_count = summary['ok'] + summary['errors']
+            if done_count % PROGRESS_EVERY == 0 or done_count == len(pending):
+                rate_now = done_count / (time.monotonic() - start)
+                print(f"  {done_count}/{len(pending)} done ({summary['errors']} errors, {rate_now:.1f} items/s)",
+                      file=sys.stderr)
+
+    in_flight = set()
+    with contextlib.ExitStack() as stack:
+        out = stack.enter_context(open(output_file, 'a', encoding='utf-8'))
+        if not verbose:
+            # The client logs every step to stdout; keep it off the console
+            stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, 'w'))))
+        executor = stack.enter_context(ThreadPoolExecutor(max_workers=concurrency))
+        try:
+            for offset in range(0, len(pending), batch_size):
+                batch = pending[offset:offset + batch_size]
+                retrieve_start = time.monotonic()
+                retrieved = client.retrieve_batch([item_query(item) for item in batch])
+                retrieve_share = (time.monotonic() - retrieve_start) / len(batch)
+
+                for item, item_retrieved in zip(batch, retrieved):
+                    # Retrieve the next batch while this one generates, but no further ahead
+                    while len(in_flight) >= concurrency + batch_size:
+                        done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                        record_done(done)
+                    in_flight.add(executor.submit(run_item, client, item, item_retrieved, bucket,
+                                                  retrieve_share, time.monotonic()))
+            done, in_flight = wait(in_flight)
+            record_done(done)
+        except KeyboardInterrupt:
+            summary['interrupted'] = True
+            for future in in_flight:
+                future.cancel()
+            done, _ = wait(in_flight)
+            record_done(done)
+
+    summary['wall_seconds'] = time.monotonic() - start
+    summary['items_per_second'] = (summary['ok'] + summary['errors']) / summary['wall_seconds'] if pending else 0.0
+    summary['latency_p50_ms'] = float(np.percentile(latencies, 50)) if latencies else None
+    summary['latency_p95_ms'] = float(np.percentile(latencies, 95)) if latencies else None
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run many consultations through the RAG client")
+    parser.add_argument("input", help="CSV or .jsonl file with id and question (or symptoms) fields")
+    parser.add_argument("--output", help="Results JSONL; reruns resume from it (default: <input>.results.jsonl)")
+    parser.add_argument("--mode", choices=MODES, default="chat",
+                        help="chat: MedicalRAGClient.chat; advice: get_medical_advice")
+    parser.add_argument("--provider", default=config.GENERATION_PROVIDER,
+                        help='Generation provider ("fake" for dry runs)')
+    parser.add_argument("--concurrency", type=int, default=config.BULK_CONCURRENCY)
+    parser.add_argument("--rate", type=float, default=config.BULK_REQUESTS_PER_SECOND,
+                        help="Generation calls per second (0: unlimited)")
+    parser.add_argument("--batch-size", type=int, default=config.BULK_RETRIEVAL_BATCH_SIZE,
+                        help="Questions retrieved together")
+    parser.add_argument("--limit", type=int, help="Only run the first N items")
+    parser.add_argument("--retry-errors", action="store_true", help="Rerun items whose earlier result was an error")
+    parser.add_argument("--verbose", action="store_true", help="Show the client's per-item log")
+    args = parser.parse_args()
+
+    try:
+        items = read_items(args.input, args.mode)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    if args.limit:
+        items = items[:args.limit]
+    output_file = args.output or f"{os.path.splitext(args.input)[0]}.results.jsonl"
+
+    client = MedicalRAGClient(provider=create_provider(args.provider))
+    summary = run(client, items, output_file, args.concurrency, args.rate, args.batch_size,
+                  args.retry_errors, args.verbose)
+
+    print(json.dumps(summary, indent=2))
+    if summary['interrupted']:
+        print(f"Interrupted; rerun with --output {output_file} to resume", file=sys.stderr)
+    else:
+        print(f"✅ Results written to {output_file}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -9,20 +9,157 @@ load_dotenv()
 # Vector Database Settings
 CHROMA_DB_PATH = "./medical_chroma_db"
 COLLECTION_NAME = "medical_knowledge"
+# Shared Chroma server ("host:port" of `chroma run`); empty: local PersistentClient at CHROMA_DB_PATH.
+# Sidecar files (attribute index, FAQ index) are still read from CHROMA_DB_PATH.
+CHROMA_SERVER = os.getenv("CHROMA_SERVER", "")
+CHROMA_SERVER_SSL = os.getenv("CHROMA_SERVER_SSL", "false").lower() == "true"
+CHROMA_RETRIES = int(os.getenv("CHROMA_RETRIES", "2"))  # Retries of transport errors (writes: connect errors only)
+CHROMA_RETRY_BACKOFF_SECONDS = float(os.getenv("CHROMA_RETRY_BACKOFF_SECONDS", "0.2"))  # Doubles per retry
 EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "sentence-transformers")  # or "hashing" (offline stand-in)
+EMBEDDING_DIM = 384
+
+# Query-time micro-batching of concurrent encode calls (AI service)
+EMBEDDING_MICRO_BATCHING = os.getenv("EMBEDDING_MICRO_BATCHING", "true").lower() == "true"
+EMBEDDING_MAX_BATCH_SIZE = 32
+EMBEDDING_MAX_WAIT_MS = float(os.getenv("EMBEDDING_MAX_WAIT_MS", "3"))
 
 # API Keys (set these in your .env file)
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+AI_ADMIN_TOKEN = os.getenv("AI_ADMIN_TOKEN")  # Required in X-Admin-Token; admin endpoints are refused while unset
 
 # Data Processing Settings
 CHUNK_SIZE = 512  # Maximum characters per chunk
 OVERLAP_SIZE = 50  # Character overlap between chunks
 BATCH_SIZE = 100  # Batch size for embedding generation
+# Cleaned Parquet copies of the source CSVs, reused while a source is unchanged (empty: disabled)
+SOURCE_CACHE_DIR = os.getenv("SOURCE_CACHE_DIR", "./source_cache") or None
+
+# Vector index profiles: HNSW construction/search parameters and distance space.
+# Applied when a collection is created; run tune_index.py to pick one for the corpus.
+INDEX_PROFILES = {
+    "fast": {"space": "cosine", "M": 8, "ef_construction": 64, "ef_search": 16},
+    "balanced": {"space": "cosine", "M": 16, "ef_construction": 100, "ef_search": 64},
+    "accurate": {"space": "cosine", "M": 32, "ef_construction": 200, "ef_search": 200}
+}
+INDEX_PROFILE = os.getenv("INDEX_PROFILE", "balanced")
+
+# Versioned index snapshots: ingestion writes a new version directory and publishes it
+# by updating <root>/CURRENT; the AI service hot-swaps to it without downtime
+INDEX_SNAPSHOT_ROOT = os.getenv("INDEX_SNAPSHOT_ROOT", "./medical_index_snapshots")
+INDEX_SNAPSHOT_POLL_SECONDS = float(os.getenv("INDEX_SNAPSHOT_POLL_SECONDS", "10"))
+INDEX_SNAPSHOT_GRACE_SECONDS = float(os.getenv("INDEX_SNAPSHOT_GRACE_SECONDS", "300"))  # Before old versions are deleted
+INDEX_WARMUP_QUERIES = ["chest pain symptoms", "diabetes treatment", "paracetamol dosage"]
+
+# Sharded retrieval: shard servers (shard_server.py) each own part of the index; the
+# AI service fans queries out and merges the top results. Comma-separated endpoints,
+# e.g. "http://127.0.0.1:7001,unix:///tmp/medical-shard-1.sock" (empty: local index)
+VECTOR_SHARDS = os.getenv("VECTOR_SHARDS", "")
+SHARD_DEADLINE_MS = float(os.getenv("SHARD_DEADLINE_MS", "500"))  # Slower shards are left out of the merge
+SHARD_ROOT = os.getenv("SHARD_ROOT", "./medical_shards")  # Where shard_server.py split writes shard indexes
+
+# Background re-index jobs started through /api/ai/index/jobs
+INDEX_JOBS_DIR = os.getenv("INDEX_JOBS_DIR", "./index_jobs")  # Job status files
+INDEX_JOB_NICE = int(os.getenv("INDEX_JOB_NICE", "10"))  # Added niceness of the job process
+INDEX_JOB_CPUS = os.getenv("INDEX_JOB_CPUS", "")  # CPUs the job may use, e.g. "3" or "2-3" (empty: all)
+INDEX_JOB_THREADS = int(os.getenv("INDEX_JOB_THREADS", "1"))  # Torch/BLAS threads in the job process
+# Jobs may read source CSVs from a data_dir under this directory (empty: data_dir is refused)
+INDEX_JOB_DATA_ROOT = os.getenv("INDEX_JOB_DATA_ROOT", "")
+
+# FAQ fast path: answer near-duplicate trainQ&A questions directly (opt-in)
+FAQ_FAST_PATH_ENABLED = os.getenv("FAQ_FAST_PATH_ENABLED", "false").lower() == "true"
+FAQ_INDEX_PATH = "./faq_index"  # Writes faq_index.npz and faq_index.json
+FAQ_MATCH_THRESHOLD = float(os.getenv("FAQ_MATCH_THRESHOLD", "0.92"))  # Cosine similarity
+
+# Drug-interaction graph parsed from the detailed medicine dataset at ingest
+INTERACTION_GRAPH_PATH = "./interaction_graph"  # Writes interaction_graph.npz
+INTERACTION_CONTEXT_LIMIT = 8  # Graph hits added to a chat context that mentions medicines
+INTERACTION_MAX_MEDICINES = 50  # Largest list /api/ai/interactions checks at once
+
+# Entity matching: disease, medicine and salt names in a question fetch their documents
+# by ID into the first context slots; vector search fills the rest
+ENTITY_MATCHING_ENABLED = os.getenv("ENTITY_MATCHING_ENABLED", "true").lower() == "true"
+ENTITY_INDEX_PATH = "./entity_index"  # Writes entity_index.json
+ENTITY_MAX_DOCUMENTS = 4  # Matched documents per question
+ENTITY_MAX_DOCS_PER_NAME = 3  # Documents kept per name (a salt is in many medicines)
+
+# Near-duplicate compaction at ingest: documents of these types whose word shingles overlap
+# above the Jaccard threshold (MinHash + LSH) are indexed once; the representative lists the
+# others in its metadata and the removed documents are kept for `python dedup.py expand`
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "false").lower() == "true"  # Opt-in until measured on the real sources
+DEDUP_TYPES = [t for t in os.getenv("DEDUP_TYPES", "dialogue,symptom_pattern,medicine_basic").split(",") if t]
+DEDUP_JACCARD_THRESHOLD = float(os.getenv("DEDUP_JACCARD_THRESHOLD", "0.8"))
+DEDUP_NUM_PERM = 128  # MinHash signature length
+DEDUP_SHINGLE_SIZE = 1  # Words per shingle; single words suit the short templated rows
+DEDUP_MEMBERS_PATH = "./dedup_members"  # Writes dedup_members.json
+
+# Generation Settings
+GENERATION_PROVIDER = os.getenv("GENERATION_PROVIDER", "gemini")  # "gemini" or "fake" (offline stand-in)
+GEMINI_MODEL = "gemini-1.5-flash"
+GENERATION_DEADLINE_SECONDS = float(os.getenv("GENERATION_DEADLINE_SECONDS", "20"))
+GENERATION_HEDGE_ENABLED = os.getenv("GENERATION_HEDGE_ENABLED", "false").lower() == "true"
+GENERATION_HEDGE_PERCENTILE = 95  # Send a hedged request once the first exceeds this latency percentile
+GENERATION_HEDGE_MIN_SAMPLES = 20  # Successful calls needed before hedging kicks in
+GENERATION_MAX_WORKERS = 16
+
+# Circuit breaker for generation calls
+BREAKER_WINDOW_SIZE = 20  # Number of recent calls considered
+BREAKER_FAILURE_RATE = 0.5  # Open when this fraction of the window failed
+BREAKER_MIN_CALLS = 10
+BREAKER_OPEN_SECONDS = 30
+
+# Degraded mode for /api/ai/chat: answer from the retrieved documents, without generation,
+# when generation fails, its breaker is open or chat requests are shed (requests can also
+# ask for it). Other callers (advice endpoints, bulk_consult.py) still get GenerationError.
+DEGRADED_MODE_ENABLED = os.getenv("DEGRADED_MODE_ENABLED", "true").lower() == "true"
+
+# Request scheduling in the AI service: each priority class has its own concurrency
+# limit and bounded wait queue; requests get 429 + Retry-After once the estimated
+# queueing delay passes max_wait_seconds
+ADMISSION_CONTROL_ENABLED = os.getenv("ADMISSION_CONTROL_ENABLED", "true").lower() == "true"
+MAX_INFLIGHT_GENERATIONS = int(os.getenv("MAX_INFLIGHT_GENERATIONS", "8"))
+SCHEDULER_CLASSES = {
+    "interactive": {"max_concurrent": 16, "max_queue": 64, "max_wait_seconds": 2.0},
+    "generation": {"max_concurrent": MAX_INFLIGHT_GENERATIONS, "max_queue": 32, "max_wait_seconds": 10.0},
+    "admin": {"max_concurrent": 2, "max_queue": 8, "max_wait_seconds": 30.0}
+}
+# Path prefix -> class; unlisted paths (/health, /metrics) are never queued
+ROUTE_CLASSES = {
+    "/api/ai/chat": "generation",
+    "/api/ai/search": "interactive",
+    "/api/ai/interactions": "interactive",
+    "/api/ai/stats": "interactive",
+    "/api/ai/index/jobs": "admin"
+}
+
+# Sampling profiler in the AI service: a fraction of /api/ai requests is profiled into
+# PROFILE_DIR as collapsed stacks; admins can also capture /debug/profile?seconds=N
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))  # Fraction of requests (0: off)
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))  # Time between stack samples
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./profiles")
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "500"))  # Oldest profiles are deleted beyond this
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))  # Longest on-demand profile
+
+# Fake generation provider (load tests and offline runs)
+FAKE_GENERATION_LATENCY_MS = float(os.getenv("FAKE_GENERATION_LATENCY_MS", "800"))
+FAKE_GENERATION_JITTER_MS = float(os.getenv("FAKE_GENERATION_JITTER_MS", "200"))
+FAKE_GENERATION_FAILURE_RATE = float(os.getenv("FAKE_GENERATION_FAILURE_RATE", "0"))
+
+# Estimated generation cost in USD per 1K tokens (tokens estimated as characters / 4)
+GENERATION_INPUT_COST_PER_1K = float(os.getenv("GENERATION_INPUT_COST_PER_1K", "0"))
+GENERATION_OUTPUT_COST_PER_1K = float(os.getenv("GENERATION_OUTPUT_COST_PER_1K", "0"))
+
+# Offline bulk consultation runs (bulk_consult.py)
+BULK_CONCURRENCY = int(os.getenv("BULK_CONCURRENCY", "4"))  # Generations in flight
+BULK_REQUESTS_PER_SECOND = float(os.getenv("BULK_REQUESTS_PER_SECOND", "2"))  # Generation rate limit (0: none)
+BULK_RETRIEVAL_BATCH_SIZE = int(os.getenv("BULK_RETRIEVAL_BATCH_SIZE", "32"))  # Questions retrieved together
 
 # RAG Settings
 TOP_K_RESULTS = 5  # Number of similar documents to retrieve
 SIMILARITY_THRESHOLD = 0.7  # Minimum similarity score
+SEARCH_DEFAULT_LIMIT = 10  # Results per /api/ai/search page
+SEARCH_MAX_LIMIT = 100  # Largest offset + limit a search may request
 
 # File paths
 CSV_FILES = {
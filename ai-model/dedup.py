@@ -0,0 +1,202 @@
+"""
+Near-duplicate compaction for the Medical RAG ingestion pipeline
+MinHash signatures over word shingles and LSH banding find documents whose text overlaps
+above a Jaccard threshold; one representative per group is indexed and lists the others
+in its metadata. The removed members are kept in a sidecar file so compaction can be
+reversed (python dedup.py expand).
+"""
+import argparse
+import re
+import time
+import zlib
+import numpy as np
+from collections import Counter
+from typing import Dict, List, Tuple
+import config
+from document_batch import DocumentBatch
+
+# Metadata that must be equal for two documents to be merged, per document type, so a
+# representative keeps the names and filter attributes of every member
+MATCH_KEYS = {
+    "dialogue": ("section_header",),
+    "disease_description": ("disease",),
+    "precaution": ("disease",),
+    "faq": ("question_type",),
+    "symptom_pattern": ("diagnosis",),
+    "medicine_basic": ("medicine_name", "category", "dosage_form", "manufacturer"),
+    "medicine_detailed": ("medicine_name", "medicine_type", "manufacturer", "is_discontinued")
+}
+# Metadata added to representatives and members
+COUNT_KEY = "duplicate_count"
+IDS_KEY = "duplicate_ids"
+MEMBER_KEY = "duplicate_of"
+
+_PRIME = 4294967311  # Smallest prime above 2**32; (a * x + b) stays below 2**64
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def shingles(text: str, size: int = config.DEDUP_SHINGLE_SIZE) -> np.ndarray:
+    """Sorted unique 32-bit hashes of the word shingles of a text"""
+    words = _WORD.findall(text.lower())
+    grams = [" ".join(words[i:i + size]) for i in range(max(len(words) - size + 1, 1))]
+    return np.unique(np.array([zlib.crc32(gram.encode()) for gram in grams], dtype=np.uint64))
+
+
+def jaccard(a: np.ndarray, b: np.ndarray) -> float:
+    overlap = len(np.intersect1d(a, b, assume_unique=True))
+    return overlap / (len(a) + len(b) - overlap)
+
+
+def lsh_params(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """(bands, rows) splitting num_perm signature values so that pairs near the
+    threshold are likely to share a band, weighing missed and spurious pairs equally"""
+    similarity = np.linspace(0, 1, 201)
+    best, best_error = (num_perm, 1), None
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        collide = 1 - (1 - similarity ** rows) ** bands
+        below = similarity < threshold
+        error = collide[below].sum() + (1 - collide[~below]).sum()
+        if best_error is None or error < best_error:
+            best, best_error = (bands, rows), error
+    return best
+
+
+class MinHasher:
+    """MinHash signatures from num_perm universal hash functions"""
+
+    def __init__(self, num_perm: int = config.DEDUP_NUM_PERM, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, 2 ** 32, num_perm, dtype=np.uint64)[:, None]
+        self.b = rng.integers(0, 2 ** 32, num_perm, dtype=np.uint64)[:, None]
+
+    def signature(self, hashes: np.ndarray) -> np.ndarray:
+        return ((self.a * hashes[None, :] + self.b) % _PRIME).min(axis=1).astype(np.uint32)
+
+
+def find_duplicates(documents: DocumentBatch, threshold: float = config.DEDUP_JACCARD_THRESHOLD,
+                    types: List[str] = config.DEDUP_TYPES, num_perm: int = config.DEDUP_NUM_PERM,
+                    shingle_size: int = config.DEDUP_SHINGLE_SIZE) -> Dict[int, List[int]]:
+    """Representative row -> member rows, for groups of two or more documents.
+
+    Documents are visited longest first; each one not yet grouped becomes a representative
+    and takes every LSH candidate whose exact shingle Jaccard with it reaches threshold, so
+    members are all close to their representative (no chaining through intermediate rows).
+    """
+    rows = np.flatnonzero(documents.type_mask(types))
+    if not len(rows):
+        return {}
+    hasher = MinHasher(num_perm)
+    bands, band_rows = lsh_params(threshold, num_perm)
+
+    sets, buckets = {}, {}
+    for row in rows:
+        metadata = documents.metadata(row)
+        group = (metadata['type'],) + tuple(str(metadata.get(key)) for key in MATCH_KEYS.get(metadata['type'], ()))
+        sets[row] = shingles(documents.texts[row], shingle_size)
+        signature = hasher.signature(sets[row])
+        for band in range(bands):
+            key = (group, band, signature[band * band_rows:(band + 1) * band_rows].tobytes())
+            buckets.setdefault(key, []).append(row)
+
+    neighbors = {}
+    for bucket in buckets.values():
+        if len(bucket) > 1:
+            for row in bucket:
+                neighbors.setdefault(row, set()).update(bucket)
+
+    groups, grouped = {}, set()
+    for row in sorted(neighbors, key=lambda r: (-len(documents.texts[r]), r)):
+        if row in grouped:
+            continue
+        members = [other for other in sorted(neighbors[row])
+                   if other != row and other not in grouped and jaccard(sets[row], sets[other]) >= threshold]
+        if members:
+            groups[row] = members
+            grouped.update(members)
+            grouped.add(row)
+    return groups
+
+
+def compact(documents: DocumentBatch, threshold: float = config.DEDUP_JACCARD_THRESHOLD,
+            types: List[str] = config.DEDUP_TYPES) -> Tuple[DocumentBatch, DocumentBatch, Dict]:
+    """Split documents into (indexed, removed members, stats).
+
+    Representatives get duplicate_count and comma-separated duplicate_ids metadata;
+    members get duplicate_of. Embeddings, if already generated, are carried along.
+    """
+    start = time.perf_counter()
+    groups = find_duplicates(documents, threshold, types)
+    member_rows = sorted(row for members in groups.values() for row in members)
+    removed = set(member_rows)
+    kept = np.array([row for row in range(len(documents)) if row not in removed], dtype=np.int64)
+
+    compacted = documents.take(kept)
+    members = documents.take(np.array(member_rows, dtype=np.int64))
+    position = {row: i for i, row in enumerate(kept.tolist())}
+    member_position = {row: i for i, row in enumerate(member_rows)}
+    for representative, rows in groups.items():
+        metadata = dict(compacted.extra_metadata[position[representative]])
+        metadata[COUNT_KEY] = len(rows)
+        metadata[IDS_KEY] = ",".join(documents.ids[row] for row in rows)
+        compacted.extra_metadata[position[representative]] = metadata
+        for row in rows:
+            members.extra_metadata[member_position[row]] = dict(
+                members.extra_metadata[member_position[row]], **{MEMBER_KEY: documents.ids[representative]})
+
+    removed_by_type = Counter(members.metadata(i)['type'] for i in range(len(members)))
+    stats = {
+        "documents": len(documents),
+        "indexed": len(compacted),
+        "removed": len(members),
+        "groups": len(groups),
+        "shrinkage": len(members) / len(documents) if len(documents) else 0.0,
+        "removed_by_type": dict(removed_by_type),
+        "threshold": threshold,
+        "seconds": time.perf_counter() - start
+    }
+    print(f"Compacted {stats['documents']} documents to {stats['indexed']} "
+          f"({stats['shrinkage'] * 100:.1f}% fewer, {stats['groups']} near-duplicate groups)")
+    for doc_type, count in removed_by_type.most_common():
+        print(f"  {doc_type}: {count} removed")
+    return compacted, members, stats
+
+
+def expand(compacted: DocumentBatch, members: DocumentBatch) -> DocumentBatch:
+    """Undo compact(): every document, without the duplicate metadata.
+
+    Members come after the indexed documents. The result has embeddings only if the
+    members have them too (expand_json embeds them first).
+    """
+    documents = DocumentBatch.concat([compacted, members])
+    documents.extra_metadata = [{key: value for key, value in metadata.items()
+                                 if key not in (COUNT_KEY, IDS_KEY, MEMBER_KEY)}
+                                for metadata in documents.extra_metadata]
+    return documents
+
+
+def expand_json(json_file: str, members_file: str, output_file: str):
+    """Write the full processed-documents JSON from a compacted one and its members sidecar"""
+    from embeddings import get_encoder
+    from medical_rag_processor import MedicalDataProcessor
+
+    compacted = DocumentBatch.load_json(json_file)
+    members = DocumentBatch.load_json(members_file)
+    print(f"Expanding {len(compacted)} documents with {len(members)} near-duplicates...")
+    processor = MedicalDataProcessor(encoder=get_encoder(config.EMBEDDING_BACKEND))
+    processor.generate_embeddings(members)
+    documents = expand(compacted, members)
+    documents.save_json(output_file)
+    print(f"Saved {len(documents)} documents to {output_file}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Near-duplicate compaction of processed documents")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    expand_parser = subparsers.add_parser("expand", help="Restore the documents compaction removed")
+    expand_parser.add_argument("--json", default="processed_medical_data.json")
+    expand_parser.add_argument("--members", default=config.DEDUP_MEMBERS_PATH + ".json")
+    expand_parser.add_argument("--output", default="processed_medical_data.full.json")
+    args = parser.parse_args()
+
+    expand_json(args.json, args.members, args.output)
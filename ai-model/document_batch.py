@@ -0,0 +1,192 @@
+"""
+Columnar document batch for the Medical RAG ingestion pipeline
+Carries documents between stages as parallel arrays: ids and texts, dictionary-encoded
+categorical metadata and one contiguous float32 embedding matrix.
+Converts to and from the {id, document, metadata, embedding} dict format at the edges.
+"""
+import json
+import numpy as np
+from typing import Dict, Iterable, Iterator, List, Optional
+
+# Metadata keys repeated across many documents; stored once per distinct value
+CATEGORICAL_KEYS = ("type", "source_file")
+JSON_READ_CHARS = 1 << 20
+
+
+def iter_json_array(f, chunk_chars: int = JSON_READ_CHARS) -> Iterator:
+    """Yield the elements of the JSON array in text file f, reading it in chunks.
+
+    Only the unparsed tail of the file and the element being decoded are held in memory.
+    """
+    decoder = json.JSONDecoder()
+    buffer, pos, eof = "", 0, False
+
+    def refill():
+        nonlocal buffer, pos, eof
+        chunk = f.read(chunk_chars)
+        eof = not chunk
+        buffer, pos = buffer[pos:] + chunk, 0
+        return not eof
+
+    def next_char() -> str:
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\n\r":
+                pos += 1
+            if pos < len(buffer):
+                return buffer[pos]
+            if not refill():
+                raise ValueError("Unexpected end of JSON array")
+
+    if next_char() != "[":
+        raise ValueError("Expected a JSON array")
+    pos += 1
+    if next_char() == "]":
+        return
+    while True:
+        next_char()
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+                # A number cut off by the end of the buffer decodes as a shorter one; in a
+                # valid array every element is followed by whitespace, ',' or ']'
+                if eof or (end < len(buffer) and buffer[end] in " \t\n\r,]"):
+                    break
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            refill()
+        pos = end
+        yield value
+        separator = next_char()
+        pos += 1
+        if separator == "]":
+            return
+        if separator != ",":
+            raise ValueError(f"Expected ',' or ']' in JSON array, found {separator!r}")
+
+
+class DocumentBatch:
+    """Documents stored column-wise.
+
+    Per-document metadata other than CATEGORICAL_KEYS stays in small dicts
+    (it is mostly unique per row). embeddings is None until generated.
+    """
+
+    def __init__(self, ids: List[str], texts: List[str], categoricals: Dict[str, tuple],
+                 extra_metadata: List[Dict], embeddings: Optional[np.ndarray] = None):
+        self.ids = ids
+        self.texts = texts
+        self.categoricals = categoricals  # key -> (int32 codes, list of values), code -1 = absent
+        self.extra_metadata = extra_metadata
+        self.embeddings = embeddings
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self) -> Iterator[Dict]:
+        return self.iter_dicts()
+
+    @classmethod
+    def from_dicts(cls, documents: Iterable[Dict]) -> "DocumentBatch":
+        """Build from dict documents; embeddings are kept if every document has one"""
+        ids, texts, extra_metadata, embeddings = [], [], [], []
+        codes = {key: [] for key in CATEGORICAL_KEYS}
+        lookups = {key: {} for key in CATEGORICAL_KEYS}
+        for doc in documents:
+            ids.append(doc['id'])
+            texts.append(doc['document'])
+            metadata = dict(doc['metadata'])
+            for key in CATEGORICAL_KEYS:
+                if key in metadata:
+                    value = metadata.pop(key)
+                    codes[key].append(lookups[key].setdefault(value, len(lookups[key])))
+                else:
+                    codes[key].append(-1)
+            extra_metadata.append(metadata)
+            if embeddings is not None and doc.get('embedding') is not None:
+                embeddings.append(np.asarray(doc['embedding'], dtype=np.float32))
+            else:
+                embeddings = None
+
+        categoricals = {key: (np.array(codes[key], dtype=np.int32), list(lookups[key]))
+                        for key in CATEGORICAL_KEYS}
+        matrix = np.vstack(embeddings) if embeddings else None
+        return cls(ids, texts, categoricals, extra_metadata, matrix)
+
+    @classmethod
+    def concat(cls, batches: List["DocumentBatch"]) -> "DocumentBatch":
+        """Join batches, re-encoding categoricals against a shared dictionary"""
+        ids, texts, extra_metadata = [], [], []
+        categoricals = {}
+        for key in CATEGORICAL_KEYS:
+            lookup = {}
+            parts = []
+            for batch in batches:
+                batch_codes, values = batch.categoricals[key]
+                remap = np.array([lookup.setdefault(v, len(lookup)) for v in values] + [-1], dtype=np.int32)
+                parts.append(remap[batch_codes])  # code -1 indexes the trailing -1
+            categoricals[key] = (np.concatenate(parts) if parts else np.zeros(0, np.int32), list(lookup))
+        for batch in batches:
+            ids.extend(batch.ids)
+            texts.extend(batch.texts)
+            extra_metadata.extend(batch.extra_metadata)
+        embeddings = None
+        if batches and all(batch.embeddings is not None for batch in batches):
+            embeddings = np.vstack([batch.embeddings for batch in batches])
+        return cls(ids, texts, categoricals, extra_metadata, embeddings)
+
+    def take(self, rows: np.ndarray) -> "DocumentBatch":
+        """Batch of the given row numbers, sharing the categorical dictionaries"""
+        categoricals = {key: (codes[rows], values) for key, (codes, values) in self.categoricals.items()}
+        embeddings = self.embeddings[rows] if self.embeddings is not None else None
+        return DocumentBatch([self.ids[i] for i in rows], [self.texts[i] for i in rows], categoricals,
+                             [self.extra_metadata[i] for i in rows], embeddings)
+
+    def metadata(self, i: int) -> Dict:
+        """Full metadata dict of document i"""
+        metadata = {}
+        for key in CATEGORICAL_KEYS:
+            codes, values = self.categoricals[key]
+            if codes[i] >= 0:
+                metadata[key] = values[codes[i]]
+        metadata.update(self.extra_metadata[i])
+        return metadata
+
+    def metadatas(self, start: int = 0, end: Optional[int] = None) -> List[Dict]:
+        return [self.metadata(i) for i in range(start, len(self) if end is None else end)]
+
+    def type_mask(self, types: Iterable[str]) -> np.ndarray:
+        """Boolean mask of documents whose metadata type is in types"""
+        codes, values = self.categoricals['type']
+        wanted = [code for code, value in enumerate(values) if value in set(types)]
+        return np.isin(codes, wanted)
+
+    def to_dict(self, i: int, include_embedding: bool = True) -> Dict:
+        doc = {'id': self.ids[i], 'document': self.texts[i], 'metadata': self.metadata(i)}
+        if include_embedding and self.embeddings is not None:
+            doc['embedding'] = self.embeddings[i].tolist()
+        return doc
+
+    def iter_dicts(self, include_embeddings: bool = True) -> Iterator[Dict]:
+        for i in range(len(self)):
+            yield self.to_dict(i, include_embeddings)
+
+    def to_dicts(self, include_embeddings: bool = True) -> List[Dict]:
+        return list(self.iter_dicts(include_embeddings))
+
+    def save_json(self, path: str):
+        """Write the processed_medical_data.json format one document at a time"""
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('[\n')
+            for i in range(len(self)):
+                if i:
+                    f.write(',\n')
+                f.write(json.dumps(self.to_dict(i), indent=2, ensure_ascii=False))
+            f.write('\n]')
+
+    @classmethod
+    def load_json(cls, path: str) -> "DocumentBatch":
+        """Read processed_medical_data.json, parsing one document dict at a time"""
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls.from_dicts(iter_json_array(f))
@@ -0,0 +1,180 @@
+"""
+Embedding encoders for the Medical RAG System
+Shared by ingestion and query-time search so both use the same model
+"""
+import os
+import queue
+import re
+import threading
+import time
+import zlib
+from concurrent.futures import Future
+from functools import lru_cache
+import numpy as np
+from typing import Dict, List, Tuple
+import config
+from instrumentation import REGISTRY
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+class SentenceTransformerEncoder:
+    """Encodes text with a sentence-transformers model, loaded on first use"""
+    name = "sentence-transformers"
+
+    def __init__(self, model_name: str = config.EMBEDDING_MODEL):
+        self.model_name = model_name
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from sentence_transformers import SentenceTransformer
+                    self._model = SentenceTransformer(self.model_name)
+        return self._model
+
+    def encode(self, texts: List[str], batch_size: int = config.BATCH_SIZE) -> np.ndarray:
+        """Encode texts into a float32 matrix of shape (len(texts), dim)"""
+        embeddings = self.model.encode(texts, batch_size=batch_size, convert_to_numpy=True,
+                                       show_progress_bar=False)
+        return np.asarray(embeddings, dtype=np.float32)
+
+
+@lru_cache(maxsize=200000)
+def _feature_slot(feature: str, dim: int) -> Tuple[int, float]:
+    h = zlib.crc32(feature.encode('utf-8'))
+    return h % dim, (1.0 if (h >> 31) & 1 else -1.0)
+
+
+class HashingEncoder:
+    """Deterministic, network-free stand-in for the embedding model.
+
+    Hashes word unigrams and bigrams into a signed bag-of-features vector and
+    L2-normalizes it. Similar texts get similar vectors, which is enough for
+    benchmarks and offline tests; it is not a semantic model.
+    """
+    name = "hashing"
+
+    def __init__(self, dim: int = config.EMBEDDING_DIM):
+        self.dim = dim
+
+    def encode(self, texts: List[str], batch_size: int = None) -> np.ndarray:
+        embeddings = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            tokens = _TOKEN_RE.findall(str(text).lower())
+            features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+            for feature in features:
+                slot, sign = _feature_slot(feature, self.dim)
+                embeddings[row, slot] += sign
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return embeddings / norms
+
+
+EMBEDDING_BATCH_SIZE = REGISTRY.summary(
+    "medical_rag_embedding_batch_size", "Texts per micro-batched encoder call")
+EMBEDDING_QUEUE_WAIT = REGISTRY.summary(
+    "medical_rag_embedding_queue_wait_seconds", "Time encode requests waited in the micro-batching queue")
+
+
+class MicroBatchingEncoder:
+    """Collects concurrent small encode calls into one batched model call.
+
+    Callers block on a future while a single worker thread drains the queue for
+    up to max_wait_ms or max_batch_size texts. The wait only applies while the
+    previous batch had company, so an isolated request is encoded immediately.
+    Large calls (ingestion) bypass the queue.
+    """
+
+    def __init__(self, encoder, max_batch_size: int = config.EMBEDDING_MAX_BATCH_SIZE,
+                 max_wait_ms: float = config.EMBEDDING_MAX_WAIT_MS):
+        self.encoder = encoder
+        self.name = f"micro-batched {encoder.name}"
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._pid = None
+        self._queue = None
+        self._lock = threading.Lock()
+        self._last_batch_size = 1
+        self._stats = {'requests': 0, 'batches': 0, 'texts': 0, 'bypassed': 0}
+
+    def _ensure_worker(self):
+        # Threads do not survive fork, so each process starts its own worker
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._queue = queue.Queue()
+                    threading.Thread(target=self._run, daemon=True, name="embedding-batcher").start()
+                    self._pid = os.getpid()
+
+    def encode(self, texts: List[str], batch_size: int = None) -> np.ndarray:
+        if len(texts) >= self.max_batch_size:
+            with self._lock:
+                self._stats['bypassed'] += 1
+            return self.encoder.encode(texts)
+
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((list(texts), future, time.perf_counter()))
+        return future.result()
+
+    def _collect(self) -> List[Tuple]:
+        batch = [self._queue.get()]
+        count = len(batch[0][0])
+        deadline = time.perf_counter() + (self.max_wait if self._last_batch_size > 1 else 0.0)
+        while count < self.max_batch_size:
+            try:
+                remaining = deadline - time.perf_counter()
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+            count += len(item[0])
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            texts = [text for item in batch for text in item[0]]
+            for _, _, enqueued in batch:
+                EMBEDDING_QUEUE_WAIT.observe(started - enqueued)
+            EMBEDDING_BATCH_SIZE.observe(len(texts))
+            self._last_batch_size = len(batch)
+            with self._lock:
+                self._stats['requests'] += len(batch)
+                self._stats['batches'] += 1
+                self._stats['texts'] += len(texts)
+
+            try:
+                embeddings = self.encoder.encode(texts)
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            offset = 0
+            for item_texts, future, _ in batch:
+                future.set_result(embeddings[offset:offset + len(item_texts)])
+                offset += len(item_texts)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats['avg_batch_requests'] = stats['requests'] / stats['batches'] if stats['batches'] else 0.0
+        stats['queue_depth'] = self._queue.qsize() if self._queue is not None else 0
+        stats['max_batch_size'] = self.max_batch_size
+        stats['max_wait_ms'] = self.max_wait * 1000.0
+        return stats
+
+
+def get_encoder(backend: str = config.EMBEDDING_BACKEND):
+    """Create the configured encoder"""
+    if backend == "sentence-transformers":
+        return SentenceTransformerEncoder()
+    if backend == "hashing":
+        return HashingEncoder()
+    raise ValueError(f"Unknown embedding backend '{backend}'. Use 'sentence-transformers' or 'hashing'")
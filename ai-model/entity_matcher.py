@@ -0,0 +1,146 @@
+"""
+Entity matcher for the Medical RAG System
+An Aho-Corasick automaton over disease names, medicine names and salt compositions
+finds every known name in a question in one pass, and maps each name to the IDs of
+the description, precaution and medicine documents that carry it, so those documents
+can be fetched by key instead of hoping vector search ranks them.
+"""
+import json
+import os
+import re
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+import config
+from document_batch import DocumentBatch
+
+# Metadata keys holding entity names, in the order their documents are preferred
+ENTITY_KEYS = ("disease", "medicine_name", "composition")
+MIN_NAME_LENGTH = 3  # Shorter names match too many unrelated words
+
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+_PARENTHESES = re.compile(r"\(([^)]*)\)")
+_HAS_LETTER = re.compile(r"[a-z]")
+
+
+def normalize_text(text) -> str:
+    """Lowercase words separated by single spaces; punctuation becomes a word break"""
+    return " ".join(_NON_WORD.split(str(text).lower())).strip()
+
+
+def entity_names(key: str, value) -> List[str]:
+    """Normalized names a metadata value is matched under"""
+    if value is None or value != value or not str(value).strip():  # value != value: NaN
+        return []
+    value = str(value)
+    # Salt strengths such as "(500mg)" are not part of the name
+    names = [normalize_text(_PARENTHESES.sub(" ", value))]
+    if key == "disease":
+        # "Dimorphic hemmorhoids(piles)" is also asked about as "piles"
+        names += [normalize_text(alias) for alias in _PARENTHESES.findall(value)]
+        names.append(normalize_text(value))
+    return [name for name in dict.fromkeys(names)
+            if len(name) >= MIN_NAME_LENGTH and _HAS_LETTER.search(name)]
+
+
+class EntityMatcher:
+    """Aho-Corasick automaton over entity names, each mapped to document IDs"""
+
+    def __init__(self, entities: Dict[str, List[str]]):
+        self.entities = entities  # Normalized name -> document IDs
+        self.names = list(entities)
+        self._build()
+
+    def __len__(self):
+        return len(self.names)
+
+    def _build(self):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[List[int]] = [[]]  # Names (by index) ending at each state
+        for index, name in enumerate(self.names):
+            state = 0
+            for char in name:
+                if char not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            self.output[state].append(index)
+
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self.goto[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0) if state else 0
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    @classmethod
+    def build(cls, documents: DocumentBatch, max_docs_per_name: int = config.ENTITY_MAX_DOCS_PER_NAME) -> "EntityMatcher":
+        """Collect entity names from document metadata (diseases, medicines, salts)"""
+        entities: Dict[str, List[str]] = {}
+        for key in ENTITY_KEYS:
+            for i in range(len(documents)):
+                value = documents.extra_metadata[i].get(key)
+                for name in entity_names(key, value):
+                    doc_ids = entities.setdefault(name, [])
+                    if len(doc_ids) < max_docs_per_name and documents.ids[i] not in doc_ids:
+                        doc_ids.append(documents.ids[i])
+        return cls(entities)
+
+    def save(self, path: str = config.ENTITY_INDEX_PATH):
+        """Write names and their document IDs to <path>.json"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(f"{path}.json", 'w', encoding='utf-8') as f:
+            json.dump(self.entities, f, ensure_ascii=False)
+        print(f"Saved entity index with {len(self)} names to {path}.json")
+
+    @classmethod
+    def load(cls, path: str = config.ENTITY_INDEX_PATH) -> Optional["EntityMatcher"]:
+        """Load a saved index and build its automaton, or return None if it has not been built"""
+        if not os.path.exists(f"{path}.json"):
+            return None
+        with open(f"{path}.json", 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def find(self, text: str) -> List[Tuple[int, str]]:
+        """(position, name) of whole-word name matches, leftmost-longest and non-overlapping"""
+        text = normalize_text(text)
+        matches = []
+        state = 0
+        for end, char in enumerate(text):
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            if not self.output[state]:
+                continue
+            # Only whole words count: "ache" must not match inside "headache"
+            if end + 1 < len(text) and text[end + 1] != " ":
+                continue
+            for index in self.output[state]:
+                start = end + 1 - len(self.names[index])
+                if start == 0 or text[start - 1] == " ":
+                    matches.append((start, self.names[index]))
+
+        selected, covered = [], -1
+        for start, name in sorted(matches, key=lambda m: (m[0], -len(m[1]))):
+            if start > covered:
+                selected.append((start, name))
+                covered = start + len(name) - 1
+        return selected
+
+    def match_ids(self, text: str, limit: int = config.ENTITY_MAX_DOCUMENTS) -> List[str]:
+        """IDs of documents for the names mentioned in text.
+
+        Names take turns, in mention order, so every name gets its first
+        document before any name gets a second.
+        """
+        per_name = [self.entities[name] for _, name in self.find(text)]
+        doc_ids = []
+        for rank in range(max(map(len, per_name), default=0)):
+            doc_ids.extend(ids[rank] for ids in per_name if rank < len(ids))
+        return list(dict.fromkeys(doc_ids))[:limit]
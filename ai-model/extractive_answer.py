@@ -0,0 +1,115 @@
+"""
+Extractive answers for the Medical RAG System's degraded mode
+Builds a templated answer from retrieved documents (disease description, precautions,
+medicine facts, known interactions) without calling the generation provider, for when
+generation is overloaded, failing or behind an open circuit breaker.
+"""
+import re
+from typing import Dict, List, Optional
+
+DEGRADED_NOTICE = ("⚠️ Our AI assistant is temporarily running in limited mode, so this answer was put "
+                   "together directly from our medical reference data rather than written for your question.")
+NO_MATCH = "We could not find reference information that matches your question."
+CLOSING = "Please consult a healthcare provider for advice about your situation."
+
+MAX_DESCRIPTION_CHARS = 400
+MAX_PRECAUTIONS = 4
+MAX_MEDICINES = 2
+MAX_INTERACTIONS = 3
+MAX_FAQ_CHARS = 500
+
+
+def field(text: str, label: str) -> Optional[str]:
+    """Value of a "Label: value" line in a document"""
+    match = re.search(rf"^{re.escape(label)}:[ \t]*(.+)$", text, re.MULTILINE)
+    return match.group(1).strip() if match else None
+
+
+def shorten(text: str, limit: int) -> str:
+    """Text cut at the last sentence end before limit (or at a word, if there is none)"""
+    text = " ".join(text.split())
+    if len(text) <= limit:
+        return text
+    cut = text[:limit]
+    end = cut.rfind(". ")
+    return cut[:end + 1] if end > limit // 3 else cut.rsplit(" ", 1)[0] + "…"
+
+
+def best(docs: List[Dict], doc_type: str) -> Optional[Dict]:
+    candidates = [doc for doc in docs if doc['metadata'].get('type') == doc_type]
+    return max(candidates, key=lambda doc: doc['similarity_score'], default=None)
+
+
+def describe_disease(doc: Dict) -> str:
+    disease = doc['metadata'].get('disease') or field(doc['document'], "Disease")
+    description = doc['document'].split("Description:", 1)[-1]
+    return f"About {disease}: {shorten(description, MAX_DESCRIPTION_CHARS)}"
+
+
+def list_precautions(doc: Dict) -> str:
+    disease = doc['metadata'].get('disease') or field(doc['document'], "Disease")
+    steps = [line[1:].strip() for line in doc['document'].splitlines() if line.startswith("•")]
+    lines = [f"Precautions for {disease}:"] + [f"- {step[:1].upper()}{step[1:]}" for step in steps[:MAX_PRECAUTIONS]]
+    return "\n".join(lines)
+
+
+def summarize_medicine(doc: Dict) -> str:
+    metadata, text = doc['metadata'], doc['document']
+    name = metadata.get('medicine_name') or field(text, "Medicine")
+    facts = []
+    if metadata.get('type') == 'medicine_detailed':
+        composition = field(text, "Composition") or metadata.get('composition')
+        if composition:
+            facts.append(f"contains {composition}")
+        if field(text, "Side Effects"):
+            facts.append(f"common side effects: {field(text, 'Side Effects')}")
+        facts.append("discontinued" if metadata.get('is_discontinued') else "available")
+    else:
+        for label in ("Indication", "Dosage Form", "Strength"):
+            value = field(text, label)
+            if value:
+                facts.append(f"{label.lower()}: {value}")
+    return f"- {name}: {'; '.join(facts)}" if facts else f"- {name}"
+
+
+def build_extractive_answer(retrieved_docs: List[Dict], interactions: Optional[List[Dict]] = None) -> str:
+    """Templated answer from the best description, precaution, medicine and interaction facts"""
+    sections = []
+
+    description = best(retrieved_docs, 'disease_description')
+    if description:
+        sections.append(describe_disease(description))
+    else:
+        pattern = best(retrieved_docs, 'symptom_pattern')
+        if pattern and pattern['metadata'].get('diagnosis'):
+            sections.append(f"Our reference data links similar symptoms to {pattern['metadata']['diagnosis']}; "
+                            "only a doctor can confirm a diagnosis.")
+
+    # Prefer precautions for the disease just described
+    precautions = [doc for doc in retrieved_docs if doc['metadata'].get('type') == 'precaution']
+    if description:
+        same_disease = [doc for doc in precautions
+                        if doc['metadata'].get('disease') == description['metadata'].get('disease')]
+        precautions = same_disease or precautions
+    precaution = max(precautions, key=lambda doc: doc['similarity_score'], default=None)
+    if precaution:
+        sections.append(list_precautions(precaution))
+
+    medicines = sorted((doc for doc in retrieved_docs
+                        if doc['metadata'].get('type') in ('medicine_basic', 'medicine_detailed')),
+                       key=lambda doc: doc['similarity_score'], reverse=True)
+    if medicines:
+        sections.append("Related medicines (only take medicines a doctor or pharmacist has advised):\n"
+                        + "\n".join(summarize_medicine(doc) for doc in medicines[:MAX_MEDICINES]))
+
+    if interactions:
+        lines = [f"- {hit['source']} with {hit['target']}: {hit['effect'].lower()} interaction"
+                 for hit in interactions[:MAX_INTERACTIONS]]
+        sections.append("Known drug interactions:\n" + "\n".join(lines))
+
+    if not sections:
+        faq = best(retrieved_docs, 'faq')
+        if faq:
+            sections.append(shorten(faq['document'].split("A:", 1)[-1], MAX_FAQ_CHARS))
+
+    return "\n\n".join([DEGRADED_NOTICE] + (sections or [NO_MATCH]) + [CLOSING])
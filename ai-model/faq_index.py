@@ -0,0 +1,72 @@
+"""
+FAQ question index for the Medical RAG System
+Matches incoming questions against curated trainQ&A questions so near-duplicates
+can be answered directly, without retrieval or generation
+"""
+import json
+import os
+import numpy as np
+from typing import Dict, List, Optional
+import config
+
+
+class FAQIndex:
+    """Normalized question embeddings with their curated answers"""
+
+    def __init__(self, entries: List[Dict], embeddings: np.ndarray):
+        self.entries = entries
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        self.embeddings = (embeddings / norms).astype(np.float32)
+
+    def __len__(self):
+        return len(self.entries)
+
+    @classmethod
+    def build(cls, entries: List[Dict], encoder) -> "FAQIndex":
+        """Build from {id, question, answer, question_type} entries, one per distinct question"""
+        seen = set()
+        unique = []
+        for entry in entries:
+            key = " ".join(entry['question'].lower().split())
+            if key not in seen:
+                seen.add(key)
+                unique.append(entry)
+
+        questions = [entry['question'] for entry in unique]
+        embeddings = encoder.encode(questions) if questions else np.zeros((0, config.EMBEDDING_DIM), np.float32)
+        return cls(unique, np.asarray(embeddings, dtype=np.float32))
+
+    def save(self, path: str = config.FAQ_INDEX_PATH):
+        """Write embeddings to <path>.npz and entries to <path>.json"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez(f"{path}.npz", embeddings=self.embeddings)
+        with open(f"{path}.json", 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False)
+        print(f"Saved FAQ index with {len(self.entries)} questions to {path}.npz")
+
+    @classmethod
+    def load(cls, path: str = config.FAQ_INDEX_PATH) -> Optional["FAQIndex"]:
+        """Load a saved index, or return None if it has not been built"""
+        if not (os.path.exists(f"{path}.npz") and os.path.exists(f"{path}.json")):
+            return None
+        with np.load(f"{path}.npz") as data:
+            embeddings = data['embeddings']
+        with open(f"{path}.json", 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+        return cls(entries, embeddings)
+
+    def match(self, query_embedding, threshold: float = config.FAQ_MATCH_THRESHOLD) -> Optional[Dict]:
+        """Return the best matching entry with its cosine score if it clears threshold"""
+        if not self.entries:
+            return None
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return None
+        scores = self.embeddings @ (query / norm)
+        best = int(np.argmax(scores))
+        score = float(scores[best])
+        if score < threshold:
+            return None
+        return dict(self.entries[best], score=score)
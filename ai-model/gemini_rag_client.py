@@ -2,24 +2,49 @@
 Gemini RAG Client for Medical AI Assistant
 Integrates vector database search with Gemini API for medical consultations
 """
-import google.generativeai as genai
 from vector_db_manager import MedicalVectorDB
+from generation import (GenerationProvider, ResilientGenerator, GenerationError,
+                        CircuitOpenError, create_provider)
+from instrumentation import REGISTRY, span, collect_timings
+from faq_index import FAQIndex
+from interaction_graph import InteractionGraph
+from entity_matcher import EntityMatcher
+from extractive_answer import build_extractive_answer
 import config
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 import json
+import os
+
+DEGRADED_ANSWERS = REGISTRY.counter(
+    "medical_ai_degraded_answers_total", "Chat answers built from retrieved documents without generation, by reason")
 
 class MedicalRAGClient:
-    def __init__(self, api_key: str = None):
-        # Initialize Gemini API
-        api_key = api_key or config.GEMINI_API_KEY
-        if not api_key:
-            raise ValueError("Gemini API key not provided. Set GEMINI_API_KEY in config or .env file")
+    def __init__(self, api_key: str = None, provider: Optional[GenerationProvider] = None,
+                 vector_db: Optional[MedicalVectorDB] = None):
+        # Initialize generation provider (Gemini unless configured otherwise)
+        provider = provider or create_provider(config.GENERATION_PROVIDER, api_key)
+        self.generator = ResilientGenerator(provider)
+        
+        # Initialize vector database (shard servers when VECTOR_SHARDS is set)
+        if vector_db is None and config.VECTOR_SHARDS:
+            from sharded_retrieval import ShardedVectorDB
+            vector_db = ShardedVectorDB(config.VECTOR_SHARDS)
+        self.vector_db = vector_db or MedicalVectorDB()
+        
+        # Curated FAQ answers for near-duplicate questions
+        self.faq_index = FAQIndex.load(config.FAQ_INDEX_PATH) if config.FAQ_FAST_PATH_ENABLED else None
+        if self.faq_index is not None:
+            print(f"Loaded FAQ index with {len(self.faq_index)} questions")
         
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-1.5-flash')
+        # Drug-interaction graph for direct checks and interaction context
+        self.interaction_graph = InteractionGraph.load(config.INTERACTION_GRAPH_PATH)
+        if self.interaction_graph is not None:
+            print(f"Loaded interaction graph with {self.interaction_graph.num_interactions} interactions")
         
-        # Initialize vector database
-        self.vector_db = MedicalVectorDB()
+        # Disease, medicine and salt names whose documents are fetched by ID
+        self.entity_matcher = EntityMatcher.load(config.ENTITY_INDEX_PATH) if config.ENTITY_MATCHING_ENABLED else None
+        if self.entity_matcher is not None:
+            print(f"Loaded entity index with {len(self.entity_matcher)} names")
         
         # System prompt for medical assistant
         self.system_prompt = """You are an experienced doctor responding to a patient. Based on the medical knowledge and doctor-patient conversations provided, respond exactly like a real doctor would - with empathy, medical expertise, and practical advice.
@@ -50,14 +75,105 @@ CURRENT PATIENT QUESTION: {question}
 
 Respond exactly like the doctors in the conversation examples above would respond to this question. Use their natural, conversational style and approach."""
     
+    def swap_index(self, vector_db: MedicalVectorDB) -> MedicalVectorDB:
+        """Switch to another index version and return the previous one.
+
+        Requests already running keep the references they started with.
+        The FAQ, interaction and entity indexes shipped with the version are used if there are any.
+        """
+        if config.FAQ_FAST_PATH_ENABLED:
+            faq_index = FAQIndex.load(os.path.join(vector_db.db_path, "faq_index"))
+            if faq_index is not None:
+                self.faq_index = faq_index
+        interaction_graph = InteractionGraph.load(os.path.join(vector_db.db_path, "interaction_graph"))
+        if interaction_graph is not None:
+            self.interaction_graph = interaction_graph
+        if config.ENTITY_MATCHING_ENABLED:
+            entity_matcher = EntityMatcher.load(os.path.join(vector_db.db_path, "entity_index"))
+            if entity_matcher is not None:
+                self.entity_matcher = entity_matcher
+        previous, self.vector_db = self.vector_db, vector_db
+        return previous
+    
     def retrieve_relevant_context(self, query: str, n_results: int = config.TOP_K_RESULTS,
-                                doc_types: Optional[List[str]] = None) -> List[Dict]:
+                                doc_types: Optional[List[str]] = None,
+                                query_embedding: Optional[List[float]] = None,
+                                vector_db: Optional[MedicalVectorDB] = None,
+                                filters: Optional[Dict] = None) -> List[Dict]:
         """Retrieve relevant documents from vector database"""
-        return self.vector_db.search_similar(query, n_results, doc_types)
+        vector_db = vector_db or self.vector_db
+        with span('rag.retrieve', doc_types=",".join(doc_types or [])):
+            return vector_db.search_similar(query, n_results, doc_types, query_embedding, filters)
+    
+    def match_faq(self, query_embedding: List[float], faq_index: Optional[FAQIndex] = None) -> Optional[Dict]:
+        """Find a curated FAQ whose question is a near-duplicate of the query"""
+        faq_index = faq_index or self.faq_index
+        if faq_index is None:
+            return None
+        with span('rag.faq_match'):
+            return faq_index.match(query_embedding, config.FAQ_MATCH_THRESHOLD)
+    
+    def match_entities(self, questions: List[str], vector_db: Optional[MedicalVectorDB] = None,
+                       entity_matcher: Optional[EntityMatcher] = None) -> List[List[Dict]]:
+        """Documents for the disease, medicine and salt names each question mentions, fetched by ID"""
+        vector_db = vector_db or self.vector_db
+        entity_matcher = entity_matcher or self.entity_matcher
+        if entity_matcher is None:
+            return [[] for _ in questions]
+        with span('rag.entity_match', questions=len(questions)):
+            matched_ids = [entity_matcher.match_ids(question) for question in questions]
+            wanted = list(dict.fromkeys(doc_id for doc_ids in matched_ids for doc_id in doc_ids))
+            found = {doc['id']: doc for doc in vector_db.get_documents_by_ids(wanted)}
+        return [[dict(found[doc_id], similarity_score=1.0, matched_by='entity')
+                 for doc_id in doc_ids if doc_id in found] for doc_ids in matched_ids]
+    
+    @staticmethod
+    def place_entity_documents(slots: List[Tuple[int, List[str], Optional[Dict]]],
+                               entity_docs: List[Dict]) -> Tuple[List[Dict], List[List[Dict]]]:
+        """Give matched documents the first places of the slot for their type.
+
+        Returns the documents no slot has room or a type for (they are kept as
+        extra context) and each slot's placed documents. A discontinued medicine
+        is dropped when its slot wants available medicines only.
+        """
+        unplaced, placed = [], [[] for _ in slots]
+        for doc in entity_docs:
+            doc_type = doc['metadata'].get('type')
+            position = next((p for p, (_, doc_types, _) in enumerate(slots) if doc_type in doc_types), None)
+            if position is None or len(placed[position]) >= slots[position][0]:
+                unplaced.append(doc)
+            elif not ((slots[position][2] or {}).get('available_only') and doc['metadata'].get('is_discontinued')):
+                placed[position].append(doc)
+        return unplaced, placed
+    
+    @staticmethod
+    def fill_slot(placed: List[Dict], results: List[Dict], n_results: int) -> List[Dict]:
+        """A slot's placed documents followed by search results not already among them"""
+        placed_ids = {doc['id'] for doc in placed}
+        return placed + [doc for doc in results if doc['id'] not in placed_ids][:n_results - len(placed)]
+    
+    def find_interactions(self, user_question: str, graph: Optional[InteractionGraph] = None) -> List[Dict]:
+        """Interaction graph hits for the medicines a question mentions.
+
+        Interactions between mentioned medicines come first; questions about
+        interactions also get each medicine's recorded interactions.
+        """
+        if graph is None:
+            graph = self.interaction_graph
+        if graph is None:
+            return []
+        with span('rag.interactions'):
+            mentioned = graph.mentions(user_question)
+            hits = graph.check(mentioned)['interactions'] if len(mentioned) > 1 else []
+            interaction_keywords = ['interact', 'together', 'combine', 'mix', 'along with', 'safe to take']
+            if any(keyword in user_question.lower() for keyword in interaction_keywords):
+                for name in mentioned:
+                    hits += graph.interactions_of(name, config.INTERACTION_CONTEXT_LIMIT)
+            return hits[:config.INTERACTION_CONTEXT_LIMIT]
     
-    def format_context(self, retrieved_docs: List[Dict]) -> str:
-        """Format retrieved documents into context string"""
-        if not retrieved_docs:
+    def format_context(self, retrieved_docs: List[Dict], interactions: Optional[List[Dict]] = None) -> str:
+        """Format retrieved documents (and interaction graph hits) into context string"""
+        if not retrieved_docs and not interactions:
             return "No relevant information found in the knowledge base."
 
         context_parts = []
@@ -94,49 +210,182 @@ Respond exactly like the doctors in the conversation examples above would respon
             context_parts.append("\n=== ADDITIONAL MEDICAL INFORMATION ===")
             context_parts.extend(medical_info)
 
+        if interactions:
+            context_parts.append("\n=== KNOWN DRUG INTERACTIONS ===")
+            lines = []
+            for hit in interactions:
+                if 'a' in hit:
+                    lines.append(f"- {hit['a']} + {hit['b']}: {hit['effect']} "
+                                 f"({hit['source']} interacts with {hit['target']})")
+                else:
+                    lines.append(f"- {hit['source']} interacts with {hit['target']}: {hit['effect']}")
+            context_parts.append("\n".join(lines))
+
         return "\n\n".join(context_parts)
     
     def generate_response(self, question: str, context: str) -> str:
-        """Generate response using Gemini API"""
-        try:
-            prompt = self.system_prompt.format(context=context, question=question)
-            
-            response = self.model.generate_content(prompt)
-            return response.text
-            
-        except Exception as e:
-            return f"Error generating response: {e}"
-    
-    def chat(self, user_question: str, doc_types: Optional[List[str]] = None,
-             n_results: int = config.TOP_K_RESULTS) -> Dict:
-        """Main chat function that combines retrieval and generation"""
-
-        # Step 1: Retrieve relevant context with smart prioritization
-        print(f"Searching for relevant information...")
+        """Generate response using the configured provider.
 
+        Raises GenerationError on timeout, provider failure or an open breaker.
+        """
+        prompt = self.system_prompt.format(context=context, question=question)
+        with span('rag.generate'):
+            return self.generator.generate(prompt)
+    
+    def retrieval_slots(self, user_question: str) -> List[Tuple[int, List[str], Optional[Dict]]]:
+        """Searches (n_results, doc_types, filters) that build a question's context, in context order"""
         # Check if question is about medicine/treatment/relief
         medicine_keywords = ['medicine', 'medication', 'drug', 'treatment', 'relief', 'cure', 'tablet', 'syrup', 'prescription', 'dosage']
         is_medicine_query = any(keyword in user_question.lower() for keyword in medicine_keywords)
 
         # ALWAYS prioritize doctor-patient conversation examples for natural communication
-        dialogue_docs = self.retrieve_relevant_context(user_question, 3, ['dialogue'])
+        slots = [(3, ['dialogue'], None)]
 
         if is_medicine_query:
             # For medicine queries: dialogue examples + medicine info + other medical info
-            medicine_docs = self.retrieve_relevant_context(user_question, 3, ['medicine_basic', 'medicine_detailed'])
-            other_docs = self.retrieve_relevant_context(user_question, 2, ['faq', 'symptom_pattern', 'precaution'])
-            retrieved_docs = dialogue_docs + medicine_docs + other_docs
+            # Discontinued medicines should not take the medicine slots
+            slots.append((3, ['medicine_basic', 'medicine_detailed'], {'available_only': True}))
+            slots.append((2, ['faq', 'symptom_pattern', 'precaution'], None))
         else:
             # For general queries: dialogue examples + relevant medical information
-            other_docs = self.retrieve_relevant_context(user_question, 4, ['faq', 'symptom_pattern', 'precaution', 'disease_description'])
-            retrieved_docs = dialogue_docs + other_docs
+            slots.append((4, ['faq', 'symptom_pattern', 'precaution', 'disease_description'], None))
+        return slots
+
+    def retrieve_batch(self, questions: List[str]) -> List[Dict]:
+        """Retrieval for many chat questions at once, to pass to chat(..., retrieved=...).
+
+        Questions are encoded in one call, and questions that share a retrieval
+        slot are searched together with search_similar_batch.
+        """
+        vector_db, faq_index, entity_matcher = self.vector_db, self.faq_index, self.entity_matcher
+        with span('rag.retrieve_batch', questions=len(questions)):
+            embeddings = vector_db.encode_query(questions)
+            retrieved = [{
+                'faq_match': self.match_faq(embedding, faq_index),
+                'retrieved_documents': []
+            } for embedding in embeddings]
+
+            pending = [i for i in range(len(questions)) if not retrieved[i]['faq_match']]
+            entity_docs = self.match_entities([questions[i] for i in pending], vector_db, entity_matcher)
 
-        # Step 2: Format context
-        context = self.format_context(retrieved_docs)
+            # Group pending searches by slot, keeping each question's slot order
+            groups = {}
+            plans = {}
+            for i, question_entities in zip(pending, entity_docs):
+                slots = self.retrieval_slots(questions[i])
+                unplaced, placed = self.place_entity_documents(slots, question_entities)
+                plans[i] = (slots, unplaced, placed)
+                for position, (n, doc_types, filters) in enumerate(slots):
+                    if len(placed[position]) >= n:
+                        continue  # Filled by matched documents
+                    key = (n, tuple(doc_types), json.dumps(filters, sort_keys=True))
+                    groups.setdefault(key, []).append((i, position))
+
+            parts = {i: {} for i in pending}
+            for (n, doc_types, filters_json), members in groups.items():
+                results = vector_db.search_similar_batch(
+                    [questions[i] for i, _ in members], n, list(doc_types),
+                    [embeddings[i] for i, _ in members], json.loads(filters_json))
+                for (i, position), docs in zip(members, results):
+                    parts[i][position] = docs
+            for i, (slots, unplaced, placed) in plans.items():
+                retrieved[i]['retrieved_documents'].extend(unplaced)
+                for position, (n, _, _) in enumerate(slots):
+                    retrieved[i]['retrieved_documents'].extend(
+                        self.fill_slot(placed[position], parts[i].get(position, []), n))
+        return retrieved
+
+    def chat(self, user_question: str, doc_types: Optional[List[str]] = None,
+             n_results: int = config.TOP_K_RESULTS, retrieved: Optional[Dict] = None,
+             degraded_reason: Optional[str] = None, degrade_on_failure: bool = False,
+             faq_question: Optional[str] = None) -> Dict:
+        """Main chat function that combines retrieval and generation.
+
+        retrieved is this question's entry from retrieve_batch, which skips retrieval here.
+        faq_question is matched against curated FAQs instead of user_question, when the
+        latter is a retrieval query built from more than the question asked.
+        With degraded_reason (e.g. "requested", "overloaded") the answer is built from the
+        retrieved documents without generation. With degrade_on_failure, generation
+        failures degrade the same way instead of raising GenerationError.
+        """
+        with collect_timings() as trace, span('rag.chat'):
+            result = self._chat(user_question, doc_types, n_results, retrieved, degraded_reason,
+                                degrade_on_failure, faq_question)
+        result['timings'] = trace.spans
+        return result
+
+    def _chat(self, user_question: str, doc_types: Optional[List[str]] = None,
+              n_results: int = config.TOP_K_RESULTS, retrieved: Optional[Dict] = None,
+              degraded_reason: Optional[str] = None, degrade_on_failure: bool = False,
+              faq_question: Optional[str] = None) -> Dict:
+        # Interactions come from the graph loaded when the request started, even after a hot-swap
+        interaction_graph = self.interaction_graph
+
+        if retrieved is not None:
+            faq_match = retrieved['faq_match']
+        else:
+            # Pin the index version so a hot-swap mid-request does not mix versions
+            vector_db, faq_index, entity_matcher = self.vector_db, self.faq_index, self.entity_matcher
+
+            # Encode once; the embedding is shared by the FAQ check and every search below
+            query_embedding = vector_db.encode_query([user_question])[0]
+
+            # Step 0: Answer near-duplicates of curated FAQ questions directly
+            faq_embedding = query_embedding
+            if faq_index is not None and faq_question not in (None, user_question):
+                faq_embedding = vector_db.encode_query([faq_question])[0]
+            faq_match = self.match_faq(faq_embedding, faq_index)
+        if faq_match:
+            print(f"Answered from FAQ {faq_match['id']} (similarity {faq_match['score']:.3f})")
+            return {
+                'question': user_question,
+                'response': faq_match['answer'],
+                'retrieved_documents': [],
+                'context_used': '',
+                'num_sources': 1,
+                'answer_source': 'faq',
+                'faq_match': {
+                    'id': faq_match['id'],
+                    'question': faq_match['question'],
+                    'similarity_score': faq_match['score']
+                }
+            }
+
+        # Step 1: Retrieve relevant context with smart prioritization
+        if retrieved is not None:
+            retrieved_docs = retrieved['retrieved_documents']
+        else:
+            print(f"Searching for relevant information...")
+            # Documents for named diseases and medicines take the first places; search fills the rest
+            slots = self.retrieval_slots(user_question)
+            entity_docs = self.match_entities([user_question], vector_db, entity_matcher)[0]
+            retrieved_docs, placed = self.place_entity_documents(slots, entity_docs)
+            for (slot_results, slot_types, slot_filters), slot_placed in zip(slots, placed):
+                results = []
+                if len(slot_placed) < slot_results:
+                    results = self.retrieve_relevant_context(user_question, slot_results, slot_types,
+                                                             query_embedding, vector_db, slot_filters)
+                retrieved_docs += self.fill_slot(slot_placed, results, slot_results)
+
+        # Step 2: Format context, with interactions between the medicines mentioned
+        interactions = self.find_interactions(user_question, interaction_graph)
+        with span('rag.format_context'):
+            context = self.format_context(retrieved_docs, interactions)
 
         # Step 3: Generate response
-        print(f"Generating response...")
-        response = self.generate_response(user_question, context)
+        if degraded_reason is None:
+            print(f"Generating response...")
+            try:
+                response = self.generate_response(user_question, context)
+            except GenerationError as e:
+                if not degrade_on_failure:
+                    raise
+                degraded_reason = 'circuit_open' if isinstance(e, CircuitOpenError) else 'generation_failed'
+                print(f"Generation unavailable ({e}); answering from retrieved documents")
+        if degraded_reason is not None:
+            with span('rag.extractive_answer'):
+                response = build_extractive_answer(retrieved_docs, interactions)
+            DEGRADED_ANSWERS.inc(reason=degraded_reason)
         
         # Return complete result
         return {
@@ -144,11 +393,16 @@ Respond exactly like the doctors in the conversation examples above would respon
             'response': response,
             'retrieved_documents': retrieved_docs,
             'context_used': context,
-            'num_sources': len(retrieved_docs)
+            'num_sources': len(retrieved_docs),
+            'interactions': interactions,
+            'answer_source': 'extractive' if degraded_reason else 'generated',
+            'degraded': degraded_reason is not None,
+            'degraded_reason': degraded_reason
         }
     
     def chat_with_history(self, conversation_history: List[Dict], 
-                         current_question: str) -> Dict:
+                         current_question: str, degraded_reason: Optional[str] = None,
+                         degrade_on_failure: bool = False) -> Dict:
         """Chat with conversation history for context"""
         
         # Combine current question with recent history for better retrieval
@@ -160,22 +414,33 @@ Respond exactly like the doctors in the conversation examples above would respon
                 for msg in recent_messages
             ])
         
-        # Enhanced query for retrieval
+        # Enhanced query for retrieval; only the question itself may match an FAQ
         enhanced_query = f"{history_context} {current_question}".strip()
         
-        return self.chat(enhanced_query)
+        return self.chat(enhanced_query, degraded_reason=degraded_reason, degrade_on_failure=degrade_on_failure,
+                         faq_question=current_question)
+    
+    @staticmethod
+    def advice_query(symptoms: str, additional_info: str = "") -> str:
+        """Chat question that get_medical_advice asks for a set of symptoms"""
+        query = f"symptoms: {symptoms}"
+        if additional_info:
+            query += f" additional information: {additional_info}"
+        return query
     
-    def get_medical_advice(self, symptoms: str, additional_info: str = "") -> Dict:
+    def get_medical_advice(self, symptoms: str, additional_info: str = "",
+                           retrieved: Optional[Dict] = None, degraded_reason: Optional[str] = None) -> Dict:
         """Specialized function for symptom-based queries"""
         
         # Focus on symptom-related document types
         relevant_types = ['symptom_pattern', 'disease_description', 'precaution', 'faq']
         
-        query = f"symptoms: {symptoms}"
-        if additional_info:
-            query += f" additional information: {additional_info}"
+        query = self.advice_query(symptoms, additional_info)
         
-        result = self.chat(query, doc_types=relevant_types, n_results=7)
+        with collect_timings() as trace, span('rag.medical_advice'):
+            result = self.chat(query, doc_types=relevant_types, n_results=7, retrieved=retrieved,
+                               degraded_reason=degraded_reason)
+        result['timings'] = trace.spans
         
         # Add medical disclaimer
         disclaimer = "\n\n⚠️ MEDICAL DISCLAIMER: This information is for educational purposes only and should not replace professional medical advice. Please consult with a healthcare provider for proper diagnosis and treatment."
@@ -183,10 +448,12 @@ Respond exactly like the doctors in the conversation examples above would respon
         result['response'] += disclaimer
         return result
     
-    def search_knowledge_base(self, query: str, doc_type: str = None) -> List[Dict]:
+    def search_knowledge_base(self, query: str, doc_type: str = None,
+                              n_results: int = config.SEARCH_DEFAULT_LIMIT,
+                              filters: Optional[Dict] = None) -> List[Dict]:
         """Search the knowledge base directly without generating a response"""
         doc_types = [doc_type] if doc_type else None
-        return self.retrieve_relevant_context(query, n_results=10, doc_types=doc_types)
+        return self.retrieve_relevant_context(query, n_results=n_results, doc_types=doc_types, filters=filters)
 
 def interactive_medical_chat():
     """Interactive chat interface for testing"""
@@ -233,11 +500,15 @@ Available commands:
                     print(f"   {doc['document'][:150]}...")
                 continue
             
-            if user_input.lower().startswith('symptoms:'):
-                symptoms = user_input[9:].strip()
-                result = rag_client.get_medical_advice(symptoms)
-            else:
-                result = rag_client.chat_with_history(conversation_history, user_input)
+            try:
+                if user_input.lower().startswith('symptoms:'):
+                    symptoms = user_input[9:].strip()
+                    result = rag_client.get_medical_advice(symptoms)
+                else:
+                    result = rag_client.chat_with_history(conversation_history, user_input)
+            except GenerationError as e:
+                print(f"\n⚠️ Could not generate a response: {e}")
+                continue
             
             print(f"\n🤖 Medical Assistant:")
             print(result['response'])
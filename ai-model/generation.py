@@ -0,0 +1,326 @@
+"""
+Generation layer for the Medical RAG System
+Wraps LLM providers with per-call deadlines, optional hedged requests and a circuit breaker
+"""
+import hashlib
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Optional
+import config
+
+
+class GenerationError(Exception):
+    """Raised when no response could be generated"""
+
+
+class GenerationTimeout(GenerationError):
+    """Raised when generation did not finish within its deadline"""
+
+
+class CircuitOpenError(GenerationError):
+    """Raised without calling the provider while the circuit breaker is open"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Generation circuit breaker is open, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class GenerationProvider:
+    """Interface for text generation backends"""
+    name = "base"
+
+    def generate(self, prompt: str, timeout: float) -> str:
+        """Generate a completion for prompt, giving up after timeout seconds"""
+        raise NotImplementedError
+
+
+class GeminiProvider(GenerationProvider):
+    """Google Gemini backend"""
+    name = "gemini"
+
+    def __init__(self, api_key: str = None, model_name: str = config.GEMINI_MODEL):
+        api_key = api_key or config.GEMINI_API_KEY
+        if not api_key:
+            raise ValueError("Gemini API key not provided. Set GEMINI_API_KEY in config or .env file")
+
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        self.model = genai.GenerativeModel(model_name)
+        self.model_name = model_name
+
+    def generate(self, prompt: str, timeout: float) -> str:
+        response = self.model.generate_content(prompt, request_options={'timeout': timeout})
+        return response.text
+
+
+class FakeProvider(GenerationProvider):
+    """Deterministic local stand-in for load tests and offline runs.
+
+    The response text and latency depend only on the prompt, so repeated runs
+    are reproducible. Failures are drawn from a seeded generator.
+    """
+    name = "fake"
+
+    def __init__(self, latency_ms: float = config.FAKE_GENERATION_LATENCY_MS,
+                 jitter_ms: float = config.FAKE_GENERATION_JITTER_MS,
+                 failure_rate: float = config.FAKE_GENERATION_FAILURE_RATE,
+                 seed: int = 0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def generate(self, prompt: str, timeout: float) -> str:
+        digest = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+        jitter = (int(digest[:8], 16) / 0xFFFFFFFF) * self.jitter_ms if self.jitter_ms else 0.0
+        delay = (self.latency_ms + jitter) / 1000.0
+
+        with self._lock:
+            fail = self._random.random() < self.failure_rate
+
+        time.sleep(min(delay, timeout))
+        if delay > timeout:
+            raise TimeoutError(f"Fake generation exceeded {timeout:.2f}s")
+        if fail:
+            raise RuntimeError("Fake generation failure")
+
+        question = prompt.rsplit("CURRENT PATIENT QUESTION:", 1)[-1].strip().split("\n", 1)[0]
+        return (f"[fake response {digest[:12]}] Based on the medical information provided, "
+                f"here is general guidance regarding: {question[:200]}")
+
+
+def create_provider(name: str = config.GENERATION_PROVIDER, api_key: str = None) -> GenerationProvider:
+    """Create a generation provider by name"""
+    if name == "gemini":
+        return GeminiProvider(api_key=api_key)
+    if name == "fake":
+        return FakeProvider()
+    raise ValueError(f"Unknown generation provider '{name}'. Use 'gemini' or 'fake'")
+
+
+class LatencyTracker:
+    """Sliding window of recent successful call latencies"""
+
+    def __init__(self, window_size: int = 200):
+        self._samples = deque(maxlen=window_size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        """Return the pct-th percentile, or None when there are no samples"""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(round(pct / 100.0 * (len(samples) - 1))))
+        return samples[index]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._samples)
+
+
+class CircuitBreaker:
+    """Failure-rate circuit breaker over a sliding window of calls.
+
+    Closed: calls pass and outcomes are recorded. Open: calls fail fast until
+    open_seconds have elapsed. Half-open: a single trial call decides whether
+    to close again or re-open.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, window_size: int = config.BREAKER_WINDOW_SIZE,
+                 failure_rate: float = config.BREAKER_FAILURE_RATE,
+                 min_calls: int = config.BREAKER_MIN_CALLS,
+                 open_seconds: float = config.BREAKER_OPEN_SECONDS):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self._outcomes = deque(maxlen=window_size)
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._times_opened = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._state = self.HALF_OPEN
+            self._trial_in_flight = False
+        return self._state
+
+    def retry_after(self) -> float:
+        """Seconds until the breaker will allow a trial call"""
+        with self._lock:
+            if self._current_state() != self.OPEN:
+                return 0.0
+            return max(0.0, self.open_seconds - (time.monotonic() - self._opened_at))
+
+    def allow(self) -> bool:
+        """Check whether a call may proceed"""
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._state = self.CLOSED
+                self._outcomes.clear()
+            self._outcomes.append(True)
+
+    def record_failure(self):
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._open()
+                return
+            self._outcomes.append(False)
+            failures = self._outcomes.count(False)
+            if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.failure_rate:
+                self._open()
+
+    def _open(self):
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._trial_in_flight = False
+        self._times_opened += 1
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            state = self._current_state()
+            calls = len(self._outcomes)
+            failures = self._outcomes.count(False)
+            return {
+                'state': state,
+                'window_calls': calls,
+                'window_failure_rate': failures / calls if calls else 0.0,
+                'times_opened': self._times_opened
+            }
+
+
+class ResilientGenerator:
+    """Deadline-bounded, optionally hedged generation behind a circuit breaker"""
+
+    def __init__(self, provider: GenerationProvider,
+                 deadline_seconds: float = config.GENERATION_DEADLINE_SECONDS,
+                 hedge_enabled: bool = config.GENERATION_HEDGE_ENABLED,
+                 hedge_percentile: float = config.GENERATION_HEDGE_PERCENTILE,
+                 hedge_min_samples: int = config.GENERATION_HEDGE_MIN_SAMPLES,
+                 breaker: Optional[CircuitBreaker] = None,
+                 max_workers: int = config.GENERATION_MAX_WORKERS):
+        self.provider = provider
+        self.deadline_seconds = deadline_seconds
+        self.hedge_enabled = hedge_enabled
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.breaker = breaker or CircuitBreaker()
+        self.latency = LatencyTracker()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="generation")
+        self._stats = {'calls': 0, 'successes': 0, 'failures': 0, 'timeouts': 0,
+                       'rejected': 0, 'hedges': 0, 'hedge_wins': 0}
+        self._lock = threading.Lock()
+
+    def _count(self, key: str):
+        with self._lock:
+            self._stats[key] += 1
+
+    def _hedge_delay(self) -> Optional[float]:
+        if not self.hedge_enabled or len(self.latency) < self.hedge_min_samples:
+            return None
+        return self.latency.percentile(self.hedge_percentile)
+
+    def generate(self, prompt: str, deadline_seconds: float = None) -> str:
+        """Generate a response or raise GenerationError"""
+        self._count('calls')
+        if not self.breaker.allow():
+            self._count('rejected')
+            raise CircuitOpenError(self.breaker.retry_after())
+
+        deadline = deadline_seconds or self.deadline_seconds
+        start = time.monotonic()
+        expires = start + deadline
+
+        futures = {self._executor.submit(self.provider.generate, prompt, deadline): 'primary'}
+        hedge_delay = self._hedge_delay()
+        last_error = None
+
+        while futures:
+            now = time.monotonic()
+            remaining = expires - now
+            if remaining <= 0:
+                break
+
+            wait_for = remaining
+            hedge_pending = hedge_delay is not None and len(futures) == 1 and 'hedge' not in futures.values()
+            if hedge_pending:
+                wait_for = min(remaining, max(0.0, start + hedge_delay - now))
+
+            done, _ = wait(list(futures), timeout=wait_for, return_when=FIRST_COMPLETED)
+
+            if not done:
+                if hedge_pending and time.monotonic() >= start + hedge_delay:
+                    self._count('hedges')
+                    futures[self._executor.submit(self.provider.generate, prompt, expires - time.monotonic())] = 'hedge'
+                    hedge_delay = None
+                continue
+
+            for future in done:
+                role = futures.pop(future)
+                try:
+                    text = future.result()
+                except Exception as e:
+                    last_error = e
+                    continue
+
+                elapsed = time.monotonic() - start
+                self.latency.record(elapsed)
+                self.breaker.record_success()
+                self._count('successes')
+                if role == 'hedge':
+                    self._count('hedge_wins')
+                return text
+
+            if not futures and hedge_delay is not None and time.monotonic() < expires:
+                # Primary failed before the hedge fired; use the hedge as a retry
+                self._count('hedges')
+                futures[self._executor.submit(self.provider.generate, prompt, expires - time.monotonic())] = 'hedge'
+                hedge_delay = None
+
+        self.breaker.record_failure()
+        if futures or last_error is None:
+            self._count('timeouts')
+            raise GenerationTimeout(f"Generation did not finish within {deadline:.1f}s")
+
+        self._count('failures')
+        raise GenerationError(f"Error generating response: {last_error}") from last_error
+
+    def get_stats(self) -> Dict:
+        """Get call counters, latency percentiles and breaker state"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['provider'] = self.provider.name
+        stats['deadline_seconds'] = self.deadline_seconds
+        stats['latency_p50'] = self.latency.percentile(50)
+        stats['latency_p95'] = self.latency.percentile(95)
+        stats['latency_p99'] = self.latency.percentile(99)
+        stats['breaker'] = self.breaker.get_stats()
+        return stats
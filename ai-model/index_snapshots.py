@@ -0,0 +1,262 @@
+"""
+Versioned index snapshots for the Medical RAG System
+Ingestion writes each knowledge base build to its own immutable directory and publishes it
+by atomically replacing a CURRENT pointer; the service loads, warms and hot-swaps it
+"""
+import contextlib
+import fcntl
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Set
+import config
+
+CURRENT_FILE = "CURRENT"
+IN_USE_DIR = ".in-use"  # One file per serving process listing the versions it holds
+GC_LOCK_FILE = ".gc.lock"  # Held while marking a version in use or deleting versions
+
+
+def create_version(root: str = config.INDEX_SNAPSHOT_ROOT) -> str:
+    """Create an empty version directory and return its path"""
+    version = datetime.now().strftime("v%Y%m%d-%H%M%S-%f")
+    path = os.path.join(root, version)
+    os.makedirs(path)
+    return path
+
+
+def publish_version(path: str):
+    """Point CURRENT at a finished version directory (atomic rename)"""
+    root, version = os.path.split(os.path.abspath(path))
+    tmp_file = os.path.join(root, f".{CURRENT_FILE}.{os.getpid()}")
+    with open(tmp_file, 'w') as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, os.path.join(root, CURRENT_FILE))
+    print(f"Published index version {version}")
+
+
+def copy_faq_index(path: str, faq_index_path: str = config.FAQ_INDEX_PATH):
+    """Ship the FAQ index with the version it was built alongside"""
+    for suffix in (".npz", ".json"):
+        if os.path.exists(faq_index_path + suffix):
+            shutil.copy2(faq_index_path + suffix, os.path.join(path, "faq_index" + suffix))
+
+
+def copy_interaction_graph(path: str, graph_path: str = config.INTERACTION_GRAPH_PATH):
+    """Ship the drug-interaction graph with the version it was built alongside"""
+    if os.path.exists(graph_path + ".npz"):
+        shutil.copy2(graph_path + ".npz", os.path.join(path, "interaction_graph.npz"))
+
+
+def copy_entity_index(path: str, entity_index_path: str = config.ENTITY_INDEX_PATH):
+    """Ship the entity name index with the version it was built alongside"""
+    if os.path.exists(entity_index_path + ".json"):
+        shutil.copy2(entity_index_path + ".json", os.path.join(path, "entity_index.json"))
+
+
+def copy_dedup_members(path: str, members_path: str = config.DEDUP_MEMBERS_PATH):
+    """Ship the documents compaction removed with the version they were removed from"""
+    if os.path.exists(members_path + ".json"):
+        shutil.copy2(members_path + ".json", os.path.join(path, "dedup_members.json"))
+
+
+def current_version(root: str = config.INDEX_SNAPSHOT_ROOT) -> Optional[str]:
+    """Name of the published version, or None if nothing has been published"""
+    try:
+        with open(os.path.join(root, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def list_versions(root: str = config.INDEX_SNAPSHOT_ROOT) -> List[str]:
+    if not os.path.isdir(root):
+        return []
+    return sorted(name for name in os.listdir(root)
+                  if name.startswith("v") and os.path.isdir(os.path.join(root, name)))
+
+
+@contextlib.contextmanager
+def gc_lock(root: str):
+    """Exclusive lock that orders version deletion against processes marking versions in use"""
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, GC_LOCK_FILE), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        yield  # Closing the file releases the lock
+
+
+def mark_in_use(root: str, versions: Set[str]):
+    """Record the versions this process holds (replaces its previous record)"""
+    directory = os.path.join(root, IN_USE_DIR)
+    os.makedirs(directory, exist_ok=True)
+    tmp_file = os.path.join(directory, f".{os.getpid()}.tmp")
+    with open(tmp_file, 'w') as f:
+        json.dump(sorted(v for v in versions if v), f)
+    os.replace(tmp_file, os.path.join(directory, str(os.getpid())))
+
+
+def pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def versions_in_use(root: str) -> Set[str]:
+    """Versions held by live processes; records of exited processes are removed"""
+    directory = os.path.join(root, IN_USE_DIR)
+    in_use = set()
+    for name in os.listdir(directory) if os.path.isdir(directory) else []:
+        if not name.isdigit():
+            continue
+        path = os.path.join(directory, name)
+        if not pid_alive(int(name)):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+            continue
+        try:
+            with open(path) as f:
+                in_use.update(json.load(f))
+        except (FileNotFoundError, ValueError):
+            continue
+    return in_use
+
+
+class SnapshotManager:
+    """Watches the snapshot root and hot-swaps the client's index when CURRENT changes.
+
+    A new version is loaded and warmed with probe queries in the background,
+    then swapped in with a single reference assignment. Requests that already
+    hold the old index finish on it, and the process keeps it for the grace period.
+
+    Every process (each prefork worker, and the master that forks them) records
+    the versions it holds under <root>/.in-use, and a version directory is only
+    deleted once no live process holds it.
+    """
+
+    def __init__(self, rag_client, root: str = config.INDEX_SNAPSHOT_ROOT,
+                 poll_seconds: float = config.INDEX_SNAPSHOT_POLL_SECONDS,
+                 grace_seconds: float = config.INDEX_SNAPSHOT_GRACE_SECONDS,
+                 probe_queries: List[str] = None):
+        self.rag_client = rag_client
+        self.root = root
+        self.poll_seconds = poll_seconds
+        self.grace_seconds = grace_seconds
+        self.probe_queries = probe_queries or config.INDEX_WARMUP_QUERIES
+        self.active_version = None
+        self.loaded_at = None
+        self.swaps = 0
+        self.last_error = None
+        self._retired = []  # (version, vector_db, retired_at)
+        self._loading = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def open_version(self, version: str):
+        """Open and warm a version without making it active"""
+        from vector_db_manager import MedicalVectorDB
+        vector_db = MedicalVectorDB(db_path=os.path.join(self.root, version),
+                                    encoder=self.rag_client.vector_db.encoder, server="")
+        if vector_db.collection.count() == 0:
+            vector_db.close()
+            raise RuntimeError("index version has no documents")
+        for query in self.probe_queries:
+            vector_db.search_similar(query, 3)
+        return vector_db
+
+    def _held_versions(self) -> Set[str]:
+        with self._lock:
+            return {self.active_version, self._loading} | {r[0] for r in self._retired}
+
+    def activate(self, version: str):
+        """Load, warm and swap in a version"""
+        start = time.perf_counter()
+        # Mark the version in use before opening it, so no other process deletes it meanwhile
+        with gc_lock(self.root):
+            if not os.path.isdir(os.path.join(self.root, version)):
+                raise RuntimeError("index version directory was removed")
+            self._loading = version
+            mark_in_use(self.root, self._held_versions())
+        try:
+            vector_db = self.open_version(version)
+            with self._lock:
+                previous_version = self.active_version
+                previous_db = self.rag_client.swap_index(vector_db)
+                self.active_version = version
+                self.loaded_at = datetime.now().isoformat()
+                self.swaps += 1
+                if previous_version is not None:
+                    self._retired.append((previous_version, previous_db, time.monotonic()))
+        finally:
+            self._loading = None
+        print(f"Activated index version {version} in {time.perf_counter() - start:.1f}s")
+
+    def check(self):
+        """Activate the published version if it changed, then collect old versions"""
+        version = current_version(self.root)
+        if version and version != self.active_version:
+            try:
+                self.activate(version)
+                self.last_error = None
+            except Exception as e:
+                self.last_error = f"{version}: {e}"
+                print(f"Failed to activate index version {version}: {e}")
+        self.collect_garbage()
+
+    def collect_garbage(self):
+        """Release retired versions whose grace period has expired, then delete
+        versions older than the published one that no live process holds"""
+        now = time.monotonic()
+        with self._lock:
+            expired = [r for r in self._retired if now - r[2] >= self.grace_seconds]
+            self._retired = [r for r in self._retired if now - r[2] < self.grace_seconds]
+        for version, vector_db, _ in expired:
+            vector_db.close()
+
+        published = current_version(self.root)
+        with gc_lock(self.root):
+            mark_in_use(self.root, self._held_versions())
+            if published is None:
+                return
+            in_use = versions_in_use(self.root)
+            # Newer unpublished versions may still be being built
+            for version in list_versions(self.root):
+                if version < published and version not in in_use:
+                    print(f"Removing index version {version}")
+                    shutil.rmtree(os.path.join(self.root, version), ignore_errors=True)
+
+    def start(self):
+        """Activate the current version now and watch for new ones in the background"""
+        self.check()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="index-snapshots")
+        self._thread.start()
+
+    def stop(self):
+        """Stop watching; waits for a swap in progress to finish"""
+        self._stop.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.poll_seconds):
+            self.check()
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                'active_version': self.active_version,
+                'published_version': current_version(self.root),
+                'loaded_at': self.loaded_at,
+                'swaps': self.swaps,
+                'retired_versions': [r[0] for r in self._retired],
+                'last_error': self.last_error
+            }
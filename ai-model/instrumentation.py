@@ -0,0 +1,235 @@
+"""
+Latency instrumentation for the Medical RAG System
+Span-style stage timing, per-request timing traces and Prometheus text exposition
+"""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels:
+        escaped = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{key}="{escaped}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def _labels_key(labels: Dict[str, str]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Summary:
+    """Latency summary with sliding-window quantiles plus running sum and count"""
+    type_name = "summary"
+
+    def __init__(self, name: str, help_text: str, window_size: int = 1024):
+        self.name = name
+        self.help_text = help_text
+        self.window_size = window_size
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _labels_key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {'samples': deque(maxlen=self.window_size),
+                                              'sum': 0.0, 'count': 0}
+            series['samples'].append(value)
+            series['sum'] += value
+            series['count'] += 1
+
+    def snapshot(self) -> Dict:
+        """Quantiles, sum and count per label set"""
+        with self._lock:
+            items = [(key, sorted(s['samples']), s['sum'], s['count']) for key, s in self._series.items()]
+        result = {}
+        for key, samples, total, count in items:
+            quantiles = {}
+            for q in QUANTILES:
+                quantiles[q] = samples[min(len(samples) - 1, int(q * len(samples)))] if samples else 0.0
+            result[key] = {'quantiles': quantiles, 'sum': total, 'count': count}
+        return result
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} summary"]
+        for key, data in sorted(self.snapshot().items()):
+            for q, value in data['quantiles'].items():
+                labels = _format_labels(key + (('quantile', str(q)),))
+                lines.append(f"{self.name}{labels} {value:.6f}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {data['sum']:.6f}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {data['count']}")
+        return lines
+
+
+class Counter:
+    """Monotonic counter with labels"""
+    type_name = "counter"
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = _labels_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return dict(self._values)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self.snapshot().items()):
+            lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Gauge:
+    """Gauge whose values are read from a callback at scrape time.
+
+    The callback returns either a number or a dict of {labels_dict_tuple: value}
+    built with gauge_values().
+    """
+    type_name = "gauge"
+
+    def __init__(self, name: str, help_text: str, callback: Callable):
+        self.name = name
+        self.help_text = help_text
+        self.callback = callback
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge"]
+        try:
+            values = self.callback()
+        except Exception:
+            return []
+        if isinstance(values, dict):
+            for key, value in sorted(values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {float(value)}")
+        elif values is not None:
+            lines.append(f"{self.name} {float(values)}")
+        return lines
+
+
+def gauge_values(rows: Dict[str, float], label: str) -> Dict:
+    """Turn {label_value: number} into gauge callback output"""
+    return {((label, str(k)),): v for k, v in rows.items()}
+
+
+class MetricsRegistry:
+    """Holds metrics and renders them in Prometheus text format"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, name: str, factory):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = factory()
+            return metric
+
+    def summary(self, name: str, help_text: str) -> Summary:
+        return self._get_or_create(name, lambda: Summary(name, help_text))
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        return self._get_or_create(name, lambda: Counter(name, help_text))
+
+    def gauge(self, name: str, help_text: str, callback: Callable) -> Gauge:
+        """Register (or replace) a callback gauge"""
+        gauge = Gauge(name, help_text, callback)
+        with self._lock:
+            self._metrics[name] = gauge
+        return gauge
+
+    def render_prometheus(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.summary(
+    "medical_rag_stage_seconds", "Latency of RAG pipeline stages in seconds")
+RETRIEVED_DOCUMENTS = REGISTRY.counter(
+    "medical_rag_retrieved_documents_total", "Documents returned by vector search, by document type")
+
+
+class Trace:
+    """Ordered list of stage timings for one request"""
+
+    def __init__(self):
+        self.spans = []
+
+    def add(self, stage: str, seconds: float, **attributes):
+        span = {'stage': stage, 'ms': round(seconds * 1000, 3)}
+        span.update(attributes)
+        self.spans.append(span)
+
+    def totals(self) -> Dict[str, float]:
+        """Total milliseconds per stage name"""
+        totals = {}
+        for span in self.spans:
+            totals[span['stage']] = round(totals.get(span['stage'], 0.0) + span['ms'], 3)
+        return totals
+
+
+_local = threading.local()
+
+
+def current_trace() -> Optional[Trace]:
+    return getattr(_local, 'trace', None)
+
+
+@contextmanager
+def collect_timings():
+    """Collect spans recorded on this thread into a Trace.
+
+    Nested calls join the outer trace so a request yields a single timeline.
+    """
+    outer = current_trace()
+    if outer is not None:
+        yield outer
+        return
+    trace = _local.trace = Trace()
+    try:
+        yield trace
+    finally:
+        _local.trace = None
+
+
+@contextmanager
+def span(stage: str, **attributes):
+    """Time a block as a named pipeline stage"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        trace = current_trace()
+        if trace is not None:
+            trace.add(stage, elapsed, **attributes)
+
+
+def count_retrieved(documents: List[Dict]):
+    """Count retrieved documents per type"""
+    for doc in documents:
+        RETRIEVED_DOCUMENTS.inc(type=doc.get('metadata', {}).get('type', 'unknown'))
@@ -0,0 +1,264 @@
+"""
+Drug-interaction graph for the Medical RAG System
+Built at ingest from the drug_interactions column of the detailed medicine dataset:
+medicines, their salts and the drugs/brands they interact with are nodes in a sorted
+name index, and interactions are CSR adjacency arrays with a dictionary-encoded effect.
+Answers pairwise and prescription-wide interaction checks without search or generation.
+"""
+import json
+import os
+import re
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+import config
+from attribute_index import normalize_value
+
+# Known effect levels, least severe first; other values sort below them
+EFFECT_LEVELS = ("MINOR", "MODERATE", "MAJOR")
+NODE_KINDS = ("medicine", "salt", "drug", "brand")
+PREFIX_MATCH_LIMIT = 20  # Products a bare brand name ("augmentin") may resolve to
+MIN_PREFIX_LENGTH = 4  # Shorter names are never expanded to product names
+
+_DOSAGE = re.compile(r"\([^)]*\)")
+_WORD = re.compile(r"[a-z0-9][a-z0-9\-]*")
+
+
+def normalize_name(name) -> str:
+    """Lookup key: lowercase, dosage in parentheses removed, whitespace collapsed"""
+    if name is None or (isinstance(name, float) and np.isnan(name)):
+        return ""
+    return normalize_value(_DOSAGE.sub(" ", str(name)))
+
+
+def effect_severity(effect: str) -> int:
+    return EFFECT_LEVELS.index(effect) if effect in EFFECT_LEVELS else -1
+
+
+def parse_interactions(raw) -> List[Tuple[str, str, str]]:
+    """(drug, brand, effect) triples from a drug_interactions cell; malformed cells yield none"""
+    if not isinstance(raw, str) or not raw.strip():
+        return []
+    try:
+        data = json.loads(raw)
+    except ValueError:
+        return []
+    drugs, brands, effects = data.get("drug") or [], data.get("brand") or [], data.get("effect") or []
+    triples = []
+    for i, drug in enumerate(drugs):
+        if not drug:
+            continue
+        brand = brands[i] if i < len(brands) else ""
+        effect = str(effects[i]).upper() if i < len(effects) and effects[i] else "UNKNOWN"
+        triples.append((str(drug).strip(), str(brand or "").strip(), effect))
+    return triples
+
+
+def format_interactions(triples: List[Tuple[str, str, str]]) -> str:
+    """Readable interaction list for a medicine document"""
+    return "; ".join(f"{drug} ({brand}): {effect}" if brand else f"{drug}: {effect}"
+                     for drug, brand, effect in triples)
+
+
+def _csr(pairs: Dict[int, Dict[int, int]], size: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    indptr = np.zeros(size + 1, dtype=np.int32)
+    targets, values = [], []
+    for node in range(size):
+        row = pairs.get(node, {})
+        for target in sorted(row):
+            targets.append(target)
+            values.append(row[target])
+        indptr[node + 1] = len(targets)
+    return indptr, np.array(targets, dtype=np.int32), np.array(values, dtype=np.int8)
+
+
+class InteractionGraph:
+    """Name index plus two CSR adjacency structures over the same nodes.
+
+    interactions: symmetric node -> node edges with an effect code.
+    components: node -> the salts or drugs it contains (medicine -> salts, brand -> drug),
+    so a query for a product also matches interactions recorded against its ingredients.
+    """
+
+    def __init__(self, keys: np.ndarray, names: np.ndarray, kinds: np.ndarray, effects: List[str],
+                 edge_indptr: np.ndarray, edge_targets: np.ndarray, edge_effects: np.ndarray,
+                 component_indptr: np.ndarray, component_targets: np.ndarray):
+        self.keys = keys  # Sorted normalized names; node id = position
+        self.names = names  # Display name of each node
+        self.kinds = kinds
+        self.effects = effects
+        self.edge_indptr = edge_indptr
+        self.edge_targets = edge_targets
+        self.edge_effects = edge_effects
+        self.component_indptr = component_indptr
+        self.component_targets = component_targets
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def num_interactions(self) -> int:
+        return len(self.edge_targets) // 2
+
+    @classmethod
+    def build(cls, records: List[Dict]) -> "InteractionGraph":
+        """Build from {name, salts, interactions} records, one per medicine row"""
+        display, kinds = {}, {}
+
+        def node(name: str, kind: str) -> str:
+            key = normalize_name(name)
+            if key and (key not in kinds or NODE_KINDS.index(kind) < NODE_KINDS.index(kinds[key])):
+                display[key] = str(name).strip()
+                kinds[key] = kind
+            return key
+
+        effects = list(EFFECT_LEVELS)
+        edges, components = {}, {}
+        for record in records:
+            medicine = node(record["name"], "medicine")
+            if not medicine:
+                continue
+            for salt in record["salts"]:
+                salt_key = node(salt, "salt")
+                if salt_key and salt_key != medicine:
+                    components.setdefault(medicine, set()).add(salt_key)
+            for drug, brand, effect in record["interactions"]:
+                drug_key = node(drug, "drug")
+                if not drug_key or drug_key == medicine:
+                    continue
+                if brand:
+                    brand_key = node(brand, "brand")
+                    if brand_key and brand_key != drug_key:
+                        components.setdefault(brand_key, set()).add(drug_key)
+                if effect not in effects:
+                    effects.append(effect)
+                for a, b in ((medicine, drug_key), (drug_key, medicine)):
+                    previous = edges.setdefault(a, {}).get(b)
+                    # Keep the most severe effect when a pair is listed more than once
+                    if previous is None or effect_severity(effect) > effect_severity(previous):
+                        edges[a][b] = effect
+
+        keys = sorted(kinds)
+        ids = {key: i for i, key in enumerate(keys)}
+        effect_codes = {effect: i for i, effect in enumerate(effects)}
+        edge_indptr, edge_targets, edge_effects = _csr(
+            {ids[a]: {ids[b]: effect_codes[e] for b, e in row.items()} for a, row in edges.items()}, len(keys))
+        component_indptr, component_targets, _ = _csr(
+            {ids[a]: {ids[b]: 0 for b in row} for a, row in components.items()}, len(keys))
+        return cls(np.array(keys, dtype=str), np.array([display[k] for k in keys], dtype=str),
+                   np.array([NODE_KINDS.index(kinds[k]) for k in keys], dtype=np.int8), effects,
+                   edge_indptr, edge_targets, edge_effects, component_indptr, component_targets)
+
+    def save(self, path: str = config.INTERACTION_GRAPH_PATH):
+        """Write the graph to <path>.npz"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez(f"{path}.npz", keys=self.keys, names=self.names, kinds=self.kinds,
+                 effects=np.array(self.effects, dtype=str), edge_indptr=self.edge_indptr,
+                 edge_targets=self.edge_targets, edge_effects=self.edge_effects,
+                 component_indptr=self.component_indptr, component_targets=self.component_targets)
+        print(f"Saved interaction graph with {len(self)} names and {self.num_interactions} interactions "
+              f"to {path}.npz")
+
+    @classmethod
+    def load(cls, path: str = config.INTERACTION_GRAPH_PATH) -> Optional["InteractionGraph"]:
+        """Load a saved graph, or return None if it has not been built"""
+        if not os.path.exists(f"{path}.npz"):
+            return None
+        with np.load(f"{path}.npz") as data:
+            return cls(data["keys"], data["names"], data["kinds"], data["effects"].tolist(),
+                       data["edge_indptr"], data["edge_targets"], data["edge_effects"],
+                       data["component_indptr"], data["component_targets"])
+
+    def _find(self, key: str) -> int:
+        position = int(np.searchsorted(self.keys, key))
+        return position if position < len(self.keys) and self.keys[position] == key else -1
+
+    def resolve(self, name: str, prefix: bool = True) -> List[int]:
+        """Nodes a name refers to: the exact name, else products whose name starts with it"""
+        key = normalize_name(name)
+        if not key:
+            return []
+        exact = self._find(key)
+        if exact >= 0:
+            return [exact]
+        if not prefix or len(key) < MIN_PREFIX_LENGTH:
+            return []
+        start = int(np.searchsorted(self.keys, key + " "))
+        end = int(np.searchsorted(self.keys, key + "!"))  # "!" sorts right after " "
+        return list(range(start, min(end, start + PREFIX_MATCH_LIMIT)))
+
+    def _expand(self, nodes: List[int]) -> List[int]:
+        """Nodes plus their components (ingredients)"""
+        expanded = list(nodes)
+        for node in nodes:
+            expanded.extend(self.component_targets[self.component_indptr[node]:self.component_indptr[node + 1]].tolist())
+        return list(dict.fromkeys(expanded))
+
+    def _neighbors(self, nodes: List[int]) -> Dict[int, Tuple[int, int]]:
+        """Interacting node -> (effect code, node it was reached from)"""
+        neighbors = {}
+        for node in nodes:
+            start, end = self.edge_indptr[node], self.edge_indptr[node + 1]
+            for target, effect in zip(self.edge_targets[start:end].tolist(), self.edge_effects[start:end].tolist()):
+                if target not in neighbors or self._more_severe(effect, neighbors[target][0]):
+                    neighbors[target] = (effect, node)
+        return neighbors
+
+    def _more_severe(self, a: int, b: int) -> bool:
+        return effect_severity(self.effects[a]) > effect_severity(self.effects[b])
+
+    def _hit(self, effect: int, source: int, target: int, **extra) -> Dict:
+        return dict(extra, effect=self.effects[effect],
+                    source=str(self.names[source]), target=str(self.names[target]),
+                    target_kind=NODE_KINDS[self.kinds[target]])
+
+    def _sorted(self, hits: List[Dict]) -> List[Dict]:
+        return sorted(hits, key=lambda hit: -effect_severity(hit['effect']))
+
+    def interactions_of(self, name: str, limit: Optional[int] = None) -> List[Dict]:
+        """Everything a medicine (or its ingredients) is recorded to interact with, most severe first"""
+        neighbors = self._neighbors(self._expand(self.resolve(name)))
+        hits = self._sorted([self._hit(effect, source, target) for target, (effect, source) in neighbors.items()])
+        return hits[:limit] if limit else hits
+
+    def check(self, names: List[str]) -> Dict:
+        """Interactions between every pair of names in a prescription list.
+
+        Each hit names both list entries and the recorded nodes that connect them
+        (e.g. a product's salt and an interacting drug).
+        """
+        resolved, unknown = [], []
+        for name in names:
+            nodes = self._expand(self.resolve(name))
+            resolved.append(nodes)
+            if not nodes:
+                unknown.append(name)
+
+        hits = []
+        for i in range(len(names)):
+            if not resolved[i]:
+                continue
+            neighbors = self._neighbors(resolved[i])
+            for j in range(i + 1, len(names)):
+                best = None
+                for node in resolved[j]:
+                    if node in neighbors and (best is None or self._more_severe(neighbors[node][0], best[0])):
+                        best = (neighbors[node][0], neighbors[node][1], node)
+                if best is not None:
+                    hits.append(self._hit(*best, a=names[i], b=names[j]))
+        return {'interactions': self._sorted(hits), 'unknown': unknown}
+
+    def mentions(self, text: str, max_words: int = 4) -> List[str]:
+        """Known names mentioned in free text, longest match first, left to right"""
+        words = _WORD.findall(normalize_name(text))
+        found, i = [], 0
+        while i < len(words):
+            for n in range(min(max_words, len(words) - i), 0, -1):
+                phrase = " ".join(words[i:i + n])
+                # Single words must match exactly; as prefixes they hit too many product names
+                if self.resolve(phrase, prefix=n > 1):
+                    found.append(phrase)
+                    i += n
+                    break
+            else:
+                i += 1
+        return list(dict.fromkeys(found))
@@ -4,17 +4,34 @@ Processes CSV files and creates embeddings for vector database storage
 """
 import pandas as pd
 import numpy as np
-from sentence_transformers import SentenceTransformer
 from typing import List, Dict, Tuple
-import json
 import re
 from tqdm import tqdm
 import config
+from embeddings import get_encoder
+from faq_index import FAQIndex
+from interaction_graph import InteractionGraph, parse_interactions, format_interactions
+from entity_matcher import EntityMatcher
+from document_batch import DocumentBatch
+from dedup import compact
+from source_cache import SourceCache
 
 class MedicalDataProcessor:
-    def __init__(self):
-        self.model = SentenceTransformer(config.EMBEDDING_MODEL)
-        self.processed_documents = []
+    def __init__(self, encoder=None, progress=None, source_cache_dir: str = config.SOURCE_CACHE_DIR):
+        self.encoder = encoder or get_encoder()
+        # Sources come back with text columns already passed through clean_text
+        self.source_cache = SourceCache(source_cache_dir, self.clean_text)
+        self.processed_documents = DocumentBatch.from_dicts([])
+        self.faq_entries = []
+        self.interaction_records = []
+        self.duplicate_members = None  # Documents removed by near-duplicate compaction
+        self.dedup_stats = None
+        # Optional callback progress(stage, done, total); total is None when unknown
+        self.progress = progress or (lambda stage, done, total: None)
+    
+    def read_csv(self, file_path: str, key: str) -> pd.DataFrame:
+        """Read a cleaned source CSV (config.CSV_FILES key) through the source cache"""
+        return self.source_cache.read(file_path, key)
         
     def clean_text(self, text: str) -> str:
         """Clean and normalize text"""
@@ -58,13 +75,13 @@ class MedicalDataProcessor:
     def process_dialogues(self, file_path: str) -> List[Dict]:
         """Process MTS-Dialog training data"""
         print("Processing dialogue data...")
-        df = pd.read_csv(file_path)
+        df = self.read_csv(file_path, 'dialogues')
         documents = []
         
         for idx, row in tqdm(df.iterrows(), total=len(df)):
-            dialogue = self.clean_text(row['dialogue'])
-            section_text = self.clean_text(row.get('section_text', ''))
-            section_header = self.clean_text(row.get('section_header', ''))
+            dialogue = row['dialogue']
+            section_text = row['section_text']
+            section_header = row['section_header']
             
             if dialogue:
                 # Create document with context
@@ -94,12 +111,12 @@ class MedicalDataProcessor:
     def process_disease_descriptions(self, file_path: str) -> List[Dict]:
         """Process disease description data"""
         print("Processing disease descriptions...")
-        df = pd.read_csv(file_path)
+        df = self.read_csv(file_path, 'descriptions')
         documents = []
         
         for idx, row in tqdm(df.iterrows(), total=len(df)):
-            disease = self.clean_text(row['Disease'])
-            description = self.clean_text(row['Description'])
+            disease = row['Disease']
+            description = row['Description']
             
             if disease and description:
                 content = f"Disease: {disease}\n\nDescription: {description}"
@@ -121,15 +138,15 @@ class MedicalDataProcessor:
     def process_precautions(self, file_path: str) -> List[Dict]:
         """Process disease precaution data"""
         print("Processing precautions...")
-        df = pd.read_csv(file_path)
+        df = self.read_csv(file_path, 'precautions')
         documents = []
         
         for idx, row in tqdm(df.iterrows(), total=len(df)):
-            disease = self.clean_text(row['Disease'])
+            disease = row['Disease']
             precautions = []
             
             for i in range(1, 5):
-                precaution = self.clean_text(row.get(f'Precaution_{i}', ''))
+                precaution = row[f'Precaution_{i}']
                 if precaution:
                     precautions.append(precaution)
             
@@ -155,15 +172,21 @@ class MedicalDataProcessor:
     def process_qna(self, file_path: str) -> List[Dict]:
         """Process Q&A data"""
         print("Processing Q&A data...")
-        df = pd.read_csv(file_path)
+        df = self.read_csv(file_path, 'qna')
         documents = []
         
         for idx, row in tqdm(df.iterrows(), total=len(df)):
-            question = self.clean_text(row['Question'])
-            answer = self.clean_text(row['Answer'])
-            qtype = self.clean_text(row.get('qtype', ''))
+            question = row['Question']
+            answer = row['Answer']
+            qtype = row['qtype']
             
             if question and answer:
+                self.faq_entries.append({
+                    "id": f"{config.DOC_TYPES['faq']}{idx}",
+                    "question": question,
+                    "answer": answer,
+                    "question_type": qtype
+                })
                 content = f"Q: {question}\n\nA: {answer}"
                 
                 chunks = self.chunk_text(content)
@@ -186,14 +209,14 @@ class MedicalDataProcessor:
     def process_symptom_patterns(self, file_path: str) -> List[Dict]:
         """Process symptom-to-diagnosis training data"""
         print("Processing symptom patterns...")
-        df = pd.read_csv(file_path)
+        df = self.read_csv(file_path, 'symptoms')
         documents = []
 
         # Get symptom column names (all except 'prognosis')
         symptom_cols = [col for col in df.columns if col != 'prognosis']
 
         for idx, row in tqdm(df.iterrows(), total=len(df)):
-            prognosis = self.clean_text(row['prognosis'])
+            prognosis = row['prognosis']
             if not prognosis:
                 continue
 
@@ -224,7 +247,7 @@ class MedicalDataProcessor:
     def process_basic_medicines(self, file_path: str, max_records: int = 1000) -> List[Dict]:
         """Process basic medicine dataset (limited for efficiency)"""
         print(f"Processing basic medicine data (first {max_records} records)...")
-        df = pd.read_csv(file_path)
+        df = self.read_csv(file_path, 'medicines_basic')
         df = df.head(max_records)  # Limit to first N records for efficiency
         documents = []
 
@@ -265,7 +288,7 @@ class MedicalDataProcessor:
     def process_detailed_medicines(self, file_path: str, max_records: int = 1000) -> List[Dict]:
         """Process detailed Indian medicine dataset (limited for efficiency)"""
         print(f"Processing detailed medicine data (first {max_records} records)...")
-        df = pd.read_csv(file_path)
+        df = self.read_csv(file_path, 'medicines_detailed')
         df = df.head(max_records)  # Limit to first N records
         documents = []
 
@@ -294,8 +317,17 @@ class MedicalDataProcessor:
             if not pd.isna(row['side_effects']):
                 content += f"Side Effects: {row['side_effects']}\n\n"
 
-            if not pd.isna(row['drug_interactions']) and row['drug_interactions'] != '{"drug": [], "brand": [], "effect": []}':
-                content += f"Drug Interactions: {row['drug_interactions']}\n"
+            interactions = parse_interactions(row['drug_interactions'])
+            if interactions:
+                content += f"Drug Interactions: {format_interactions(interactions)}\n"
+            salts = [row['short_composition1'], row['short_composition2']]
+            if not pd.isna(row['salt_composition']):
+                salts += row['salt_composition'].split('+')
+            self.interaction_records.append({
+                "name": row['name'],
+                "salts": [salt for salt in salts if not pd.isna(salt) and str(salt).strip()],
+                "interactions": interactions
+            })
 
             doc = {
                 "id": f"{config.DOC_TYPES['medicine_detailed']}{idx}",
@@ -318,29 +350,27 @@ class MedicalDataProcessor:
         print(f"Processed {len(documents)} documents from {file_path}")
         return documents
 
-    def generate_embeddings(self, documents: List[Dict]) -> List[Dict]:
-        """Generate embeddings for all documents"""
+    def generate_embeddings(self, documents: DocumentBatch) -> DocumentBatch:
+        """Generate embeddings for all documents into one float32 matrix"""
         print("Generating embeddings...")
 
-        # Extract texts for batch processing
-        texts = [doc['document'] for doc in documents]
-
-        # Generate embeddings in batches
-        embeddings = []
+        texts = documents.texts
+        embeddings = np.zeros((len(texts), config.EMBEDDING_DIM), dtype=np.float32)
         for i in tqdm(range(0, len(texts), config.BATCH_SIZE)):
-            batch_texts = texts[i:i + config.BATCH_SIZE]
-            batch_embeddings = self.model.encode(batch_texts, convert_to_tensor=False)
-            embeddings.extend(batch_embeddings)
-
-        # Add embeddings to documents
-        for doc, embedding in zip(documents, embeddings):
-            doc['embedding'] = embedding.tolist()
-
+            end = min(i + config.BATCH_SIZE, len(texts))
+            batch_embeddings = self.encoder.encode(texts[i:end])
+            if batch_embeddings.shape[1] != embeddings.shape[1]:  # Model with another dimension
+                embeddings = np.zeros((len(texts), batch_embeddings.shape[1]), dtype=np.float32)
+            embeddings[i:end] = batch_embeddings
+            self.progress('embed', end, len(texts))
+
+        documents.embeddings = embeddings
         return documents
 
-    def process_all_files(self) -> List[Dict]:
+    def process_all_files(self) -> DocumentBatch:
         """Process all CSV files and return combined documents"""
-        all_documents = []
+        batches = []
+        total_documents = 0
 
         # Process each file type
         processors = [
@@ -355,21 +385,58 @@ class MedicalDataProcessor:
 
         for file_path, processor_func in processors:
             try:
-                documents = processor_func(file_path)
-                all_documents.extend(documents)
+                # Each file's dicts are converted and released before the next file
+                documents = DocumentBatch.from_dicts(processor_func(file_path))
+                batches.append(documents)
+                total_documents += len(documents)
                 print(f"Processed {len(documents)} documents from {file_path}")
+                self.progress('parse', total_documents, None)
             except Exception as e:
                 print(f"Error processing {file_path}: {e}")
                 continue
 
+        all_documents = DocumentBatch.concat(batches)
         print(f"\nTotal documents before embedding: {len(all_documents)}")
 
+        # Compact before embedding so removed near-duplicates are never encoded
+        if config.DEDUP_ENABLED:
+            all_documents, self.duplicate_members, self.dedup_stats = compact(all_documents)
+            self.progress('compact', self.dedup_stats['removed'], self.dedup_stats['documents'])
+
         # Generate embeddings for all documents
         all_documents = self.generate_embeddings(all_documents)
 
         self.processed_documents = all_documents
         return all_documents
 
+    def build_faq_index(self, output_path: str = config.FAQ_INDEX_PATH) -> FAQIndex:
+        """Build and save the FAQ question index from processed Q&A rows"""
+        print(f"Building FAQ question index from {len(self.faq_entries)} Q&A pairs...")
+        faq_index = FAQIndex.build(self.faq_entries, self.encoder)
+        faq_index.save(output_path)
+        return faq_index
+
+    def build_interaction_graph(self, output_path: str = config.INTERACTION_GRAPH_PATH) -> InteractionGraph:
+        """Build and save the drug-interaction graph from processed medicine rows"""
+        print(f"Building drug-interaction graph from {len(self.interaction_records)} medicines...")
+        graph = InteractionGraph.build(self.interaction_records)
+        graph.save(output_path)
+        return graph
+
+    def build_entity_index(self, output_path: str = config.ENTITY_INDEX_PATH) -> EntityMatcher:
+        """Build and save the disease/medicine/salt name index from processed documents"""
+        print("Building entity name index...")
+        entity_index = EntityMatcher.build(self.processed_documents)
+        entity_index.save(output_path)
+        return entity_index
+
+    def save_duplicate_members(self, output_path: str = config.DEDUP_MEMBERS_PATH):
+        """Save the documents compaction removed to <output_path>.json, for dedup.py expand"""
+        if self.duplicate_members is None:
+            return
+        print(f"Saving {len(self.duplicate_members)} near-duplicate documents to {output_path}.json")
+        self.duplicate_members.save_json(f"{output_path}.json")
+
     def save_processed_data(self, output_file: str = "processed_medical_data.json"):
         """Save processed documents to JSON file"""
         if not self.processed_documents:
@@ -377,8 +444,7 @@ class MedicalDataProcessor:
             return
 
         print(f"Saving {len(self.processed_documents)} documents to {output_file}")
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(self.processed_documents, f, indent=2, ensure_ascii=False)
+        self.processed_documents.save_json(output_file)
 
         print(f"Data saved to {output_file}")
 
@@ -386,6 +452,10 @@ if __name__ == "__main__":
     processor = MedicalDataProcessor()
     documents = processor.process_all_files()
     processor.save_processed_data()
+    processor.save_duplicate_members()
+    processor.build_faq_index()
+    processor.build_interaction_graph()
+    processor.build_entity_index()
 
     print(f"\nProcessing complete!")
     print(f"Total documents: {len(documents)}")
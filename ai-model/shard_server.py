@@ -0,0 +1,196 @@
+"""
+Shard server for sharded retrieval in the Medical RAG System
+`split` divides processed documents into shard indexes by document type or by ID hash;
+`serve` answers searches for one shard over HTTP on a local port or a Unix socket.
+Queries arrive already encoded, so shard servers do not load the embedding model.
+"""
+import argparse
+import json
+import os
+import socketserver
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+import numpy as np
+import config
+from document_batch import DocumentBatch
+from vector_db_manager import MedicalVectorDB
+
+SPLITS = ("type", "hash")
+MANIFEST_FILE = "shard.json"
+
+
+class QueryEmbeddingsOnly:
+    """Encoder stand-in for shard servers, which receive query embeddings"""
+
+    def encode(self, texts):
+        raise RuntimeError("Shard servers search by query embedding; encode queries in the coordinator")
+
+
+def assign_shards(documents: DocumentBatch, shards: int, split: str) -> np.ndarray:
+    """Shard number of every document.
+
+    type: whole document types go to the least-loaded shard, largest types first.
+    hash: CRC32 of the document ID, so a document always lands on the same shard.
+    """
+    if split == "hash":
+        return np.array([zlib.crc32(doc_id.encode('utf-8')) % shards for doc_id in documents.ids], dtype=np.int32)
+
+    codes, types = documents.categoricals['type']
+    counts = np.bincount(codes[codes >= 0], minlength=len(types))
+    loads = [0] * shards
+    shard_of_type = np.zeros(len(types) + 1, dtype=np.int32)  # Trailing entry: documents without a type
+    for code in np.argsort(-counts, kind='stable'):
+        target = loads.index(min(loads))
+        shard_of_type[code] = target
+        loads[target] += counts[code]
+    return shard_of_type[codes]
+
+
+def split_index(json_file: str, shards: int, split: str, output_dir: str = config.SHARD_ROOT) -> List[Dict]:
+    """Build one vector database per shard from processed_medical_data.json"""
+    if split not in SPLITS:
+        raise ValueError(f"Unknown split '{split}'. Choose from {', '.join(SPLITS)}")
+    documents = DocumentBatch.load_json(json_file)
+    assignment = assign_shards(documents, shards, split)
+
+    manifests = []
+    for shard in range(shards):
+        part = documents.take(np.flatnonzero(assignment == shard))
+        shard_path = os.path.join(output_dir, f"shard-{shard}")
+        print(f"Building shard {shard} with {len(part)} documents in {shard_path}")
+        vector_db = MedicalVectorDB(db_path=shard_path, encoder=QueryEmbeddingsOnly(), server="")
+        if len(part) and not vector_db.add_documents(part):
+            raise RuntimeError(f"Storing documents for shard {shard} failed")
+        vector_db.build_attribute_index(part)
+
+        manifest = {
+            'shard': shard,
+            'shards': shards,
+            'split': split,
+            'documents': len(part),
+            'doc_types': sorted(set(part.categoricals['type'][1][code]
+                                    for code in np.unique(part.categoricals['type'][0]) if code >= 0))
+        }
+        with open(os.path.join(shard_path, MANIFEST_FILE), 'w') as f:
+            json.dump(manifest, f, indent=2)
+        manifests.append(manifest)
+    return manifests
+
+
+class ShardRequestHandler(BaseHTTPRequestHandler):
+    """JSON endpoints: GET /health, GET /stats, POST /search, POST /documents"""
+
+    vector_db: MedicalVectorDB = None
+    manifest: Dict = {}
+
+    def do_GET(self):
+        if self.path == '/health':
+            self.send_json({**self.manifest, 'status': 'ok'})
+        elif self.path == '/stats':
+            self.send_json(self.vector_db.get_collection_stats())
+        else:
+            self.send_json({'error': 'Not found'}, 404)
+
+    def do_POST(self):
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        except ValueError:
+            self.send_json({'error': 'Invalid JSON'}, 400)
+            return
+
+        if self.path == '/search':
+            embeddings = body.get('query_embeddings') or []
+            try:
+                results = self.vector_db.search_similar_batch(
+                    [""] * len(embeddings), int(body.get('n_results', config.TOP_K_RESULTS)),
+                    body.get('doc_types'), embeddings, body.get('filters'))
+            except ValueError as e:
+                self.send_json({'error': str(e)}, 400)
+                return
+            self.send_json({'results': results})
+        elif self.path == '/documents':
+            self.send_json({'documents': self.vector_db.get_documents_by_ids(body.get('ids', []))})
+        else:
+            self.send_json({'error': 'Not found'}, 404)
+
+    def send_json(self, payload, status: int = 200):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        try:
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # The coordinator stopped waiting (shard deadline)
+
+    def log_message(self, format, *args):
+        pass  # One line per search would swamp the shard's log
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        return request, ("unix", 0)  # BaseHTTPRequestHandler expects a (host, port) address
+
+
+def serve(shard_path: str, port: int = None, socket_path: str = None, host: str = "127.0.0.1"):
+    """Serve one shard until interrupted"""
+    manifest_file = os.path.join(shard_path, MANIFEST_FILE)
+    manifest = {}
+    if os.path.exists(manifest_file):
+        with open(manifest_file) as f:
+            manifest = json.load(f)
+
+    handler = type('Handler', (ShardRequestHandler,), {
+        'vector_db': MedicalVectorDB(db_path=shard_path, encoder=QueryEmbeddingsOnly(), server=""),
+        'manifest': manifest
+    })
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = UnixHTTPServer(socket_path, handler)
+        address = f"unix://{socket_path}"
+    else:
+        server = ThreadingHTTPServer((host, port), handler)
+        address = f"http://{host}:{port}"
+
+    print(f"Serving shard {manifest.get('shard', shard_path)} "
+          f"({', '.join(manifest.get('doc_types', [])) or 'all types'}) at {address}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build and serve vector index shards")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    split_parser = commands.add_parser("split", help="Split processed documents into shard indexes")
+    split_parser.add_argument("--json", default="processed_medical_data.json")
+    split_parser.add_argument("--shards", type=int, required=True)
+    split_parser.add_argument("--by", choices=SPLITS, default="type", help="Split by document type or ID hash")
+    split_parser.add_argument("--output-dir", default=config.SHARD_ROOT)
+
+    serve_parser = commands.add_parser("serve", help="Serve one shard")
+    serve_parser.add_argument("shard_path", help="Shard directory, e.g. medical_shards/shard-0")
+    listen = serve_parser.add_mutually_exclusive_group(required=True)
+    listen.add_argument("--port", type=int)
+    listen.add_argument("--socket", help="Unix socket path")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+
+    args = parser.parse_args()
+    if args.command == "split":
+        for manifest in split_index(args.json, args.shards, args.by, args.output_dir):
+            print(f"Shard {manifest['shard']}: {manifest['documents']} documents "
+                  f"({', '.join(manifest['doc_types'])})")
+    else:
+        serve(args.shard_path, args.port, args.socket, args.host)
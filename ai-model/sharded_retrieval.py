@@ -0,0 +1,234 @@
+"""
+Scatter-gather retrieval across shard servers for the Medical RAG System
+ShardedVectorDB stands in for MedicalVectorDB: it encodes queries locally, sends the
+embeddings to every shard that can hold matching documents, and merges the per-shard
+top-k by similarity score. Shards that miss the deadline are left out of the merge.
+"""
+import http.client
+import json
+import os
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+import config
+from attribute_index import MEDICINE_TYPES, validate_filters
+from embeddings import get_encoder
+from instrumentation import REGISTRY, span, count_retrieved
+
+MANIFEST_RETRY_SECONDS = 30  # How often an unreachable shard's manifest is re-fetched
+STATS_TIMEOUT = 5.0  # Seconds; /stats samples documents and is slower than a search
+
+SHARD_REQUESTS = REGISTRY.counter(
+    "medical_ai_shard_requests_total", "Shard requests by shard and outcome (ok, timeout, error)")
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path: str, timeout: float):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class ShardClient:
+    """JSON requests to one shard server at http://host:port or unix:///path"""
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        parsed = urlparse(endpoint)
+        if parsed.scheme not in ("http", "unix"):
+            raise ValueError(f"Unsupported shard endpoint '{endpoint}'; use http://host:port or unix:///path")
+        self.parsed = parsed
+        self.manifest = None  # Fetched from /health once the shard is reachable
+        self.manifest_checked = None
+
+    def _connection(self, timeout: float) -> http.client.HTTPConnection:
+        if self.parsed.scheme == "unix":
+            return UnixHTTPConnection(self.parsed.path, timeout)
+        return http.client.HTTPConnection(self.parsed.hostname, self.parsed.port, timeout=timeout)
+
+    def request(self, method: str, path: str, payload: Optional[Dict] = None, timeout: float = None) -> Dict:
+        connection = self._connection(timeout or config.SHARD_DEADLINE_MS / 1000)
+        try:
+            body = json.dumps(payload).encode('utf-8') if payload is not None else None
+            connection.request(method, path, body=body, headers={'Content-Type': 'application/json'})
+            response = connection.getresponse()
+            data = json.loads(response.read() or b'{}')
+            if response.status != 200:
+                raise RuntimeError(f"Shard {self.endpoint} returned {response.status}: {data.get('error')}")
+            return data
+        finally:
+            connection.close()
+
+    def doc_types(self) -> Optional[List[str]]:
+        """Document types the shard holds, or None if unknown (the shard is always queried)"""
+        if self.manifest is None:
+            now = time.monotonic()
+            if self.manifest_checked is not None and now - self.manifest_checked < MANIFEST_RETRY_SECONDS:
+                return None
+            self.manifest_checked = now
+            try:
+                self.manifest = self.request('GET', '/health')
+            except Exception:
+                return None
+        return self.manifest.get('doc_types')
+
+
+class ShardedVectorDB:
+    """Read-only MedicalVectorDB interface over shard servers"""
+
+    def __init__(self, endpoints: List[str], encoder=None, deadline_ms: float = config.SHARD_DEADLINE_MS):
+        if isinstance(endpoints, str):
+            endpoints = [e.strip() for e in endpoints.split(",") if e.strip()]
+        if not endpoints:
+            raise ValueError("No shard endpoints configured")
+        self.shards = [ShardClient(endpoint) for endpoint in endpoints]
+        self.encoder = encoder or get_encoder()
+        self.deadline = deadline_ms / 1000
+        self.db_path = None  # Shards are rebuilt with shard_server.py split, not hot-swapped
+        self.collection_name = config.COLLECTION_NAME
+        self.attribute_index = None
+        self._executor = None
+        self._executor_pid = None
+        for shard in self.shards:
+            if shard.doc_types() is None:
+                print(f"Shard {shard.endpoint} is not reachable yet; it will be queried for every request")
+        print(f"Using {len(self.shards)} index shards")
+
+    def _pool(self) -> ThreadPoolExecutor:
+        # Worker threads do not survive fork, so each process gets its own pool
+        if self._executor_pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=max(4, len(self.shards) * 4),
+                                                thread_name_prefix="shard-fanout")
+            self._executor_pid = os.getpid()
+        return self._executor
+
+    def encode_query(self, texts: List[str]) -> List[List[float]]:
+        """Encode query texts with the same model used at ingestion"""
+        with span('vector_db.encode', texts=len(texts)):
+            return self.encoder.encode(texts).tolist()
+
+    def _fan_out(self, shards: List[ShardClient], method: str, path: str,
+                 payload: Optional[Dict] = None) -> List[Dict]:
+        """Responses of the shards that answered before the deadline"""
+        deadline = time.monotonic() + self.deadline
+        futures = {self._pool().submit(shard.request, method, path, payload, self.deadline): shard
+                   for shard in shards}
+        done, not_done = wait(futures, timeout=max(0.0, deadline - time.monotonic()))
+
+        responses = []
+        for future in done:
+            shard = futures[future]
+            try:
+                responses.append(future.result())
+                SHARD_REQUESTS.inc(shard=shard.endpoint, outcome='ok')
+            except Exception as e:
+                SHARD_REQUESTS.inc(shard=shard.endpoint, outcome='error')
+                print(f"Shard {shard.endpoint} failed: {e}")
+        for future in not_done:
+            SHARD_REQUESTS.inc(shard=futures[future].endpoint, outcome='timeout')
+            print(f"Shard {futures[future].endpoint} missed the {self.deadline * 1000:.0f}ms deadline")
+        return responses
+
+    def _shards_for(self, doc_types: Optional[List[str]], filters: Optional[Dict]) -> List[ShardClient]:
+        """Shards that may hold documents of the requested types"""
+        if filters:
+            doc_types = [t for t in (doc_types or MEDICINE_TYPES) if t in MEDICINE_TYPES]
+        if not doc_types:
+            return self.shards
+        selected = []
+        for shard in self.shards:
+            held = shard.doc_types()
+            if held is None or set(held) & set(doc_types):
+                selected.append(shard)
+        return selected
+
+    def search_similar_batch(self, queries: List[str], n_results: int = config.TOP_K_RESULTS,
+                             doc_types: Optional[List[str]] = None,
+                             query_embeddings: Optional[List[List[float]]] = None,
+                             filters: Optional[Dict] = None) -> List[List[Dict]]:
+        """Top n_results per query across all shards, merged by similarity score"""
+        if not queries:
+            return []
+        if filters:
+            validate_filters(filters)
+        with span('vector_db.search_similar_batch', queries=len(queries), doc_types=",".join(doc_types or [])):
+            if query_embeddings is None:
+                query_embeddings = self.encode_query(queries)
+            payload = {
+                'query_embeddings': [list(map(float, embedding)) for embedding in query_embeddings],
+                'n_results': n_results,
+                'doc_types': doc_types,
+                'filters': filters
+            }
+            with span('vector_db.shard_fan_out'):
+                responses = self._fan_out(self._shards_for(doc_types, filters), 'POST', '/search', payload)
+
+            merged = []
+            for q in range(len(queries)):
+                candidates = [doc for response in responses for doc in response['results'][q]]
+                candidates.sort(key=lambda doc: doc['similarity_score'], reverse=True)
+                merged.append(candidates[:n_results])
+        for formatted_results in merged:
+            count_retrieved(formatted_results)
+        return merged
+
+    def search_similar(self, query: str, n_results: int = config.TOP_K_RESULTS,
+                       doc_types: Optional[List[str]] = None,
+                       query_embedding: Optional[List[float]] = None,
+                       filters: Optional[Dict] = None) -> List[Dict]:
+        """Search for similar documents, reusing query_embedding when the caller already has it"""
+        embeddings = [query_embedding] if query_embedding is not None else None
+        return self.search_similar_batch([query], n_results, doc_types, embeddings, filters)[0]
+
+    def get_document_by_id(self, doc_id: str) -> Optional[Dict]:
+        """Retrieve a specific document by ID from whichever shard holds it"""
+        for response in self._fan_out(self.shards, 'POST', '/documents', {'ids': [doc_id]}):
+            if response['documents']:
+                return response['documents'][0]
+        return None
+
+    def get_documents_by_ids(self, doc_ids: List[str]) -> List[Dict]:
+        """Retrieve documents by ID from whichever shards hold them, in the order asked"""
+        if not doc_ids:
+            return []
+        found = {}
+        for response in self._fan_out(self.shards, 'POST', '/documents', {'ids': list(doc_ids)}):
+            for doc in response['documents']:
+                found[doc['id']] = doc
+        return [found[doc_id] for doc_id in doc_ids if doc_id in found]
+
+    def get_collection_stats(self) -> Dict:
+        """Collection statistics summed over the shards that answered"""
+        shard_stats = []
+        for shard in self.shards:
+            try:
+                stats = shard.request('GET', '/stats', timeout=STATS_TIMEOUT)
+                shard_stats.append({'endpoint': shard.endpoint, 'status': 'ok',
+                                    'total_documents': stats.get('total_documents', 0),
+                                    'document_types': stats.get('document_types', {}),
+                                    'distance_space': stats.get('distance_space')})
+            except Exception as e:
+                shard_stats.append({'endpoint': shard.endpoint, 'status': 'unavailable', 'error': str(e)})
+
+        type_counts = {}
+        for stats in shard_stats:
+            for doc_type, count in stats.get('document_types', {}).items():
+                type_counts[doc_type] = type_counts.get(doc_type, 0) + count
+        return {
+            'total_documents': sum(stats.get('total_documents', 0) for stats in shard_stats),
+            'document_types': type_counts,
+            'collection_name': self.collection_name,
+            'db_path': None,
+            'distance_space': next((s['distance_space'] for s in shard_stats if s.get('distance_space')), None),
+            'shards': shard_stats
+        }
+
+    def close(self):
+        if self._executor is not None and self._executor_pid == os.getpid():
+            self._executor.shutdown(wait=False)
@@ -0,0 +1,143 @@
+"""
+Cleaned-source cache for the Medical RAG data processor
+Stages each source in config.CSV_FILES as cleaned, typed, column-pruned Parquet keyed by the
+source file's size, mtime and content hash, so unchanged sources skip CSV parsing and
+text cleaning on later runs. Parquet needs pyarrow; without it sources are staged in memory only.
+"""
+import hashlib
+import json
+import os
+import pandas as pd
+from typing import Callable, Dict, Optional
+
+try:
+    import pyarrow  # noqa: F401
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+# Bump when the staging rules or clean_text change so old cache entries are rebuilt
+CACHE_VERSION = 1
+
+# Per source: columns passed through clean_text (missing ones become ""), other columns
+# kept as-is, and dtype conversions. Sources list every column their processor reads.
+SOURCE_SCHEMAS = {
+    "dialogues": {"clean": ["dialogue", "section_text", "section_header"]},
+    "descriptions": {"clean": ["Disease", "Description"]},
+    "precautions": {"clean": ["Disease", "Precaution_1", "Precaution_2", "Precaution_3", "Precaution_4"]},
+    "qna": {"clean": ["Question", "Answer", "qtype"]},
+    # Every non-prognosis column is a 0/1 symptom flag
+    "symptoms": {"clean": ["prognosis"], "keep_all": True, "int8_rest": True},
+    "medicines_basic": {
+        "keep": ["Name", "Category", "Dosage Form", "Strength", "Manufacturer", "Indication", "Classification"],
+        "category": ["Category", "Dosage Form", "Manufacturer", "Classification"]
+    },
+    "medicines_detailed": {
+        "keep": ["name", "short_composition1", "short_composition2", "salt_composition", "type",
+                 "pack_size_label", "manufacturer_name", "price", "Is_discontinued", "medicine_desc",
+                 "side_effects", "drug_interactions"],
+        "numeric": ["price"],
+        "category": ["type", "manufacturer_name"]
+    }
+}
+
+
+def file_hash(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def stage_frame(df: pd.DataFrame, schema: Dict, clean: Callable[[str], str]) -> pd.DataFrame:
+    """Apply a source schema: prune columns, clean text columns and convert types"""
+    for column in schema.get("clean", []):
+        if column not in df.columns:
+            df[column] = ""
+        df[column] = df[column].map(clean).astype(object)
+
+    if not schema.get("keep_all"):
+        keep = schema.get("clean", []) + [c for c in schema.get("keep", []) if c in df.columns]
+        df = df[keep]
+    if schema.get("int8_rest"):
+        for column in df.columns:
+            if column not in schema.get("clean", []):
+                df[column] = pd.to_numeric(df[column], errors="coerce").fillna(0).astype("int8")
+    for column in schema.get("numeric", []):
+        if column in df.columns:
+            df[column] = pd.to_numeric(df[column], errors="coerce")
+    for column in schema.get("category", []):
+        if column in df.columns:
+            df[column] = df[column].astype("category")
+    return df
+
+
+class SourceCache:
+    """Reads sources through the Parquet cache, staging them on a miss"""
+
+    def __init__(self, cache_dir: Optional[str], clean: Callable[[str], str]):
+        self.cache_dir = cache_dir if PARQUET_AVAILABLE else None
+        self.clean = clean
+        self.hits = 0
+        self.misses = 0
+        if cache_dir and not PARQUET_AVAILABLE:
+            print("pyarrow is not installed; cleaned sources will not be cached")
+
+    def get_stats(self) -> Dict:
+        return {"cache_dir": self.cache_dir, "hits": self.hits, "misses": self.misses}
+
+    def _paths(self, key: str):
+        return (os.path.join(self.cache_dir, f"{key}.parquet"),
+                os.path.join(self.cache_dir, f"{key}.json"))
+
+    def _fingerprint(self, file_path: str, manifest: Dict) -> Dict:
+        """Current fingerprint, reusing the manifest's hash when size and mtime match"""
+        stat = os.stat(file_path)
+        fingerprint = {"version": CACHE_VERSION, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        if all(manifest.get(k) == v for k, v in fingerprint.items()):
+            fingerprint["sha256"] = manifest.get("sha256")
+        else:
+            fingerprint["sha256"] = file_hash(file_path)
+        return fingerprint
+
+    def read(self, file_path: str, key: str) -> pd.DataFrame:
+        """Cleaned, typed frame for the source CSV with the given config.CSV_FILES key"""
+        if self.cache_dir is None:
+            return stage_frame(pd.read_csv(file_path), SOURCE_SCHEMAS[key], self.clean)
+
+        parquet_path, manifest_path = self._paths(key)
+        manifest = {}
+        if os.path.exists(manifest_path):
+            with open(manifest_path, 'r') as f:
+                manifest = json.load(f)
+        fingerprint = self._fingerprint(file_path, manifest)
+
+        if os.path.exists(parquet_path) and manifest.get("sha256") == fingerprint["sha256"] \
+                and manifest.get("version") == CACHE_VERSION:
+            self.hits += 1
+            if manifest.get("mtime_ns") != fingerprint["mtime_ns"]:
+                self._write_manifest(manifest_path, fingerprint)  # Touched but unchanged
+            return pd.read_parquet(parquet_path)
+
+        self.misses += 1
+        df = stage_frame(pd.read_csv(file_path), SOURCE_SCHEMAS[key], self.clean)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{parquet_path}.{os.getpid()}.tmp"
+        try:
+            df.to_parquet(tmp_path)
+        except Exception as e:  # e.g. a column mixing numbers and strings
+            print(f"Could not cache {os.path.basename(file_path)}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return df
+        os.replace(tmp_path, parquet_path)
+        self._write_manifest(manifest_path, fingerprint)
+        print(f"Cached cleaned {os.path.basename(file_path)} ({len(df)} rows)")
+        return df
+
+    def _write_manifest(self, manifest_path: str, fingerprint: Dict):
+        tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(fingerprint, f)
+        os.replace(tmp_path, manifest_path)
@@ -0,0 +1,261 @@
+"""
+Synthetic corpus generator for the Medical RAG System
+Writes CSV files shaped like every entry in config.CSV_FILES, for benchmarks and offline tests
+"""
+import argparse
+import csv
+import json
+import os
+import random
+from collections import deque
+from typing import Callable, Dict, List
+import config
+
+DISEASES = [
+    "Fungal infection", "Allergy", "GERD", "Chronic cholestasis", "Drug Reaction", "Peptic ulcer disease",
+    "AIDS", "Diabetes", "Gastroenteritis", "Bronchial Asthma", "Hypertension", "Migraine",
+    "Cervical spondylosis", "Paralysis (brain hemorrhage)", "Jaundice", "Malaria", "Chicken pox",
+    "Dengue", "Typhoid", "Hepatitis A", "Hepatitis B", "Tuberculosis", "Common Cold", "Pneumonia",
+    "Heart attack", "Varicose veins", "Hypothyroidism", "Hyperthyroidism", "Hypoglycemia",
+    "Osteoarthristis", "Arthritis", "Acne", "Urinary tract infection", "Psoriasis", "Impetigo"
+]
+
+SYMPTOMS = [
+    "itching", "skin_rash", "nodal_skin_eruptions", "continuous_sneezing", "shivering", "chills",
+    "joint_pain", "stomach_pain", "acidity", "ulcers_on_tongue", "muscle_wasting", "vomiting",
+    "burning_micturition", "fatigue", "weight_gain", "anxiety", "cold_hands_and_feets", "mood_swings",
+    "weight_loss", "restlessness", "lethargy", "patches_in_throat", "irregular_sugar_level", "cough",
+    "high_fever", "sunken_eyes", "breathlessness", "sweating", "dehydration", "indigestion",
+    "headache", "yellowish_skin", "dark_urine", "nausea", "loss_of_appetite", "pain_behind_the_eyes",
+    "back_pain", "constipation", "abdominal_pain", "diarrhoea", "mild_fever", "yellow_urine",
+    "chest_pain", "dizziness", "blurred_and_distorted_vision", "excessive_hunger", "neck_pain"
+]
+NUM_SYMPTOM_COLUMNS = 132
+
+PRECAUTIONS = [
+    "drink plenty of water", "avoid oily food", "consult doctor", "take rest", "use clean cloths",
+    "keep infected area dry", "avoid fatty spicy food", "exercise", "meditation", "get proper sleep",
+    "wash hands regularly", "avoid cold food", "eat healthy", "stop alcohol consumption", "use heating pad"
+]
+
+MEDICINE_STEMS = ["Paracet", "Amoxi", "Ibupro", "Cetiri", "Metfor", "Atorva", "Azithro", "Pantopra",
+                  "Losar", "Omepra", "Diclo", "Montelu", "Levocet", "Cefix", "Dolo", "Telmi"]
+MEDICINE_SUFFIXES = ["mol", "cillin", "fen", "zine", "min", "statin", "mycin", "zole", "tan", "nac"]
+CATEGORIES = ["Antibiotic", "Analgesic", "Antipyretic", "Antidiabetic", "Antihistamine", "Antiviral",
+              "Antifungal", "Antiseptic", "Antidepressant", "Antihypertensive"]
+DOSAGE_FORMS = ["Tablet", "Capsule", "Syrup", "Injection", "Cream", "Ointment", "Drops", "Inhaler"]
+MANUFACTURERS = ["Sun Pharmaceutical Industries Ltd", "Cipla Ltd", "Mankind Pharma Ltd", "Lupin Ltd",
+                 "Alkem Laboratories Ltd", "Zydus Cadila", "Pfizer Inc", "Abbott", "Torrent Pharmaceuticals Ltd"]
+INDICATIONS = ["Fever", "Pain", "Infection", "Diabetes", "Allergy", "Hypertension", "Depression", "Wound"]
+CLASSIFICATIONS = ["Prescription", "Over-the-Counter"]
+SALTS = ["Paracetamol (500mg)", "Amoxycillin (500mg)", "Ibuprofen (400mg)", "Cetirizine (10mg)",
+         "Metformin (500mg)", "Atorvastatin (10mg)", "Azithromycin (500mg)", "Pantoprazole (40mg)",
+         "Losartan (50mg)", "Clavulanic Acid (125mg)", "Montelukast (10mg)", "Levocetirizine (5mg)"]
+SIDE_EFFECTS = ["Nausea", "Vomiting", "Headache", "Diarrhea", "Dizziness", "Rash", "Sleepiness",
+                "Stomach pain", "Dry mouth", "Fatigue"]
+INTERACTION_EFFECTS = ["MAJOR", "MODERATE", "MINOR"]
+QTYPES = ["information", "symptoms", "treatment", "causes", "prevention", "susceptibility",
+          "exams and tests", "outlook", "complications", "frequency"]
+SECTION_HEADERS = ["GENHX", "MEDICATIONS", "CC", "PASTMEDICALHX", "FAM/SOCHX", "ROS", "ASSESSMENT", "PLAN"]
+
+PATIENT_LINES = [
+    "I have had a {s} for about {d} days now.", "The {s} gets worse at night.",
+    "I also noticed some {s} since last week.", "Should I be worried about the {s}?",
+    "I took something for the {s} but it did not help much."
+]
+DOCTOR_LINES = [
+    "How long have you had the {s}?", "Any history of {dz} in your family?",
+    "I would like to run a few tests to rule out {dz}.", "Are you taking any medication for it?",
+    "Let us start you on {m} and see how the {s} responds."
+]
+
+
+def _symptom_name(index: int) -> str:
+    return SYMPTOMS[index] if index < len(SYMPTOMS) else f"symptom_{index}"
+
+
+def _medicine_name(rng: random.Random, index: int) -> str:
+    return f"{rng.choice(MEDICINE_STEMS)}{rng.choice(MEDICINE_SUFFIXES)} {rng.choice([100, 250, 500, 650])} {index}"
+
+
+def _sentence(rng: random.Random, templates: List[str]) -> str:
+    return rng.choice(templates).format(
+        s=rng.choice(SYMPTOMS).replace('_', ' '), d=rng.randint(1, 14),
+        dz=rng.choice(DISEASES), m=rng.choice(SALTS).split(' ')[0]
+    )
+
+
+def dialogue_row(rng: random.Random, index: int) -> Dict:
+    turns = []
+    for _ in range(rng.randint(3, 12)):
+        turns.append(f"Doctor: {_sentence(rng, DOCTOR_LINES)}")
+        turns.append(f"Patient: {_sentence(rng, PATIENT_LINES)}")
+    return {
+        "ID": index,
+        "section_header": rng.choice(SECTION_HEADERS),
+        "section_text": f"The patient reports {rng.choice(SYMPTOMS).replace('_', ' ')} consistent with {rng.choice(DISEASES)}.",
+        "dialogue": "\n".join(turns)
+    }
+
+
+def description_row(rng: random.Random, index: int) -> Dict:
+    disease = f"{DISEASES[index % len(DISEASES)]} {index // len(DISEASES)}" if index >= len(DISEASES) else DISEASES[index]
+    return {
+        "Disease": disease,
+        "Description": f"{disease} is a condition commonly presenting with "
+                       f"{rng.choice(SYMPTOMS).replace('_', ' ')} and {rng.choice(SYMPTOMS).replace('_', ' ')}. "
+                       f"It may progress if untreated and often requires medical evaluation."
+    }
+
+
+def precaution_row(rng: random.Random, index: int) -> Dict:
+    row = {"Disease": description_row(rng, index)["Disease"]}
+    for i, precaution in enumerate(rng.sample(PRECAUTIONS, 4), 1):
+        row[f"Precaution_{i}"] = precaution
+    return row
+
+
+def qna_row(rng: random.Random, index: int) -> Dict:
+    disease = rng.choice(DISEASES)
+    qtype = rng.choice(QTYPES)
+    answer = " ".join(
+        f"{disease} {rng.choice(['can cause', 'is associated with', 'may lead to'])} "
+        f"{rng.choice(SYMPTOMS).replace('_', ' ')}."
+        for _ in range(rng.randint(3, 30))
+    )
+    return {"qtype": qtype, "Question": f"What are the {qtype} for {disease} ({index}) ?", "Answer": answer}
+
+
+def symptom_row(rng: random.Random, index: int) -> Dict:
+    active = set(rng.sample(range(NUM_SYMPTOM_COLUMNS), rng.randint(3, 8)))
+    row = {_symptom_name(i): int(i in active) for i in range(NUM_SYMPTOM_COLUMNS)}
+    row["prognosis"] = rng.choice(DISEASES)
+    return row
+
+
+def basic_medicine_row(rng: random.Random, index: int) -> Dict:
+    return {
+        "Name": _medicine_name(rng, index),
+        "Category": rng.choice(CATEGORIES),
+        "Dosage Form": rng.choice(DOSAGE_FORMS),
+        "Strength": f"{rng.choice([5, 10, 50, 100, 250, 500])} mg",
+        "Manufacturer": rng.choice(MANUFACTURERS),
+        "Indication": rng.choice(INDICATIONS),
+        "Classification": rng.choice(CLASSIFICATIONS)
+    }
+
+
+def detailed_medicine_row(rng: random.Random, index: int) -> Dict:
+    salts = rng.sample(SALTS, rng.randint(1, 2))
+    drugs = rng.sample(SALTS, rng.randint(0, 3))
+    interactions = {
+        "drug": [d.split(' ')[0] for d in drugs],
+        "brand": [_medicine_name(rng, rng.randint(0, 10 ** 6)) for _ in drugs],
+        "effect": [rng.choice(INTERACTION_EFFECTS) for _ in drugs]
+    }
+    return {
+        "id": index + 1,
+        "name": _medicine_name(rng, index),
+        "price": round(rng.uniform(5, 2000), 2),
+        "Is_discontinued": rng.random() < 0.05,
+        "manufacturer_name": rng.choice(MANUFACTURERS),
+        "type": "allopathy",
+        "pack_size_label": f"{rng.choice(['strip', 'bottle', 'vial', 'tube'])} of {rng.choice([1, 10, 15, 100])}",
+        "short_composition1": salts[0],
+        "short_composition2": salts[1] if len(salts) > 1 else "",
+        "salt_composition": " + ".join(salts),
+        "medicine_desc": f"Used in the treatment of {rng.choice(INDICATIONS).lower()}.",
+        "side_effects": ",".join(rng.sample(SIDE_EFFECTS, 3)),
+        "drug_interactions": json.dumps(interactions)
+    }
+
+
+ROW_BUILDERS: Dict[str, Callable[[random.Random, int], Dict]] = {
+    "dialogues": dialogue_row,
+    "descriptions": description_row,
+    "precautions": precaution_row,
+    "qna": qna_row,
+    "symptoms": symptom_row,
+    "medicines_basic": basic_medicine_row,
+    "medicines_detailed": detailed_medicine_row
+}
+
+
+def near_duplicate_dialogue(rng: random.Random, row: Dict, index: int) -> Dict:
+    turns = row["dialogue"].split("\n")
+    turns[-1] = f"Patient: {_sentence(rng, PATIENT_LINES)}"
+    return dict(row, ID=index, dialogue="\n".join(turns))
+
+
+def near_duplicate_symptoms(rng: random.Random, row: Dict, index: int) -> Dict:
+    active = [name for name, value in row.items() if value == 1]
+    if len(active) > 3:
+        return dict(row, **{rng.choice(active): 0})
+    return dict(row, **{_symptom_name(rng.randrange(NUM_SYMPTOM_COLUMNS)): 1})
+
+
+def near_duplicate_basic_medicine(rng: random.Random, row: Dict, index: int) -> Dict:
+    return dict(row, Strength=f"{rng.choice([5, 10, 50, 100, 250, 500])} mg")
+
+
+# Sources that can repeat a recent row with a small edit, like the real datasets do
+NEAR_DUPLICATE_BUILDERS: Dict[str, Callable[[random.Random, Dict, int], Dict]] = {
+    "dialogues": near_duplicate_dialogue,
+    "symptoms": near_duplicate_symptoms,
+    "medicines_basic": near_duplicate_basic_medicine
+}
+RECENT_ROWS = 100  # Rows a near-duplicate may copy
+
+
+def write_source(key: str, output_dir: str, rows: int, seed: int = 0, duplicate_rate: float = 0.0) -> str:
+    """Write one synthetic source file and return its path.
+
+    duplicate_rate is the fraction of rows that are near-duplicates of a recent row
+    (for sources in NEAR_DUPLICATE_BUILDERS).
+    """
+    rng = random.Random(f"{seed}:{key}")
+    builder = ROW_BUILDERS[key]
+    duplicate_builder = NEAR_DUPLICATE_BUILDERS.get(key) if duplicate_rate else None
+    recent = deque(maxlen=RECENT_ROWS)
+    path = os.path.join(output_dir, config.CSV_FILES[key])
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = None
+        for index in range(rows):
+            if duplicate_builder and recent and rng.random() < duplicate_rate:
+                row = duplicate_builder(rng, rng.choice(recent), index)
+            else:
+                row = builder(rng, index)
+            if duplicate_builder:
+                recent.append(row)
+            if writer is None:
+                writer = csv.DictWriter(f, fieldnames=list(row.keys()))
+                writer.writeheader()
+            writer.writerow(row)
+    return path
+
+
+def generate_corpus(output_dir: str, rows: int, seed: int = 0,
+                    sources: List[str] = None, duplicate_rate: float = 0.0) -> Dict[str, str]:
+    """Generate synthetic CSVs for every configured source.
+
+    Returns a mapping of config.CSV_FILES key to written path.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    paths = {}
+    for key in sources or config.CSV_FILES:
+        print(f"Generating {rows} rows for {config.CSV_FILES[key]}...")
+        paths[key] = write_source(key, output_dir, rows, seed, duplicate_rate)
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic medical corpus")
+    parser.add_argument("--output-dir", default="synthetic_data")
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--duplicate-rate", type=float, default=0.0,
+                        help="Fraction of dialogue, symptom and basic medicine rows that are near-duplicates")
+    args = parser.parse_args()
+
+    generate_corpus(args.output_dir, args.rows, args.seed, duplicate_rate=args.duplicate_rate)
+    print(f"Synthetic corpus written to {args.output_dir}")
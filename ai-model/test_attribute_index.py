@@ -0,0 +1,102 @@
+"""
+Tests for the medicine attribute index and its Chroma where-clause fallback
+"""
+import numpy as np
+import pytest
+from attribute_index import AttributeIndex, chroma_where, validate_filters
+from document_batch import DocumentBatch
+
+DOCUMENTS = [
+    {"id": "basic_para", "document": "Paracetamol tablet",
+     "metadata": {"type": "medicine_basic", "medicine_name": "Paracetamol", "price": 20.0,
+                  "dosage_form": "Tablet", "category": "Analgesic", "manufacturer": "Acme"},
+     "embedding": [1.0, 0.0, 0.0]},
+    {"id": "detail_ibu", "document": "Ibuprofen tablet",
+     "metadata": {"type": "medicine_detailed", "medicine_name": "Ibuprofen", "price": 80.0,
+                  "is_discontinued": False, "medicine_type": "allopathy", "manufacturer": "Acme Labs"},
+     "embedding": [0.8, 0.6, 0.0]},
+    {"id": "detail_old", "document": "Old syrup",
+     "metadata": {"type": "medicine_detailed", "medicine_name": "Old", "price": 40.0,
+                  "is_discontinued": True, "medicine_type": "allopathy", "manufacturer": "Acme Labs"},
+     "embedding": [0.0, 1.0, 0.0]},
+    {"id": "detail_noprice", "document": "Unpriced capsule",
+     "metadata": {"type": "medicine_detailed", "medicine_name": "Unpriced",
+                  "is_discontinued": False, "medicine_type": "ayurveda", "manufacturer": "Herbal Co"},
+     "embedding": [0.0, 0.0, 1.0]},
+    {"id": "faq_1", "document": "Q: fever? A: rest",
+     "metadata": {"type": "faq"}, "embedding": [1.0, 0.0, 0.0]},
+]
+
+
+@pytest.fixture
+def index():
+    return AttributeIndex.build(DocumentBatch.from_dicts(DOCUMENTS))
+
+
+def matching_ids(index: AttributeIndex, filters, doc_types=None):
+    return sorted(str(index.ids[row]) for row in index.candidates(filters, doc_types))
+
+
+def test_build_keeps_only_medicines(index):
+    assert sorted(index.ids.tolist()) == ["basic_para", "detail_ibu", "detail_noprice", "detail_old"]
+    assert index.embeddings.shape == (4, 3)
+
+
+def test_available_only_keeps_medicines_without_discontinuation_data(index):
+    assert matching_ids(index, {"available_only": True}) == ["basic_para", "detail_ibu", "detail_noprice"]
+
+
+def test_price_range_excludes_unpriced_rows(index):
+    assert matching_ids(index, {"min_price": 30, "max_price": 100}) == ["detail_ibu", "detail_old"]
+    assert matching_ids(index, {"max_price": "25"}) == ["basic_para"]
+
+
+def test_categoricals_match_case_and_whitespace_insensitively(index):
+    assert matching_ids(index, {"manufacturer": "  acme   LABS"}) == ["detail_ibu", "detail_old"]
+    assert matching_ids(index, {"medicine_type": ["Ayurveda", "unknown"]}) == ["detail_noprice"]
+    assert matching_ids(index, {"dosage_form": "tablet"}, doc_types=["medicine_detailed"]) == []
+
+
+def test_filters_combine(index):
+    assert matching_ids(index, {"available_only": True, "manufacturer": "Acme Labs", "max_price": 100}) == \
+        ["detail_ibu"]
+
+
+def test_search_ranks_candidates_by_similarity(index):
+    rows = index.candidates({"available_only": True})
+    hits = index.search([1.0, 0.0, 0.0], rows, 2, "cosine")
+    assert [doc_id for doc_id, _ in hits] == ["basic_para", "detail_ibu"]
+    assert hits[0][1] == pytest.approx(1.0)
+    assert index.search([1.0, 0.0, 0.0], np.array([], dtype=np.int64), 2, "cosine") == []
+
+
+def test_save_and_load_round_trip(index, tmp_path):
+    index.save(str(tmp_path))
+    loaded = AttributeIndex.load(str(tmp_path))
+    assert matching_ids(loaded, {"available_only": True, "max_price": 50}) == ["basic_para"]
+    assert AttributeIndex.load(str(tmp_path / "missing")) is None
+
+
+def test_validate_filters_rejects_unknown_names_and_bad_numbers():
+    with pytest.raises(ValueError, match="Unknown filters"):
+        validate_filters({"colour": "red"})
+    with pytest.raises(ValueError, match="max_price"):
+        validate_filters({"max_price": "cheap"})
+    assert validate_filters({"max_price": "10.5"}) == {"max_price": "10.5"}
+
+
+def test_chroma_where_matches_attribute_index():
+    chromadb = pytest.importorskip("chromadb")
+    collection = chromadb.EphemeralClient().get_or_create_collection("attribute_index_test")
+    collection.add(ids=[doc["id"] for doc in DOCUMENTS],
+                   embeddings=[doc["embedding"] for doc in DOCUMENTS],
+                   metadatas=[doc["metadata"] for doc in DOCUMENTS],
+                   documents=[doc["document"] for doc in DOCUMENTS])
+
+    def where_ids(filters):
+        return sorted(collection.get(where=chroma_where(filters))["ids"])
+
+    assert where_ids({}) == ["basic_para", "detail_ibu", "detail_noprice", "detail_old"]
+    assert where_ids({"available_only": True}) == ["basic_para", "detail_ibu", "detail_noprice"]
+    assert where_ids({"available_only": True, "max_price": 50}) == ["basic_para"]
+    assert where_ids({"manufacturer": "Acme Labs"}) == ["detail_ibu", "detail_old"]
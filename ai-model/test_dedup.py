@@ -0,0 +1,80 @@
+"""
+Tests for MinHash-LSH near-duplicate compaction and its reversal
+"""
+import numpy as np
+import pytest
+from dedup import (COUNT_KEY, IDS_KEY, MEMBER_KEY, MinHasher, compact, expand, find_duplicates,
+                   jaccard, lsh_params, shingles)
+from document_batch import DocumentBatch
+
+
+def precaution(doc_id: str, disease: str, text: str) -> dict:
+    return {"id": doc_id, "document": text, "metadata": {"type": "precaution", "disease": disease},
+            "embedding": [float(len(text)), 1.0]}
+
+
+DOCUMENTS = [
+    precaution("p1", "Malaria", "Precautions for Malaria: use mosquito nets, keep water clean, consult doctor"),
+    precaution("p2", "Malaria", "Precautions for Malaria: use mosquito nets, keep water clean, consult a doctor"),
+    precaution("p3", "Malaria", "Precautions for Malaria: use mosquito nets, keep water clean, consult doctor"),
+    # Same text for another disease: must stay separate
+    precaution("p4", "Dengue", "Precautions for Malaria: use mosquito nets, keep water clean, consult doctor"),
+    precaution("p5", "Malaria", "Drink fluids, rest, take paracetamol for fever and avoid aspirin"),
+    {"id": "d1", "document": "Precautions for Malaria: use mosquito nets, keep water clean, consult doctor",
+     "metadata": {"type": "dialogue", "section_header": "GENHX"}, "embedding": [1.0, 0.0]},
+]
+
+
+@pytest.fixture
+def documents():
+    return DocumentBatch.from_dicts(DOCUMENTS)
+
+
+def test_shingles_ignore_case_and_punctuation():
+    assert np.array_equal(shingles("Use mosquito NETS!", 2), shingles("use, mosquito nets", 2))
+    assert jaccard(shingles("a b c d", 1), shingles("a b c e", 1)) == pytest.approx(3 / 5)
+
+
+def test_minhash_estimates_jaccard():
+    hasher = MinHasher(num_perm=256)
+    a = shingles(" ".join(f"w{i}" for i in range(100)), 1)
+    b = shingles(" ".join(f"w{i}" for i in range(20, 120)), 1)
+    estimate = np.mean(hasher.signature(a) == hasher.signature(b))
+    assert estimate == pytest.approx(jaccard(a, b), abs=0.1)
+
+
+def test_lsh_params_separate_pairs_around_threshold():
+    bands, rows = lsh_params(0.8, 128)
+    assert bands * rows <= 128
+
+    def collides(similarity):
+        return 1 - (1 - similarity ** rows) ** bands
+
+    assert collides(0.95) > 0.99
+    assert collides(0.5) < 0.01
+
+
+def test_groups_only_near_duplicates_with_matching_keys(documents):
+    groups = find_duplicates(documents, threshold=0.8, types=["precaution", "dialogue"])
+    grouped_ids = {documents.ids[rep]: sorted(documents.ids[row] for row in rows) for rep, rows in groups.items()}
+    # The longest text represents its group
+    assert grouped_ids == {"p2": ["p1", "p3"]}
+
+
+def test_types_not_listed_are_never_compacted(documents):
+    assert find_duplicates(documents, threshold=0.8, types=["dialogue"]) == {}
+
+
+def test_compact_and_expand_round_trip(documents):
+    compacted, members, stats = compact(documents, threshold=0.8, types=["precaution"])
+
+    assert compacted.ids == ["p2", "p4", "p5", "d1"]
+    assert members.ids == ["p1", "p3"]
+    representative = compacted.metadata(0)
+    assert (representative[COUNT_KEY], representative[IDS_KEY]) == (2, "p1,p3")
+    assert all(members.metadata(i)[MEMBER_KEY] == "p2" for i in range(len(members)))
+    assert (stats["removed"], stats["groups"]) == (2, 1)
+    assert stats["shrinkage"] == pytest.approx(2 / 6)
+
+    restored = expand(compacted, members)
+    assert sorted(restored.to_dicts(), key=lambda doc: doc["id"]) == sorted(DOCUMENTS, key=lambda doc: doc["id"])
@@ -0,0 +1,62 @@
+"""
+Tests for the Aho-Corasick entity matcher
+"""
+from document_batch import DocumentBatch
+from entity_matcher import EntityMatcher, entity_names, normalize_text
+
+
+def matcher(**entities) -> EntityMatcher:
+    return EntityMatcher({name.replace("_", " "): ids for name, ids in entities.items()})
+
+
+def test_entity_names_strip_strengths_and_add_disease_aliases():
+    assert entity_names("composition", "Paracetamol (500mg)") == ["paracetamol"]
+    assert entity_names("disease", "Dimorphic hemmorhoids(piles)") == \
+        ["dimorphic hemmorhoids", "piles", "dimorphic hemmorhoids piles"]
+    assert entity_names("disease", "TB") == []  # Too short
+    assert entity_names("medicine_name", float("nan")) == []
+
+
+def test_finds_every_name_in_one_pass():
+    names = matcher(malaria=["d1"], paracetamol=["m1"], dengue=["d2"])
+    assert names.find("Is paracetamol safe with Malaria, or dengue?") == \
+        [(3, "paracetamol"), (25, "malaria"), (36, "dengue")]
+
+
+def test_matches_whole_words_only():
+    names = matcher(ache=["d1"], heart=["d2"])
+    assert names.find("headache and heartburn") == []
+    assert names.find("an ache in the heart") == [(3, "ache"), (15, "heart")]
+
+
+def test_prefers_leftmost_longest_non_overlapping_matches():
+    names = matcher(heart=["d1"], heart_attack=["d2"], attack=["d3"])
+    assert names.find("signs of a heart attack") == [(11, "heart attack")]
+
+
+def test_overlapping_names_found_through_failure_links():
+    # "abcd" fails partway into "bcx"; the automaton must fall back to "bc" without rescanning
+    names = matcher(abcd=["x1"], bc=["x2"])
+    assert names.find("abc bc") == [(4, "bc")]
+
+
+def test_match_ids_take_turns_between_names():
+    names = matcher(malaria=["d1", "d2", "d3"], paracetamol=["m1", "m2"])
+    assert names.match_ids("malaria and paracetamol", limit=4) == ["d1", "m1", "d2", "m2"]
+    assert names.match_ids("nothing known here") == []
+
+
+def test_build_save_and_load(tmp_path):
+    documents = DocumentBatch.from_dicts([
+        {"id": "desc_malaria", "document": "...", "metadata": {"type": "disease_description", "disease": "Malaria"}},
+        {"id": "prec_malaria", "document": "...", "metadata": {"type": "precaution", "disease": "Malaria"}},
+        {"id": "med_1", "document": "...", "metadata": {"type": "medicine_basic", "medicine_name": "Crocin",
+                                                         "composition": "Paracetamol (500mg)"}},
+    ])
+    built = EntityMatcher.build(documents, max_docs_per_name=1)
+    assert built.entities == {"malaria": ["desc_malaria"], "crocin": ["med_1"], "paracetamol": ["med_1"]}
+
+    built.save(str(tmp_path / "entities"))
+    loaded = EntityMatcher.load(str(tmp_path / "entities"))
+    assert loaded.match_ids(normalize_text("Crocin for MALARIA?")) == ["med_1", "desc_malaria"]
+    assert EntityMatcher.load(str(tmp_path / "missing")) is None
@@ -0,0 +1,96 @@
+"""
+Tests for the generation layer: circuit breaker and deadline-bounded generation, offline with FakeProvider
+"""
+import time
+import pytest
+from generation import (CircuitBreaker, CircuitOpenError, FakeProvider, GenerationError,
+                        GenerationProvider, GenerationTimeout, ResilientGenerator)
+
+
+class SlowProvider(GenerationProvider):
+    """Answers after `seconds`, ignoring the timeout it is given"""
+    name = "slow"
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+
+    def generate(self, prompt: str, timeout: float) -> str:
+        time.sleep(self.seconds)
+        return "late"
+
+
+def test_breaker_opens_at_failure_rate_after_min_calls():
+    breaker = CircuitBreaker(window_size=10, failure_rate=0.5, min_calls=4, open_seconds=60)
+    for _ in range(3):
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED  # Fewer than min_calls outcomes
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    assert 0 < breaker.retry_after() <= 60
+
+
+def test_breaker_stays_closed_below_failure_rate():
+    breaker = CircuitBreaker(window_size=10, failure_rate=0.5, min_calls=4, open_seconds=60)
+    for _ in range(6):
+        breaker.record_success()
+    for _ in range(4):
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.get_stats()['window_failure_rate'] == pytest.approx(0.4)
+
+
+def test_half_open_allows_one_trial_and_closes_on_success():
+    breaker = CircuitBreaker(window_size=4, failure_rate=0.5, min_calls=2, open_seconds=0.05)
+    breaker.record_failure()
+    breaker.record_failure()
+    time.sleep(0.06)
+
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()  # Only one trial call at a time
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.get_stats()['window_calls'] == 1
+
+
+def test_failed_trial_reopens():
+    breaker = CircuitBreaker(window_size=4, failure_rate=0.5, min_calls=2, open_seconds=0.05)
+    breaker.record_failure()
+    breaker.record_failure()
+    time.sleep(0.06)
+
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.get_stats()['times_opened'] == 2
+
+
+def test_generator_returns_fake_response():
+    generator = ResilientGenerator(FakeProvider(latency_ms=1, jitter_ms=0, failure_rate=0), hedge_enabled=False)
+    text = generator.generate("CURRENT PATIENT QUESTION: fever and cough")
+    assert "fever and cough" in text
+    assert generator.get_stats()['successes'] == 1
+
+
+def test_generator_failures_open_breaker_and_fail_fast():
+    breaker = CircuitBreaker(window_size=4, failure_rate=0.5, min_calls=2, open_seconds=60)
+    generator = ResilientGenerator(FakeProvider(latency_ms=1, jitter_ms=0, failure_rate=1.0),
+                                   hedge_enabled=False, breaker=breaker)
+    for _ in range(2):
+        with pytest.raises(GenerationError):
+            generator.generate("question")
+
+    with pytest.raises(CircuitOpenError):
+        generator.generate("question")
+    stats = generator.get_stats()
+    assert (stats['failures'], stats['rejected']) == (2, 1)
+
+
+def test_generator_gives_up_at_deadline():
+    generator = ResilientGenerator(SlowProvider(0.5), hedge_enabled=False)
+    start = time.monotonic()
+    with pytest.raises(GenerationTimeout):
+        generator.generate("question", deadline_seconds=0.05)
+    assert time.monotonic() - start < 0.4
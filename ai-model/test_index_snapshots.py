@@ -0,0 +1,119 @@
+"""
+Tests for index snapshot publishing, hot-swap and garbage collection of old versions
+"""
+import json
+import os
+import subprocess
+import sys
+import pytest
+from index_snapshots import IN_USE_DIR, SnapshotManager, current_version, list_versions, publish_version
+
+
+class FakeDB:
+    def __init__(self, version: str):
+        self.version = version
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeClient:
+    def __init__(self):
+        self.vector_db = FakeDB(None)
+
+    def swap_index(self, vector_db):
+        previous, self.vector_db = self.vector_db, vector_db
+        return previous
+
+
+class FakeSnapshotManager(SnapshotManager):
+    """Opens versions as FakeDBs instead of loading Chroma collections"""
+
+    def open_version(self, version: str):
+        return FakeDB(version)
+
+
+def make_versions(root, *versions):
+    for version in versions:
+        os.makedirs(os.path.join(root, version))
+
+
+def record_in_use(root, pid: int, versions):
+    os.makedirs(os.path.join(root, IN_USE_DIR), exist_ok=True)
+    with open(os.path.join(root, IN_USE_DIR, str(pid)), 'w') as f:
+        json.dump(versions, f)
+
+
+def exited_pid() -> int:
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+@pytest.fixture
+def root(tmp_path):
+    return str(tmp_path / "snapshots")
+
+
+def test_publish_points_current_at_version(root):
+    make_versions(root, "v1")
+    assert current_version(root) is None
+    publish_version(os.path.join(root, "v1"))
+    assert current_version(root) == "v1"
+
+
+def test_swap_keeps_retired_version_for_grace_period(root):
+    make_versions(root, "v1", "v2")
+    client = FakeClient()
+    manager = FakeSnapshotManager(client, root=root, grace_seconds=3600, probe_queries=["q"])
+    publish_version(os.path.join(root, "v1"))
+    manager.check()
+    publish_version(os.path.join(root, "v2"))
+    manager.check()
+
+    assert client.vector_db.version == "v2"
+    assert manager.get_stats()['retired_versions'] == ["v1"]
+    assert list_versions(root) == ["v1", "v2"]  # v1 is still held by this process
+
+
+def test_expired_version_is_closed_and_deleted(root):
+    make_versions(root, "v1", "v2")
+    client = FakeClient()
+    manager = FakeSnapshotManager(client, root=root, grace_seconds=0, probe_queries=["q"])
+    publish_version(os.path.join(root, "v1"))
+    manager.check()
+    first_db = client.vector_db
+    publish_version(os.path.join(root, "v2"))
+    manager.check()
+
+    assert first_db.closed
+    assert list_versions(root) == ["v2"]
+
+
+def test_versions_held_by_live_processes_are_kept(root):
+    make_versions(root, "v1", "v2", "v3", "v4")
+    record_in_use(root, os.getppid(), ["v1"])
+    record_in_use(root, exited_pid(), ["v2"])
+    publish_version(os.path.join(root, "v3"))
+    manager = FakeSnapshotManager(FakeClient(), root=root, grace_seconds=0, probe_queries=["q"])
+
+    manager.collect_garbage()
+
+    # v2's holder has exited; v4 is newer than the published version, so it may still be building
+    assert list_versions(root) == ["v1", "v3", "v4"]
+    assert sorted(os.listdir(os.path.join(root, IN_USE_DIR))) == sorted([str(os.getppid()), str(os.getpid())])
+
+
+def test_removed_version_is_not_activated(root):
+    make_versions(root, "v1")
+    publish_version(os.path.join(root, "v1"))
+    os.rmdir(os.path.join(root, "v1"))
+    client = FakeClient()
+    manager = FakeSnapshotManager(client, root=root, probe_queries=["q"])
+
+    manager.check()
+
+    assert manager.active_version is None
+    assert "removed" in manager.get_stats()['last_error']
+    assert client.vector_db.version is None
@@ -0,0 +1,79 @@
+"""
+Tests for the CSR drug-interaction graph
+"""
+import json
+import numpy as np
+import pytest
+from interaction_graph import InteractionGraph, normalize_name, parse_interactions
+
+RECORDS = [
+    {"name": "Augmentin 625 Duo Tablet", "salts": ["Amoxycillin (500mg)", "Clavulanic Acid (125mg)"],
+     "interactions": [("Methotrexate", "Folitrax", "MAJOR"), ("Warfarin", "", "MODERATE")]},
+    {"name": "Augmentin 375 Tablet", "salts": ["Amoxycillin (250mg)"],
+     "interactions": [("Warfarin", "Warf", "MINOR")]},
+    {"name": "Crocin Advance", "salts": ["Paracetamol (500mg)"],
+     "interactions": [("Warfarin", "", "MODERATE"), ("Warfarin", "", "MAJOR")]},
+]
+
+
+@pytest.fixture
+def graph():
+    return InteractionGraph.build(RECORDS)
+
+
+def test_parse_interactions_skips_malformed_cells():
+    cell = json.dumps({"drug": ["Warfarin", "", "Aspirin"], "brand": ["Warf"], "effect": ["major"]})
+    assert parse_interactions(cell) == [("Warfarin", "Warf", "MAJOR"), ("Aspirin", "", "UNKNOWN")]
+    assert parse_interactions("not json") == []
+    assert parse_interactions(float("nan")) == []
+
+
+def test_csr_rows_are_sorted_and_symmetric(graph):
+    assert list(graph.keys) == sorted(graph.keys)
+    assert graph.edge_indptr[-1] == len(graph.edge_targets)
+    edges = set()
+    for node in range(len(graph)):
+        row = graph.edge_targets[graph.edge_indptr[node]:graph.edge_indptr[node + 1]]
+        assert list(row) == sorted(row)
+        edges.update((node, int(target)) for target in row)
+    assert all((b, a) in edges for a, b in edges)
+    assert graph.num_interactions == 4
+
+
+def test_duplicate_pairs_keep_the_most_severe_effect(graph):
+    hits = graph.check(["Crocin Advance", "Warfarin"])['interactions']
+    assert [(hit['a'], hit['b'], hit['effect']) for hit in hits] == [("Crocin Advance", "Warfarin", "MAJOR")]
+
+
+def test_brand_and_prefix_names_resolve_to_products(graph):
+    assert normalize_name("Amoxycillin (500mg)") == "amoxycillin"
+    assert len(graph.resolve("augmentin")) == 2  # Both Augmentin products
+    assert graph.resolve("aug") == []  # Too short to expand
+    assert graph.resolve("augmentin", prefix=False) == []
+
+
+def test_check_finds_interactions_through_brands(graph):
+    result = graph.check(["Augmentin 625 Duo Tablet", "Folitrax", "Unknownium"])
+    assert [(hit['a'], hit['b'], hit['effect'], hit['target']) for hit in result['interactions']] == \
+        [("Augmentin 625 Duo Tablet", "Folitrax", "MAJOR", "Methotrexate")]
+    assert result['unknown'] == ["Unknownium"]
+
+
+def test_interactions_of_is_sorted_most_severe_first(graph):
+    hits = graph.interactions_of("Augmentin 625 Duo Tablet")
+    assert [(hit['target'], hit['effect']) for hit in hits] == [("Methotrexate", "MAJOR"), ("Warfarin", "MODERATE")]
+    assert len(graph.interactions_of("Augmentin 625 Duo Tablet", limit=1)) == 1
+
+
+def test_mentions_prefer_longest_names(graph):
+    assert graph.mentions("Can I take crocin advance with warfarin?") == ["crocin advance", "warfarin"]
+    # A single word is never expanded to product names
+    assert graph.mentions("is augmentin safe") == []
+
+
+def test_save_and_load_round_trip(graph, tmp_path):
+    graph.save(str(tmp_path / "graph"))
+    loaded = InteractionGraph.load(str(tmp_path / "graph"))
+    assert np.array_equal(loaded.edge_targets, graph.edge_targets)
+    assert loaded.check(["Crocin Advance", "Warfarin"]) == graph.check(["Crocin Advance", "Warfarin"])
+    assert InteractionGraph.load(str(tmp_path / "missing")) is None
@@ -0,0 +1,88 @@
+"""
+Tests for the shared Chroma server client, against a locally launched `chroma run`
+"""
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import threading
+import time
+import pytest
+
+pytest.importorskip("chromadb")
+httpx = pytest.importorskip("httpx")
+from vector_db_manager import connect_chroma_server, with_retries
+
+CHROMA = shutil.which("chroma") or os.path.join(os.path.dirname(sys.executable), "chroma")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def chroma_server(tmp_path):
+    """(port, start) for a Chroma server that runs once start() is called"""
+    if not os.path.exists(CHROMA):
+        pytest.skip("chroma CLI not installed")
+    port, processes = free_port(), []
+
+    def start():
+        processes.append(subprocess.Popen([CHROMA, "run", "--path", str(tmp_path / "db"), "--port", str(port)],
+                                          stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+
+    yield port, start
+    for process in processes:
+        process.terminate()
+        process.wait()
+
+
+def test_client_retries_until_server_accepts_connections(chroma_server, capsys):
+    port, start = chroma_server
+    threading.Timer(0.5, start).start()
+
+    client = connect_chroma_server(f"localhost:{port}", retries=10, backoff_seconds=0.1)
+
+    assert client.heartbeat() > 0
+    assert "retrying" in capsys.readouterr().out
+
+
+def test_requests_reuse_one_connection(chroma_server):
+    port, start = chroma_server
+    start()
+    client = connect_chroma_server(f"localhost:{port}", retries=10, backoff_seconds=0.1)
+    assert connect_chroma_server(f"localhost:{port}") is client
+
+    collection = client.create_collection("tst")
+    collection.add(ids=["a", "b"], embeddings=[[0.0, 1.0], [1.0, 0.0]], documents=["a", "b"])
+    # Record the local address of the connection behind every response
+    addresses = set()
+    client._target._server._session.event_hooks["response"].append(
+        lambda response: addresses.add(response.extensions["network_stream"].get_extra_info("client_addr")))
+    for _ in range(5):
+        assert collection.count() == 2
+        assert collection.query(query_embeddings=[[0.0, 1.0]], n_results=1)["ids"] == [["a"]]
+
+    assert len(addresses) == 1
+
+
+def test_writes_are_retried_only_when_unsent():
+    calls = []
+
+    def fail_with(error):
+        def call():
+            calls.append(error)
+            if len(calls) == 1:
+                raise error("failed")
+            return "ok"
+        return call
+
+    assert with_retries(fail_with(httpx.ConnectError), idempotent=False, retries=1, backoff_seconds=0) == "ok"
+    calls.clear()
+    with pytest.raises(httpx.ReadTimeout):
+        with_retries(fail_with(httpx.ReadTimeout), idempotent=False, retries=1, backoff_seconds=0)
+    calls.clear()
+    assert with_retries(fail_with(httpx.ReadTimeout), idempotent=True, retries=1, backoff_seconds=0) == "ok"
@@ -0,0 +1,184 @@
+"""
+HNSW index tuner for the Medical RAG System
+Sweeps index parameters on the real corpus, measures recall@k against brute-force NumPy
+ground truth, and recommends the cheapest profile that meets a target recall.
+"""
+import argparse
+import itertools
+import json
+import os
+import shutil
+import tempfile
+import time
+from typing import Dict, List, Tuple
+import numpy as np
+import chromadb
+from chromadb.config import Settings
+import config
+from embeddings import get_encoder
+
+
+def load_corpus_from_collection(db_path: str, collection_name: str,
+                                page_size: int = 5000) -> Tuple[List[str], np.ndarray]:
+    """Read ids and embeddings from an existing Chroma collection"""
+    client = chromadb.PersistentClient(path=db_path, settings=Settings(anonymized_telemetry=False))
+    collection = client.get_collection(name=collection_name)
+    total = collection.count()
+    ids, embeddings = [], []
+    for offset in range(0, total, page_size):
+        page = collection.get(limit=page_size, offset=offset, include=['embeddings'])
+        ids.extend(page['ids'])
+        embeddings.extend(page['embeddings'])
+    return ids, np.asarray(embeddings, dtype=np.float32)
+
+
+def load_corpus_from_json(json_file: str) -> Tuple[List[str], np.ndarray]:
+    """Read ids and embeddings from processed_medical_data.json"""
+    with open(json_file, 'r', encoding='utf-8') as f:
+        documents = json.load(f)
+    ids = [doc['id'] for doc in documents]
+    return ids, np.asarray([doc['embedding'] for doc in documents], dtype=np.float32)
+
+
+def exact_top_k(corpus: np.ndarray, queries: np.ndarray, k: int, space: str) -> np.ndarray:
+    """Brute-force nearest neighbours, returned as row indices into corpus"""
+    if space == "l2":
+        scores = -((queries ** 2).sum(axis=1, keepdims=True) - 2 * queries @ corpus.T
+                   + (corpus ** 2).sum(axis=1))
+    elif space == "cosine":
+        corpus_n = corpus / np.maximum(np.linalg.norm(corpus, axis=1, keepdims=True), 1e-12)
+        queries_n = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        scores = queries_n @ corpus_n.T
+    else:  # ip
+        scores = queries @ corpus.T
+    top = np.argpartition(-scores, kth=min(k, corpus.shape[0] - 1), axis=1)[:, :k]
+    order = np.take_along_axis(scores, top, axis=1).argsort(axis=1)[:, ::-1]
+    return np.take_along_axis(top, order, axis=1)
+
+
+def candidate_params(grid: bool, space: str) -> List[Dict]:
+    """Named profiles, optionally extended with a full parameter grid"""
+    candidates = [dict(params, name=name) for name, params in config.INDEX_PROFILES.items()]
+    if grid:
+        for m, ef_c, ef_s in itertools.product([8, 16, 32, 48], [64, 100, 200], [16, 32, 64, 128, 256]):
+            candidates.append({"name": f"M{m}_efc{ef_c}_efs{ef_s}", "space": space,
+                               "M": m, "ef_construction": ef_c, "ef_search": ef_s})
+    return candidates
+
+
+def evaluate(params: Dict, ids: List[str], corpus: np.ndarray, queries: np.ndarray,
+             truth: np.ndarray, k: int, work_dir: str) -> Dict:
+    """Build an index with params, then measure recall@k and query latency"""
+    path = os.path.join(work_dir, params["name"])
+    client = chromadb.PersistentClient(path=path, settings=Settings(anonymized_telemetry=False))
+    collection = client.create_collection(name="tune", metadata={
+        "hnsw:space": params["space"],
+        "hnsw:M": params["M"],
+        "hnsw:construction_ef": params["ef_construction"],
+        "hnsw:search_ef": params["ef_search"]
+    })
+
+    start = time.perf_counter()
+    for i in range(0, len(ids), 5000):
+        collection.add(ids=ids[i:i + 5000], embeddings=corpus[i:i + 5000].tolist())
+    build_seconds = time.perf_counter() - start
+
+    index_of = {doc_id: row for row, doc_id in enumerate(ids)}
+    latencies, recalls = [], []
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        result = collection.query(query_embeddings=[query.tolist()], n_results=k, include=[])
+        latencies.append(time.perf_counter() - start)
+        found = {index_of[doc_id] for doc_id in result['ids'][0]}
+        recalls.append(len(found & set(expected.tolist())) / len(expected))
+
+    latencies_ms = np.array(latencies) * 1000.0
+    shutil.rmtree(path, ignore_errors=True)
+    return {
+        **params,
+        "recall_at_k": float(np.mean(recalls)),
+        "build_seconds": build_seconds,
+        "latency_p50_ms": float(np.percentile(latencies_ms, 50)),
+        "latency_p95_ms": float(np.percentile(latencies_ms, 95)),
+        "latency_mean_ms": float(latencies_ms.mean())
+    }
+
+
+def recommend(results: List[Dict], target_recall: float) -> Dict:
+    """Cheapest configuration (lowest p95 latency) that meets the target recall"""
+    passing = [r for r in results if r["recall_at_k"] >= target_recall]
+    if not passing:
+        return max(results, key=lambda r: r["recall_at_k"])
+    return min(passing, key=lambda r: (r["latency_p95_ms"], r["build_seconds"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tune HNSW index parameters for the medical corpus")
+    parser.add_argument("--db-path", default=config.CHROMA_DB_PATH)
+    parser.add_argument("--collection", default=config.COLLECTION_NAME)
+    parser.add_argument("--json", help="Read the corpus from processed JSON instead of the collection")
+    parser.add_argument("--query-file", help="Text file with one query per line (default: held-out documents)")
+    parser.add_argument("--queries", type=int, default=200, help="Held-out documents used as queries")
+    parser.add_argument("--k", type=int, default=config.TOP_K_RESULTS)
+    parser.add_argument("--space", choices=["cosine", "l2", "ip"], default="cosine",
+                        help="Distance space used for the grid and ground truth")
+    parser.add_argument("--target-recall", type=float, default=0.95)
+    parser.add_argument("--grid", action="store_true", help="Sweep a full M/ef grid besides the named profiles")
+    parser.add_argument("--output", help="Write all results as JSON")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print("📥 Loading corpus...")
+    if args.json:
+        ids, corpus = load_corpus_from_json(args.json)
+    else:
+        ids, corpus = load_corpus_from_collection(args.db_path, args.collection)
+    print(f"Loaded {len(ids)} embeddings of dimension {corpus.shape[1]}")
+
+    rng = np.random.default_rng(args.seed)
+    if args.query_file:
+        with open(args.query_file, 'r', encoding='utf-8') as f:
+            texts = [line.strip() for line in f if line.strip()]
+        queries = get_encoder().encode(texts)
+    else:
+        # Hold queries out of the index so they cannot trivially match themselves
+        held_out = rng.choice(len(ids), size=min(args.queries, len(ids) // 10), replace=False)
+        mask = np.ones(len(ids), dtype=bool)
+        mask[held_out] = False
+        queries = corpus[held_out]
+        corpus = corpus[mask]
+        ids = [doc_id for doc_id, keep in zip(ids, mask) if keep]
+
+    results = []
+    work_dir = tempfile.mkdtemp(prefix="index_tuning_")
+    try:
+        for params in candidate_params(args.grid, args.space):
+            truth = exact_top_k(corpus, queries, args.k, params["space"])
+            result = evaluate(params, ids, corpus, queries, truth, args.k, work_dir)
+            results.append(result)
+            print(f"{result['name']:<24} recall@{args.k} {result['recall_at_k']:.3f} | "
+                  f"p95 {result['latency_p95_ms']:7.2f}ms | build {result['build_seconds']:7.1f}s")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    best = recommend(results, args.target_recall)
+    if best["recall_at_k"] >= args.target_recall:
+        print(f"\n✅ Recommended: {best['name']} (M={best['M']}, ef_construction={best['ef_construction']}, "
+              f"ef_search={best['ef_search']}, space={best['space']})")
+    else:
+        print(f"\n⚠️ No configuration reached recall {args.target_recall}; best was {best['name']} "
+              f"at {best['recall_at_k']:.3f}")
+    if best["name"] in config.INDEX_PROFILES:
+        print(f"Set INDEX_PROFILE={best['name']} and rebuild the collection to apply it.")
+    else:
+        print("Add these parameters to config.INDEX_PROFILES and rebuild the collection to apply them.")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"k": args.k, "target_recall": args.target_recall, "corpus_size": len(ids),
+                       "queries": len(queries), "recommended": best, "results": results}, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
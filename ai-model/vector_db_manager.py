@@ -4,25 +4,141 @@ Handles ChromaDB operations for storing and retrieving medical documents
 """
 import chromadb
 from chromadb.config import Settings
-import json
 import numpy as np
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Optional, Tuple, Union
 import config
 import os
+import threading
+import time
+from embeddings import get_encoder
+from attribute_index import AttributeIndex, chroma_where, validate_filters
+from document_batch import DocumentBatch
+from instrumentation import span, count_retrieved
+
+def index_metadata(profile: str = config.INDEX_PROFILE) -> Dict:
+    """Collection metadata for a named index profile"""
+    if profile not in config.INDEX_PROFILES:
+        raise ValueError(f"Unknown index profile '{profile}'. Choose from {', '.join(config.INDEX_PROFILES)}")
+    params = config.INDEX_PROFILES[profile]
+    return {
+        "description": "Medical knowledge base for RAG system",
+        "index_profile": profile,
+        "hnsw:space": params["space"],
+        "hnsw:M": params["M"],
+        "hnsw:construction_ef": params["ef_construction"],
+        "hnsw:search_ef": params["ef_search"]
+    }
+
+# Chroma calls that only read; other calls (add, upsert, delete, create_collection, ...) write
+READ_ONLY_CALLS = frozenset(("get", "query", "count", "peek", "heartbeat", "get_collection", "list_collections"))
+
+
+def with_retries(call, idempotent: bool, retries: int = config.CHROMA_RETRIES,
+                 backoff_seconds: float = config.CHROMA_RETRY_BACKOFF_SECONDS):
+    """Run call(), retrying transport errors from the Chroma server.
+
+    Reads are retried on any transport error. Writes are retried only when the
+    request never reached the server (connect errors, no free pooled connection);
+    after a read timeout the server may already have applied them.
+    """
+    import httpx
+    unsent_errors = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+    for attempt in range(retries + 1):
+        try:
+            return call()
+        except httpx.TransportError as e:
+            if attempt == retries or not (idempotent or isinstance(e, unsent_errors)):
+                raise
+            print(f"Chroma call failed ({e}); retrying")
+            time.sleep(backoff_seconds * 2 ** attempt)
+
+
+class RetryingChroma:
+    """A Chroma HttpClient or Collection whose public methods go through with_retries.
+
+    Collections returned by client methods are wrapped too.
+    """
+
+    def __init__(self, target, retries: int = config.CHROMA_RETRIES,
+                 backoff_seconds: float = config.CHROMA_RETRY_BACKOFF_SECONDS):
+        self._target = target
+        self._retries = retries
+        self._backoff_seconds = backoff_seconds
+
+    def __getattr__(self, name):
+        value = getattr(self._target, name)
+        if name.startswith("_") or not callable(value):
+            return value
+
+        def call(*args, **kwargs):
+            result = with_retries(lambda: value(*args, **kwargs), name in READ_ONLY_CALLS,
+                                  self._retries, self._backoff_seconds)
+            if isinstance(result, chromadb.Collection):
+                return RetryingChroma(result, self._retries, self._backoff_seconds)
+            return result
+
+        return call
+
+
+# (pid, server, ssl) -> client; each HttpClient holds its own keep-alive connection pool,
+# so clients are reused per server within a process (pools are not shared across fork)
+_server_clients = {}
+_server_clients_lock = threading.Lock()
+
+
+def connect_chroma_server(server: str, ssl: bool = config.CHROMA_SERVER_SSL,
+                          retries: int = config.CHROMA_RETRIES,
+                          backoff_seconds: float = config.CHROMA_RETRY_BACKOFF_SECONDS) -> RetryingChroma:
+    """Shared client for a Chroma server at "host:port" that retries transport errors"""
+    import httpx
+    key = (os.getpid(), server, ssl)
+    with _server_clients_lock:
+        if key in _server_clients:
+            return _server_clients[key]
+
+        host, _, port = server.rpartition(":")
+
+        def create():
+            # Creating the client reads the user, tenant and database from the server
+            try:
+                return chromadb.HttpClient(host=host, port=int(port), ssl=ssl,
+                                           settings=Settings(anonymized_telemetry=False, allow_reset=True))
+            except ValueError as e:
+                # chromadb reports a refused connection here as ValueError
+                if isinstance(e.__context__, httpx.TransportError):
+                    raise e.__context__
+                raise
+
+        client = with_retries(create, True, retries, backoff_seconds)
+        _server_clients[key] = RetryingChroma(client, retries, backoff_seconds)
+        return _server_clients[key]
+
 
 class MedicalVectorDB:
-    def __init__(self, db_path: str = config.CHROMA_DB_PATH, collection_name: str = config.COLLECTION_NAME):
+    def __init__(self, db_path: str = config.CHROMA_DB_PATH, collection_name: str = config.COLLECTION_NAME,
+                 encoder=None, index_profile: str = config.INDEX_PROFILE, server: str = config.CHROMA_SERVER):
+        """server is "host:port" of a Chroma server, or empty for a local database at db_path.
+
+        With a server, db_path still holds the sidecar attribute index.
+        """
         self.db_path = db_path
         self.collection_name = collection_name
+        self.index_profile = index_profile
+        self.server = server
+        # Queries are encoded explicitly so encoding time can be measured on its own
+        self.encoder = encoder or get_encoder()
         
         # Initialize ChromaDB client
-        self.client = chromadb.PersistentClient(
-            path=db_path,
-            settings=Settings(
-                anonymized_telemetry=False,
-                allow_reset=True
+        if server:
+            self.client = connect_chroma_server(server)
+        else:
+            self.client = chromadb.PersistentClient(
+                path=db_path,
+                settings=Settings(
+                    anonymized_telemetry=False,
+                    allow_reset=True
+                )
             )
-        )
         
         # Get or create collection
         try:
@@ -31,40 +147,45 @@ class MedicalVectorDB:
         except:
             self.collection = self.client.create_collection(
                 name=collection_name,
-                metadata={"description": "Medical knowledge base for RAG system"}
+                metadata=index_metadata(index_profile)
             )
-            print(f"Created new collection '{collection_name}'")
+            print(f"Created new collection '{collection_name}' with index profile '{index_profile}'")
+        
+        # Existing collections keep the space they were built with
+        self.space = (self.collection.metadata or {}).get("hnsw:space", "l2")
+        
+        # Medicine attributes for filtered search, built at ingest
+        self.attribute_index = AttributeIndex.load(db_path)
     
-    def add_documents(self, documents: List[Dict]) -> bool:
-        """Add documents to the vector database"""
+    def encode_query(self, texts: List[str]) -> List[List[float]]:
+        """Encode query texts with the same model used at ingestion"""
+        with span('vector_db.encode', texts=len(texts)):
+            return self.encoder.encode(texts).tolist()
+
+    def add_documents(self, documents: Union[DocumentBatch, List[Dict]], progress=None) -> bool:
+        """Add documents to the vector database, calling progress(stage, done, total) per batch"""
         try:
             print(f"Adding {len(documents)} documents to vector database...")
             
-            # Prepare data for ChromaDB
-            ids = []
-            embeddings = []
-            metadatas = []
-            documents_text = []
-            
-            for doc in documents:
-                ids.append(doc['id'])
-                embeddings.append(doc['embedding'])
-                metadatas.append(doc['metadata'])
-                documents_text.append(doc['document'])
+            if not isinstance(documents, DocumentBatch):
+                documents = DocumentBatch.from_dicts(documents)
             
-            # Add to collection in batches
+            # Add to collection in batches; rows are converted to Chroma's format per batch
             batch_size = config.BATCH_SIZE
-            for i in range(0, len(documents), batch_size):
-                end_idx = min(i + batch_size, len(documents))
-                
-                self.collection.add(
-                    ids=ids[i:end_idx],
-                    embeddings=embeddings[i:end_idx],
-                    metadatas=metadatas[i:end_idx],
-                    documents=documents_text[i:end_idx]
-                )
-                
-                print(f"Added batch {i//batch_size + 1}/{(len(documents) + batch_size - 1)//batch_size}")
+            with span('vector_db.add_documents', documents=len(documents)):
+                for i in range(0, len(documents), batch_size):
+                    end_idx = min(i + batch_size, len(documents))
+                    
+                    self.collection.add(
+                        ids=documents.ids[i:end_idx],
+                        embeddings=documents.embeddings[i:end_idx].tolist(),
+                        metadatas=documents.metadatas(i, end_idx),
+                        documents=documents.texts[i:end_idx]
+                    )
+                    
+                    print(f"Added batch {i//batch_size + 1}/{(len(documents) + batch_size - 1)//batch_size}")
+                    if progress:
+                        progress('store', end_idx, len(documents))
             
             print(f"Successfully added {len(documents)} documents to the database")
             return True
@@ -73,48 +194,142 @@ class MedicalVectorDB:
             print(f"Error adding documents to database: {e}")
             return False
     
+    def build_attribute_index(self, documents: DocumentBatch):
+        """Build the medicine attribute index from ingested documents and save it with the database"""
+        self.attribute_index = AttributeIndex.build(documents)
+        self.attribute_index.save(self.db_path)
+    
     def search_similar(self, query: str, n_results: int = config.TOP_K_RESULTS, 
-                      doc_types: Optional[List[str]] = None) -> List[Dict]:
-        """Search for similar documents"""
+                      doc_types: Optional[List[str]] = None,
+                      query_embedding: Optional[List[float]] = None,
+                      filters: Optional[Dict] = None) -> List[Dict]:
+        """Search for similar documents, reusing query_embedding when the caller already has it.
+
+        filters (e.g. {"available_only": True, "max_price": 100}) restrict the
+        search to medicine documents matching every predicate.
+        """
+        if filters:
+            validate_filters(filters)
         try:
-            # Build where clause for filtering by document type
-            where_clause = None
-            if doc_types:
-                where_clause = {"type": {"$in": doc_types}}
-            
-            # Perform similarity search
-            results = self.collection.query(
-                query_texts=[query],
-                n_results=n_results,
-                where=where_clause,
-                include=['documents', 'metadatas', 'distances']
-            )
-            
-            # Format results
-            formatted_results = []
-            if results['documents'] and results['documents'][0]:
-                for i in range(len(results['documents'][0])):
-                    result = {
-                        'id': results['ids'][0][i],
-                        'document': results['documents'][0][i],
-                        'metadata': results['metadatas'][0][i],
-                        'similarity_score': 1 - results['distances'][0][i]  # Convert distance to similarity
-                    }
-                    formatted_results.append(result)
+            with span('vector_db.search_similar', doc_types=",".join(doc_types or [])):
+                if query_embedding is None:
+                    query_embedding = self.encode_query([query])[0]
+                
+                if filters and self.attribute_index is not None:
+                    formatted_results = self._search_candidates(query_embedding, n_results, doc_types, filters)
+                    count_retrieved(formatted_results)
+                    return formatted_results
+                
+                # Build where clause for filtering by document type
+                where_clause = None
+                if filters:
+                    where_clause = chroma_where(filters, doc_types)
+                elif doc_types:
+                    where_clause = {"type": {"$in": doc_types}}
+                
+                # Perform similarity search
+                with span('vector_db.query'):
+                    results = self.collection.query(
+                        query_embeddings=[list(query_embedding)],
+                        n_results=n_results,
+                        where=where_clause,
+                        include=['documents', 'metadatas', 'distances']
+                    )
+                
+                formatted_results = self._format_query_results(results, 0)
             
+            count_retrieved(formatted_results)
             return formatted_results
             
         except Exception as e:
             print(f"Error searching database: {e}")
             return []
     
+    def search_similar_batch(self, queries: List[str], n_results: int = config.TOP_K_RESULTS,
+                             doc_types: Optional[List[str]] = None,
+                             query_embeddings: Optional[List[List[float]]] = None,
+                             filters: Optional[Dict] = None) -> List[List[Dict]]:
+        """search_similar for many queries: one encode call and one Chroma query for the batch.
+
+        Returns one result list per query, in order.
+        """
+        if not queries:
+            return []
+        if filters:
+            validate_filters(filters)
+        try:
+            with span('vector_db.search_similar_batch', queries=len(queries), doc_types=",".join(doc_types or [])):
+                if query_embeddings is None:
+                    query_embeddings = self.encode_query(queries)
+                
+                if filters and self.attribute_index is not None:
+                    batch_results = [self._search_candidates(embedding, n_results, doc_types, filters)
+                                     for embedding in query_embeddings]
+                else:
+                    where_clause = None
+                    if filters:
+                        where_clause = chroma_where(filters, doc_types)
+                    elif doc_types:
+                        where_clause = {"type": {"$in": doc_types}}
+                    with span('vector_db.query'):
+                        results = self.collection.query(
+                            query_embeddings=[list(embedding) for embedding in query_embeddings],
+                            n_results=n_results,
+                            where=where_clause,
+                            include=['documents', 'metadatas', 'distances']
+                        )
+                    batch_results = [self._format_query_results(results, q) for q in range(len(queries))]
+            
+            for formatted_results in batch_results:
+                count_retrieved(formatted_results)
+            return batch_results
+            
+        except Exception as e:
+            print(f"Error searching database: {e}")
+            return [[] for _ in queries]
+    
+    def _format_query_results(self, results: Dict, q: int) -> List[Dict]:
+        """Result dicts for query number q of a Chroma query response"""
+        formatted_results = []
+        if results['documents'] and results['documents'][q]:
+            for i in range(len(results['documents'][q])):
+                formatted_results.append({
+                    'id': results['ids'][q][i],
+                    'document': results['documents'][q][i],
+                    'metadata': results['metadatas'][q][i],
+                    'similarity_score': 1 - results['distances'][q][i]  # Cosine similarity in cosine space
+                })
+        return formatted_results
+    
+    def _search_candidates(self, query_embedding: List[float], n_results: int,
+                           doc_types: Optional[List[str]], filters: Dict) -> List[Dict]:
+        """Exact search over the rows the attribute index selects"""
+        with span('vector_db.prefilter'):
+            rows = self.attribute_index.candidates(filters, doc_types)
+        with span('vector_db.query'):
+            hits = self.attribute_index.search(query_embedding, rows, n_results, self.space)
+            if not hits:
+                return []
+            results = self.collection.get(ids=[doc_id for doc_id, _ in hits],
+                                          include=['documents', 'metadatas'])
+        
+        found = {doc_id: (document, metadata) for doc_id, document, metadata
+                 in zip(results['ids'], results['documents'], results['metadatas'])}
+        return [{
+            'id': doc_id,
+            'document': found[doc_id][0],
+            'metadata': found[doc_id][1],
+            'similarity_score': score
+        } for doc_id, score in hits if doc_id in found]
+    
     def get_document_by_id(self, doc_id: str) -> Optional[Dict]:
         """Retrieve a specific document by ID"""
         try:
-            results = self.collection.get(
-                ids=[doc_id],
-                include=['documents', 'metadatas']
-            )
+            with span('vector_db.get_document'):
+                results = self.collection.get(
+                    ids=[doc_id],
+                    include=['documents', 'metadatas']
+                )
             
             if results['documents']:
                 return {
@@ -128,16 +343,31 @@ class MedicalVectorDB:
             print(f"Error retrieving document {doc_id}: {e}")
             return None
     
+    def get_documents_by_ids(self, doc_ids: List[str]) -> List[Dict]:
+        """Retrieve documents by ID in one request, in the order asked; unknown IDs are skipped"""
+        if not doc_ids:
+            return []
+        try:
+            with span('vector_db.get_documents', ids=len(doc_ids)):
+                results = self.collection.get(ids=list(doc_ids), include=['documents', 'metadatas'])
+        except Exception as e:
+            print(f"Error retrieving documents {', '.join(doc_ids)}: {e}")
+            return []
+        found = {doc_id: {'id': doc_id, 'document': document, 'metadata': metadata}
+                 for doc_id, document, metadata in zip(results['ids'], results['documents'], results['metadatas'])}
+        return [found[doc_id] for doc_id in doc_ids if doc_id in found]
+    
     def get_collection_stats(self) -> Dict:
         """Get statistics about the collection"""
         try:
-            count = self.collection.count()
-            
-            # Get sample of documents to analyze types
-            sample_results = self.collection.get(
-                limit=min(1000, count),
-                include=['metadatas']
-            )
+            with span('vector_db.collection_stats'):
+                count = self.collection.count()
+                
+                # Get sample of documents to analyze types
+                sample_results = self.collection.get(
+                    limit=min(1000, count),
+                    include=['metadatas']
+                )
             
             # Count document types
             type_counts = {}
@@ -150,13 +380,31 @@ class MedicalVectorDB:
                 'total_documents': count,
                 'document_types': type_counts,
                 'collection_name': self.collection_name,
-                'db_path': self.db_path
+                'db_path': self.db_path,
+                'server': self.server or None,
+                'index_profile': (self.collection.metadata or {}).get('index_profile', 'default'),
+                'distance_space': self.space
             }
             
         except Exception as e:
             print(f"Error getting collection stats: {e}")
             return {}
     
+    def close(self):
+        """Release the client's cached system so its files can be removed"""
+        if self.server:
+            return  # The server connection pool is shared by every client of that server
+        try:
+            from chromadb.api.client import SharedSystemClient
+            systems = getattr(SharedSystemClient, "_identifier_to_system", None)
+            if systems is None:
+                return  # This chromadb version does not cache systems per path
+            system = systems.pop(self.client._identifier, None)
+            if system is not None:
+                system.stop()
+        except Exception as e:
+            print(f"Error closing database client: {e}")
+    
     def delete_collection(self) -> bool:
         """Delete the entire collection"""
         try:
@@ -176,30 +424,42 @@ class MedicalVectorDB:
             # Recreate collection
             self.collection = self.client.create_collection(
                 name=self.collection_name,
-                metadata={"description": "Medical knowledge base for RAG system"}
+                metadata=index_metadata(self.index_profile)
             )
+            self.space = self.collection.metadata["hnsw:space"]
             return True
         except Exception as e:
             print(f"Error resetting database: {e}")
             return False
 
-def load_and_store_documents(json_file: str = "processed_medical_data.json") -> bool:
-    """Load processed documents from JSON and store in vector database"""
+def load_and_store_documents(json_file: str = "processed_medical_data.json", snapshot: bool = False) -> bool:
+    """Load processed documents from JSON and store in vector database.
+
+    With snapshot=True the documents go into a new index version under
+    config.INDEX_SNAPSHOT_ROOT, which is published once fully written.
+    """
     if not os.path.exists(json_file):
         print(f"File {json_file} not found. Please run medical_rag_processor.py first.")
         return False
     
     print(f"Loading documents from {json_file}...")
-    with open(json_file, 'r', encoding='utf-8') as f:
-        documents = json.load(f)
+    documents = DocumentBatch.load_json(json_file)
     
     print(f"Loaded {len(documents)} documents")
     
     # Initialize vector database
-    vector_db = MedicalVectorDB()
+    if snapshot:
+        from index_snapshots import create_version
+        version_path = create_version()
+        print(f"Building index version {os.path.basename(version_path)}")
+        vector_db = MedicalVectorDB(db_path=version_path, server="")  # Snapshots are local
+    else:
+        vector_db = MedicalVectorDB()
     
     # Store documents
     success = vector_db.add_documents(documents)
+    if success:
+        vector_db.build_attribute_index(documents)
     
     if success:
         stats = vector_db.get_collection_stats()
@@ -208,16 +468,36 @@ def load_and_store_documents(json_file: str = "processed_medical_data.json") ->
         print("Document types:")
         for doc_type, count in stats['document_types'].items():
             print(f"  {doc_type}: {count}")
+        
+        if snapshot:
+            from index_snapshots import (publish_version, copy_faq_index, copy_interaction_graph,
+                                         copy_entity_index, copy_dedup_members)
+            copy_faq_index(version_path)
+            copy_interaction_graph(version_path)
+            copy_entity_index(version_path)
+            copy_dedup_members(version_path)
+            publish_version(version_path)
     
     return success
 
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Load processed documents into the vector database")
+    parser.add_argument("--json", default="processed_medical_data.json")
+    parser.add_argument("--snapshot", action="store_true",
+                        help="Build a new index version and publish it instead of writing in place")
+    args = parser.parse_args()
+    
     # Load and store documents
-    success = load_and_store_documents()
+    success = load_and_store_documents(args.json, snapshot=args.snapshot)
     
     if success:
         print("\nTesting search functionality...")
-        vector_db = MedicalVectorDB()
+        if args.snapshot:
+            from index_snapshots import current_version
+            vector_db = MedicalVectorDB(db_path=os.path.join(config.INDEX_SNAPSHOT_ROOT, current_version()), server="")
+        else:
+            vector_db = MedicalVectorDB()
         
         # Test searches
         test_queries = [
@@ -0,0 +1,174 @@
+"""
+Admission control and request scheduling for the Medical RAG AI Service
+Routes map to priority classes (interactive retrieval, generation, admin); each class has its
+own concurrency limit and bounded wait queue, so cheap requests never queue behind LLM calls.
+Requests are shed early, with a Retry-After estimate, when the expected queueing delay is too long.
+"""
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+from instrumentation import REGISTRY
+
+QUEUE_WAIT_SECONDS = REGISTRY.summary(
+    "medical_ai_queue_wait_seconds", "Time admitted requests waited for a slot in their class")
+
+
+class Overloaded(Exception):
+    """Raised when a request is shed; retry_after is a wait estimate in seconds"""
+
+    def __init__(self, request_class: str, reason: str, retry_after: float):
+        super().__init__(f"{request_class} requests overloaded ({reason})")
+        self.request_class = request_class
+        self.reason = reason
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class AdmissionGate:
+    """At most max_concurrent requests run; up to max_queue wait in FIFO order.
+
+    The expected wait of a new arrival is estimated from an EWMA of service
+    time: (requests ahead of it / max_concurrent) * service time. Arrivals
+    whose estimate exceeds max_wait_seconds are rejected immediately instead
+    of queueing, and queued requests give up once they have waited that long.
+    """
+
+    def __init__(self, name: str, max_concurrent: int, max_queue: int, max_wait_seconds: float,
+                 ewma_alpha: float = 0.2):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait_seconds = max_wait_seconds
+        self.ewma_alpha = ewma_alpha
+        self.service_seconds = None  # EWMA of time spent holding a slot
+        self.active = 0
+        self.waiting = []  # Tickets in arrival order
+        self.admitted = 0
+        self.shed = {'queue_full': 0, 'wait_estimate': 0, 'queue_timeout': 0}
+        self._cond = threading.Condition()
+
+    def estimated_wait(self, ahead: int) -> float:
+        """Expected queueing delay behind `ahead` requests"""
+        if self.service_seconds is None:
+            return 0.0
+        return (ahead + 1) / self.max_concurrent * self.service_seconds
+
+    def _reject(self, reason: str) -> Overloaded:
+        self.shed[reason] += 1
+        retry_after = self.estimated_wait(len(self.waiting)) or self.max_wait_seconds
+        return Overloaded(self.name, reason, retry_after)
+
+    def _enter(self):
+        with self._cond:
+            if self.active < self.max_concurrent and not self.waiting:
+                self.active += 1
+                self.admitted += 1
+                QUEUE_WAIT_SECONDS.observe(0.0, **{'class': self.name})
+                return
+            if len(self.waiting) >= self.max_queue:
+                raise self._reject('queue_full')
+            if self.estimated_wait(len(self.waiting)) > self.max_wait_seconds:
+                raise self._reject('wait_estimate')
+
+            ticket = object()
+            self.waiting.append(ticket)
+            queued_at = time.monotonic()
+            deadline = queued_at + self.max_wait_seconds
+            while not (self.active < self.max_concurrent and self.waiting[0] is ticket):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.waiting.remove(ticket)
+                    self._cond.notify_all()
+                    raise self._reject('queue_timeout')
+                self._cond.wait(remaining)
+            self.waiting.pop(0)
+            self.active += 1
+            self.admitted += 1
+            self._cond.notify_all()
+        QUEUE_WAIT_SECONDS.observe(time.monotonic() - queued_at, **{'class': self.name})
+
+    def _exit(self, held_seconds: float):
+        with self._cond:
+            self.active -= 1
+            if self.service_seconds is None:
+                self.service_seconds = held_seconds
+            else:
+                self.service_seconds += self.ewma_alpha * (held_seconds - self.service_seconds)
+            self._cond.notify_all()
+
+    @contextmanager
+    def admit(self):
+        """Hold a slot for the duration of the block, or raise Overloaded"""
+        self._enter()
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._exit(time.monotonic() - start)
+
+    def get_stats(self) -> Dict:
+        with self._cond:
+            return {
+                'active': self.active,
+                'queued': len(self.waiting),
+                'max_concurrent': self.max_concurrent,
+                'max_queue': self.max_queue,
+                'admitted': self.admitted,
+                'shed': dict(self.shed),
+                'shed_total': sum(self.shed.values()),
+                'service_seconds_ewma': self.service_seconds,
+                'estimated_wait_seconds': self.estimated_wait(len(self.waiting))
+            }
+
+
+class AdmissionController:
+    """One gate per priority class, with routes mapped to classes by path prefix"""
+
+    def __init__(self, classes: Dict[str, Dict], routes: Dict[str, str], enabled: bool = True):
+        unknown = set(routes.values()) - set(classes)
+        if unknown:
+            raise ValueError(f"Routes mapped to undefined classes: {', '.join(sorted(unknown))}")
+        self.enabled = enabled
+        self.gates = {name: AdmissionGate(name, **params) for name, params in classes.items()}
+        self.routes = routes
+        # Longest prefix first so specific routes override general ones
+        self._prefixes = sorted(routes, key=len, reverse=True)
+
+    def class_for(self, path: str) -> Optional[str]:
+        """Priority class of a request path, or None if it is not scheduled"""
+        for prefix in self._prefixes:
+            if path == prefix or path.startswith(prefix.rstrip('/') + '/'):
+                return self.routes[prefix]
+        return None
+
+    @contextmanager
+    def admit(self, request_class: Optional[str]):
+        """Hold a slot in the class for the block, or raise Overloaded"""
+        if not self.enabled or request_class not in self.gates:
+            yield
+            return
+        with self.gates[request_class].admit():
+            yield
+
+    def get_stats(self) -> Dict:
+        return {
+            'enabled': self.enabled,
+            'classes': {name: gate.get_stats() for name, gate in self.gates.items()},
+            'routes': dict(self.routes)
+        }
+
+    def gauge(self) -> Dict:
+        """Per-class queue depth, concurrency and shed counts for /metrics"""
+        values = {}
+        for name, gate in self.gates.items():
+            stats = gate.get_stats()
+            for stat in ('active', 'queued', 'admitted', 'shed_total', 'estimated_wait_seconds'):
+                values[(('class', name), ('stat', stat))] = stats[stat]
+            for reason, count in stats['shed'].items():
+                values[(('class', name), ('stat', f'shed_{reason}'))] = count
+        return values
@@ -4,9 +4,14 @@ Exposes the RAG functionality as REST endpoints for the main application
 """
 import os
 import sys
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g, Response
 from flask_cors import CORS
 import logging
+import json
+import hmac
+import threading
+import time
+from contextlib import ExitStack
 from datetime import datetime
 
 # Add user site-packages to Python path for globally installed packages
@@ -20,6 +25,18 @@ sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'ai-model'))
 try:
     from gemini_rag_client import MedicalRAGClient
     from vector_db_manager import MedicalVectorDB
+    from generation import GenerationError, CircuitOpenError
+    from instrumentation import REGISTRY, gauge_values
+    from single_flight import SingleFlight, make_key, normalize_text
+    from prefork import process_memory
+    from embeddings import MicroBatchingEncoder
+    from serialization import json_response, project
+    from attribute_index import validate_filters
+    from index_jobs import IndexJobManager, resolve_data_dir
+    from admission import AdmissionController, Overloaded
+    from index_snapshots import SnapshotManager
+    from profiling import Profiler
+    import config
 except ImportError as e:
     print(f"Error importing RAG modules: {e}")
     print("Make sure the ai-model directory is properly set up")
@@ -35,12 +52,44 @@ logger = logging.getLogger(__name__)
 # Global RAG client instance
 rag_client = None
 
+# Hot-swaps the vector index when a new snapshot version is published
+snapshot_manager = None
+
+# Coalesces identical chat/search requests that are in flight at the same time
+request_coalescer = SingleFlight()
+
+# Per-class concurrency limits and bounded queues (routes map to classes in config); excess load gets 429
+admission = AdmissionController(config.SCHEDULER_CLASSES, config.ROUTE_CLASSES,
+                                enabled=config.ADMISSION_CONTROL_ENABLED)
+
+# Endpoints that take their slot inside the single-flight leader, so coalesced
+# duplicates do not occupy slots while they wait
+SELF_ADMITTED_ENDPOINTS = ('ai_chat', 'search_knowledge_base')
+
+# Degraded (extractive) chat answers make no generation call, so they take retrieval slots
+DEGRADED_REQUEST_CLASS = 'interactive'
+
+# Background re-index jobs (run in a separate low-priority process)
+index_jobs = IndexJobManager()
+
+# Sampled per-request profiles and on-demand /debug/profile captures
+profiler = Profiler(config.PROFILE_DIR, config.PROFILE_SAMPLE_RATE, config.PROFILE_INTERVAL_MS,
+                    config.PROFILE_MAX_FILES)
+PROFILED_PATH_PREFIX = '/api/ai/'
+
 def initialize_rag_client():
     """Initialize the RAG client with error handling"""
-    global rag_client
+    global rag_client, snapshot_manager
     try:
         logger.info("Initializing Medical RAG Client...")
         rag_client = MedicalRAGClient()
+        if config.EMBEDDING_MICRO_BATCHING:
+            # Concurrent request threads share batched encoder calls
+            rag_client.vector_db.encoder = MicroBatchingEncoder(rag_client.vector_db.encoder)
+        if not config.VECTOR_SHARDS and not config.CHROMA_SERVER:
+            # Shards and a shared Chroma server are updated in place rather than hot-swapped
+            snapshot_manager = SnapshotManager(rag_client)
+            snapshot_manager.start()
         logger.info("RAG Client initialized successfully")
         return True
     except Exception as e:
@@ -56,6 +105,115 @@ def startup():
 # Call startup function immediately
 startup()
 
+HTTP_REQUEST_SECONDS = REGISTRY.summary(
+    "medical_ai_http_request_seconds", "End-to-end latency of AI service HTTP requests")
+
+REGISTRY.gauge(
+    "medical_ai_coalescing", "Single-flight coalescing counters",
+    lambda: gauge_values(request_coalescer.get_stats(), 'stat'))
+
+def generation_gauge():
+    if not rag_client:
+        return None
+    stats = rag_client.generator.get_stats()
+    return gauge_values({k: v for k, v in stats.items() if isinstance(v, (int, float))}, 'stat')
+
+REGISTRY.gauge("medical_ai_generation_calls", "Generation call counters", generation_gauge)
+
+REGISTRY.gauge("medical_ai_admission", "Per-class queue depth, concurrency and shed counts",
+               admission.gauge)
+
+def overloaded_response(e: Overloaded):
+    """429 with Retry-After; the Node backend falls back to direct Gemini on this"""
+    resp = jsonify({'error': 'AI service overloaded, retry later', 'reason': e.reason})
+    resp.headers['Retry-After'] = e.retry_after_header
+    return resp, 429
+
+# Optional JSONL log of AI requests, replayable with loadtest.py --replay
+REQUEST_LOG_PATH = os.getenv('AI_REQUEST_LOG')
+RECORDED_PATHS = ('/api/ai/chat', '/api/ai/search', '/api/ai/stats')
+request_log_lock = threading.Lock()
+
+def record_request():
+    """Append the current request to the replay log"""
+    entry = {'t': time.time(), 'endpoint': request.path, 'body': request.get_json(silent=True)}
+    with request_log_lock:
+        with open(REQUEST_LOG_PATH, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.before_request
+def admit_request():
+    """Hold a slot in the route's priority class for the rest of the request"""
+    if request.endpoint in SELF_ADMITTED_ENDPOINTS:
+        return None
+    request_class = admission.class_for(request.path)
+    if request_class is None:
+        return None
+    slot = ExitStack()
+    try:
+        slot.enter_context(admission.admit(request_class))
+    except Overloaded as e:
+        logger.warning(f"Request to {request.path} shed by admission control: {e}")
+        return overloaded_response(e)
+    g.admission_slot = slot
+
+@app.teardown_request
+def release_request_slot(error=None):
+    slot = g.pop('admission_slot', None)
+    if slot is not None:
+        slot.close()
+
+if profiler.sample_rate > 0:
+    # Hooks are only installed when sampling is on, so unprofiled services pay nothing
+    @app.before_request
+    def start_request_profile():
+        if request.path.startswith(PROFILED_PATH_PREFIX) and profiler.should_sample():
+            profiler.start_request()
+            g.profile_start = time.perf_counter()
+
+    @app.teardown_request
+    def finish_request_profile(error=None):
+        start = g.pop('profile_start', None)
+        if start is not None:
+            try:
+                profiler.finish_request(request.endpoint or 'unknown', time.perf_counter() - start)
+            except OSError as e:
+                logger.warning(f"Failed to write request profile: {e}")
+
+@app.after_request
+def record_request_latency(response):
+    start = getattr(g, 'request_start', None)
+    if start is not None and request.endpoint:
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start,
+                                     endpoint=request.endpoint, status=response.status_code)
+    if REQUEST_LOG_PATH and request.path in RECORDED_PATHS:
+        try:
+            record_request()
+        except Exception as e:
+            logger.warning(f"Failed to record request: {e}")
+    return response
+
+def timings_requested(data: dict) -> bool:
+    """Check whether the caller asked for per-stage timings"""
+    flag = request.args.get('timings') or (data or {}).get('include_timings')
+    return str(flag).lower() in ('1', 'true', 'yes')
+
+def degraded_requested(data: dict) -> bool:
+    """Check whether the caller asked for an extractive answer without generation"""
+    flag = request.args.get('degraded') or (data or {}).get('degraded')
+    return str(flag).lower() in ('1', 'true', 'yes')
+
+def admin_authorized() -> bool:
+    """Admin endpoints require AI_ADMIN_TOKEN to be configured and sent in X-Admin-Token"""
+    if not config.AI_ADMIN_TOKEN:
+        return False
+    token = request.headers.get('X-Admin-Token', '')
+    return hmac.compare_digest(token.encode('utf-8'), config.AI_ADMIN_TOKEN.encode('utf-8'))
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
@@ -71,6 +229,7 @@ def ai_chat():
     """
     Main chat endpoint using RAG
     Expects: { "message": "user question", "conversation_history": [...] }
+    "degraded": true (or ?degraded=1) asks for an extractive answer without generation
     """
     try:
         if not rag_client:
@@ -85,26 +244,83 @@ def ai_chat():
         
         logger.info(f"Processing chat message: {user_message[:100]}...")
         
-        # Use RAG with conversation history
-        if conversation_history:
-            result = rag_client.chat_with_history(conversation_history, user_message)
-        else:
-            result = rag_client.chat(user_message)
+        request_class = admission.class_for(request.path)
+        degraded = degraded_requested(data)
+        
+        def answer(degraded_reason):
+            # Use RAG with conversation history
+            # Interactive chat degrades instead of failing when generation is unavailable
+            if conversation_history:
+                return rag_client.chat_with_history(conversation_history, user_message, degraded_reason,
+                                                    degrade_on_failure=config.DEGRADED_MODE_ENABLED)
+            return rag_client.chat(user_message, degraded_reason=degraded_reason,
+                                   degrade_on_failure=config.DEGRADED_MODE_ENABLED)
+        
+        def run_chat():
+            # Only the request that actually runs takes an admission slot;
+            # coalesced duplicates wait on it without queueing themselves
+            degraded_reason = 'requested' if degraded else None
+            if not degraded:
+                try:
+                    with admission.admit(request_class):
+                        return answer(None)
+                except Overloaded:
+                    if not config.DEGRADED_MODE_ENABLED:
+                        raise
+                    logger.warning("Generation slots saturated; answering chat in degraded mode")
+                    degraded_reason = 'overloaded'
+            with admission.admit(DEGRADED_REQUEST_CLASS):
+                return answer(degraded_reason)
+        
+        key = make_key('chat', {
+            'message': normalize_text(user_message),
+            'conversation_history': conversation_history,
+            'degraded': degraded
+        })
+        result, coalesced = request_coalescer.do(key, run_chat)
+        if coalesced:
+            logger.info("Chat request coalesced with an identical in-flight request")
         
         response = {
             'response': result['response'],
             'sources_used': result['num_sources'],
+            'answer_source': result.get('answer_source', 'generated'),
+            'degraded': result.get('degraded', False),
             'timestamp': datetime.now().isoformat(),
             'conversation_id': data.get('conversation_id'),
             'metadata': {
                 'retrieved_documents': len(result.get('retrieved_documents', [])),
+                'entity_documents': sum(doc.get('matched_by') == 'entity'
+                                        for doc in result.get('retrieved_documents', [])),
                 'context_length': len(result.get('context_used', ''))
             }
         }
+        if result.get('faq_match'):
+            response['metadata']['faq_match'] = result['faq_match']
+        if result.get('degraded'):
+            response['degraded_reason'] = result['degraded_reason']
+        if result.get('interactions'):
+            response['metadata']['interactions'] = result['interactions']
+        if timings_requested(data):
+            response['metadata']['timings'] = result.get('timings', [])
         
         logger.info(f"Chat response generated successfully with {result['num_sources']} sources")
         return jsonify(response)
         
+    except Overloaded as e:
+        logger.warning(f"Chat shed by admission control: {e}")
+        return overloaded_response(e)
+    except CircuitOpenError as e:
+        logger.warning(f"Chat rejected, generation circuit open: {e}")
+        resp = jsonify({'error': 'AI generation temporarily unavailable', 'details': str(e)})
+        resp.headers['Retry-After'] = str(max(1, int(e.retry_after)))
+        return resp, 503
+    except GenerationError as e:
+        logger.error(f"Generation failed in chat endpoint: {e}")
+        return jsonify({
+            'error': 'AI generation failed',
+            'details': str(e) if app.debug else 'Generation timed out or failed'
+        }), 503
     except Exception as e:
         logger.error(f"Error in chat endpoint: {e}")
         return jsonify({
@@ -118,7 +334,11 @@ def ai_chat():
 def search_knowledge_base():
     """
     Search the medical knowledge base
-    Expects: { "query": "search query", "doc_type": "optional document type" }
+    Expects: { "query": "search query", "doc_type": "optional document type",
+               "fields": ["id", "type", "similarity_score"], "limit": 10, "offset": 0,
+               "snippet_chars": 200,
+               "filters": {"available_only": true, "max_price": 100, "dosage_form": "tablet"} }
+    (all but query optional; filters restrict results to medicines)
     """
     try:
         if not rag_client:
@@ -131,22 +351,67 @@ def search_knowledge_base():
         query = data['query'].strip()
         doc_type = data.get('doc_type')
         
+        try:
+            limit = int(data.get('limit', config.SEARCH_DEFAULT_LIMIT))
+            offset = int(data.get('offset', 0))
+            snippet_chars = int(data['snippet_chars']) if data.get('snippet_chars') is not None else None
+        except (TypeError, ValueError):
+            return jsonify({'error': 'limit, offset and snippet_chars must be integers'}), 400
+        if limit < 1 or offset < 0 or offset + limit > config.SEARCH_MAX_LIMIT:
+            return jsonify({'error': f'offset + limit must be between 1 and {config.SEARCH_MAX_LIMIT}'}), 400
+        if snippet_chars is not None and snippet_chars < 1:
+            return jsonify({'error': 'snippet_chars must be positive'}), 400
+        
+        filters = data.get('filters') or None
+        if filters is not None:
+            if not isinstance(filters, dict):
+                return jsonify({'error': 'filters must be an object'}), 400
+            try:
+                validate_filters(filters)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+        
+        fields = data.get('fields')
+        if isinstance(fields, str):
+            fields = [field.strip() for field in fields.split(',') if field.strip()]
+        elif fields is not None and not (isinstance(fields, list) and all(isinstance(f, str) for f in fields)):
+            return jsonify({'error': 'fields must be a comma-separated string or a list of strings'}), 400
+        
         logger.info(f"Searching knowledge base for: {query[:100]}...")
         
-        # Search knowledge base
-        results = rag_client.search_knowledge_base(query, doc_type)
+        # Search knowledge base (the page is cut from the top offset + limit results)
+        n_results = offset + limit
+        key = make_key('search', {'query': normalize_text(query), 'doc_type': doc_type,
+                                  'n_results': n_results, 'filters': filters})
+        request_class = admission.class_for(request.path)
+        
+        def run_search():
+            with admission.admit(request_class):
+                return rag_client.search_knowledge_base(query, doc_type, n_results, filters)
         
+        results, coalesced = request_coalescer.do(key, run_search)
+        if coalesced:
+            logger.info("Search request coalesced with an identical in-flight request")
+        
+        page = [project(result, fields, snippet_chars) for result in results[offset:offset + limit]]
         response = {
-            'results': results,
-            'total_results': len(results),
+            'results': page,
+            'total_results': len(page),
+            'offset': offset,
+            'limit': limit,
+            'has_more': len(results) == n_results and n_results < config.SEARCH_MAX_LIMIT,
             'query': query,
             'doc_type_filter': doc_type,
+            'filters': filters,
             'timestamp': datetime.now().isoformat()
         }
         
-        logger.info(f"Knowledge base search completed with {len(results)} results")
-        return jsonify(response)
+        logger.info(f"Knowledge base search completed with {len(page)} results")
+        return json_response(response, accept_encoding=request.headers.get('Accept-Encoding'))
         
+    except Overloaded as e:
+        logger.warning(f"Search shed by admission control: {e}")
+        return overloaded_response(e)
     except Exception as e:
         logger.error(f"Error in search endpoint: {e}")
         return jsonify({
@@ -154,6 +419,45 @@ def search_knowledge_base():
             'details': str(e) if app.debug else 'Internal server error'
         }), 500
 
+@app.route('/api/ai/interactions', methods=['POST'])
+def check_interactions():
+    """
+    Look up recorded drug interactions in the interaction graph
+    Expects: { "medicines": ["Augmentin 625 Duo Tablet", "Warfarin"] }
+    With one medicine, returns everything it interacts with; with several,
+    the interactions between each pair.
+    """
+    if not rag_client:
+        return jsonify({'error': 'AI service not initialized'}), 500
+    graph = rag_client.interaction_graph
+    if graph is None:
+        return jsonify({'error': 'Interaction graph not built; run medical_rag_processor.py'}), 503
+    
+    data = request.get_json(silent=True) or {}
+    medicines = data.get('medicines')
+    if (not isinstance(medicines, list) or not medicines
+            or not all(isinstance(name, str) and name.strip() for name in medicines)):
+        return jsonify({'error': 'medicines must be a non-empty list of names'}), 400
+    if len(medicines) > config.INTERACTION_MAX_MEDICINES:
+        return jsonify({'error': f'At most {config.INTERACTION_MAX_MEDICINES} medicines per check'}), 400
+    
+    start = time.perf_counter()
+    if len(medicines) == 1:
+        interactions = graph.interactions_of(medicines[0])
+        result = {'interactions': interactions, 'unknown': [] if interactions or graph.resolve(medicines[0])
+                  else medicines}
+    else:
+        result = graph.check(medicines)
+    lookup_us = (time.perf_counter() - start) * 1e6
+    
+    return jsonify({
+        'medicines': medicines,
+        'interactions': result['interactions'],
+        'unknown': result['unknown'],
+        'lookup_us': round(lookup_us, 1),
+        'timestamp': datetime.now().isoformat()
+    })
+
 @app.route('/api/ai/stats', methods=['GET'])
 def get_stats():
     """Get database and system statistics"""
@@ -163,6 +467,7 @@ def get_stats():
         
         # Get vector database statistics
         stats = rag_client.vector_db.get_collection_stats()
+        encoder = rag_client.vector_db.encoder
         
         response = {
             'database_stats': stats,
@@ -171,6 +476,16 @@ def get_stats():
                 'timestamp': datetime.now().isoformat(),
                 'embedding_model': 'all-MiniLM-L6-v2',
                 'ai_model': 'Gemini 1.5 Flash'
+            },
+            'generation': rag_client.generator.get_stats(),
+            'coalescing': request_coalescer.get_stats(),
+            'admission': admission.get_stats(),
+            'embedding': encoder.get_stats() if hasattr(encoder, 'get_stats') else {'encoder': encoder.name},
+            'index': snapshot_manager.get_stats() if snapshot_manager else None,
+            'process': {
+                'pid': os.getpid(),
+                'worker_id': os.getenv('AI_WORKER_ID'),
+                'memory': process_memory()
             }
         }
         
@@ -183,6 +498,88 @@ def get_stats():
             'details': str(e) if app.debug else 'Internal server error'
         }), 500
 
+@app.route('/api/ai/index/jobs', methods=['POST'])
+def submit_index_job():
+    """
+    Start a background re-index job
+    Expects: { "data_dir": "optional directory with the source CSVs, under INDEX_JOB_DATA_ROOT",
+               "publish": true }
+    """
+    if not admin_authorized():
+        return jsonify({'error': 'Admin token required'}), 403
+    
+    data = request.get_json(silent=True) or {}
+    params = {'publish': bool(data.get('publish', True))}
+    if data.get('data_dir'):
+        try:
+            params['data_dir'] = resolve_data_dir(str(data['data_dir']))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+    
+    try:
+        job = index_jobs.submit(params)
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 409
+    
+    logger.info(f"Started index job {job['id']}")
+    return jsonify(job), 202
+
+@app.route('/api/ai/index/jobs', methods=['GET'])
+def list_index_jobs():
+    """List recent re-index jobs, newest first"""
+    if not admin_authorized():
+        return jsonify({'error': 'Admin token required'}), 403
+    return jsonify({'jobs': index_jobs.list()})
+
+@app.route('/api/ai/index/jobs/<job_id>', methods=['GET'])
+def get_index_job(job_id):
+    """Get the status and per-stage progress of a re-index job"""
+    if not admin_authorized():
+        return jsonify({'error': 'Admin token required'}), 403
+    job = index_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+@app.route('/api/ai/index/jobs/<job_id>', methods=['DELETE'])
+def cancel_index_job(job_id):
+    """Cancel a queued or running re-index job"""
+    if not admin_authorized():
+        return jsonify({'error': 'Admin token required'}), 403
+    job = index_jobs.cancel(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if not job.get('cancel_requested'):
+        return jsonify({'error': f"Job is already {job['status']}", 'job': job}), 409
+    logger.info(f"Cancelling index job {job_id}")
+    return jsonify(job), 202
+
+@app.route('/debug/profile', methods=['GET'])
+def debug_profile():
+    """Profile the whole process for ?seconds=N and return collapsed stacks"""
+    if not config.AI_ADMIN_TOKEN:
+        return jsonify({'error': 'Endpoint not found'}), 404  # Disabled until an admin token is configured
+    if not admin_authorized():
+        return jsonify({'error': 'Admin token required'}), 403
+    try:
+        seconds = float(request.args.get('seconds', 10))
+    except ValueError:
+        return jsonify({'error': 'seconds must be a number'}), 400
+    if not 0 < seconds <= config.PROFILE_MAX_SECONDS:
+        return jsonify({'error': f"seconds must be between 0 and {config.PROFILE_MAX_SECONDS:g}"}), 400
+    
+    try:
+        folded, path = profiler.profile_process(seconds)
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 409
+    logger.info(f"Captured {seconds:g}s process profile in {path}")
+    return Response(folded, mimetype='text/plain')
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics endpoint"""
+    return Response(REGISTRY.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
 @app.errorhandler(404)
 def not_found(error):
     return jsonify({'error': 'Endpoint not found'}), 404
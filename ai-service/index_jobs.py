@@ -0,0 +1,280 @@
+"""
+Background re-index jobs for the Medical RAG AI Service
+Runs the ingestion pipeline (process CSVs, embed, store, build FAQ and attribute indexes)
+in a separate low-priority process and publishes the result as a new index snapshot.
+
+Job state lives in one JSON file per job so every service worker sees the same jobs.
+"""
+import fcntl
+import json
+import os
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional
+
+# Also run as a script for the job process itself
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ai-model'))
+import config
+
+ACTIVE_STATES = ("queued", "running")
+LOCK_FILE = ".index_job.lock"
+STATUS_WRITE_INTERVAL = 0.5  # Seconds between progress writes
+START_TIMEOUT = 120  # Seconds a queued job may take to start running
+
+
+class JobCancelled(BaseException):
+    """Raised inside the job process on cancel.
+
+    A BaseException so the pipeline's per-file `except Exception` handlers do not swallow it.
+    """
+
+
+def parse_cpus(spec: str) -> List[int]:
+    """Parse a CPU list like "3", "0,2" or "2-3" """
+    cpus = []
+    for part in spec.split(","):
+        part = part.strip()
+        if "-" in part:
+            first, last = part.split("-")
+            cpus.extend(range(int(first), int(last) + 1))
+        elif part:
+            cpus.append(int(part))
+    return cpus
+
+
+def resolve_data_dir(path: str, root: str = config.INDEX_JOB_DATA_ROOT) -> str:
+    """Absolute data_dir for a job, raising ValueError unless it is a directory under root"""
+    if not root:
+        raise ValueError("data_dir is not accepted unless INDEX_JOB_DATA_ROOT is configured")
+    root = os.path.realpath(root)
+    resolved = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, resolved]) != root:
+        raise ValueError(f"data_dir must be inside {root}")
+    if not os.path.isdir(resolved):
+        raise ValueError(f"data_dir {path} does not exist")
+    return resolved
+
+
+def status_path(jobs_dir: str, job_id: str) -> str:
+    return os.path.join(jobs_dir, f"{job_id}.json")
+
+
+def write_status(jobs_dir: str, job: Dict):
+    """Replace a job's status file atomically"""
+    tmp_file = os.path.join(jobs_dir, f".{job['id']}.{os.getpid()}.tmp")
+    with open(tmp_file, 'w') as f:
+        json.dump(job, f)
+    os.replace(tmp_file, status_path(jobs_dir, job['id']))
+
+
+def pid_alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class JobReporter:
+    """Tracks per-stage progress in the job process and writes it to the status file"""
+
+    def __init__(self, jobs_dir: str, job: Dict):
+        self.jobs_dir = jobs_dir
+        self.job = job
+        self.stage_started = {}
+        self.last_write = 0.0
+
+    @property
+    def cancel_requested(self) -> bool:
+        return os.path.exists(status_path(self.jobs_dir, self.job['id']) + ".cancel")
+
+    def progress(self, stage: str, done: int, total: Optional[int]):
+        """Processor/vector DB progress callback"""
+        now = time.monotonic()
+        started = self.stage_started.setdefault(stage, now)
+        elapsed = now - started
+        rate = done / elapsed if elapsed > 0 else None
+        eta = (total - done) / rate if total is not None and rate else None
+        self.job['current_stage'] = stage
+        self.job['stages'][stage] = {
+            'done': done,
+            'total': total,
+            'elapsed_seconds': round(elapsed, 2),
+            'rows_per_second': round(rate, 1) if rate else None,
+            'eta_seconds': round(eta, 1) if eta is not None else None
+        }
+        if now - self.last_write >= STATUS_WRITE_INTERVAL or (total is not None and done >= total):
+            self.flush()
+            if self.cancel_requested:
+                raise JobCancelled()
+
+    def update(self, **fields):
+        self.job.update(fields)
+        self.flush()
+
+    def flush(self):
+        self.last_write = time.monotonic()
+        write_status(self.jobs_dir, self.job)
+
+
+def lower_priority(nice: int, cpus: str, threads: int):
+    """Make the job process cheap for the service: niced, pinned and single-threaded"""
+    from prefork import limit_threads
+    limit_threads(threads)
+    if nice:
+        os.nice(nice)
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, parse_cpus(cpus))
+
+
+def run_job(jobs_dir: str, job_id: str):
+    """Entry point of the job process"""
+    lower_priority(config.INDEX_JOB_NICE, config.INDEX_JOB_CPUS, config.INDEX_JOB_THREADS)
+    with open(status_path(jobs_dir, job_id)) as f:
+        job = json.load(f)
+    reporter = JobReporter(jobs_dir, job)
+    reporter.update(status='running', pid=os.getpid(), started_at=datetime.now().isoformat())
+
+    lock = open(os.path.join(jobs_dir, LOCK_FILE), 'w')
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        reporter.update(status='failed', error='Another index job is running',
+                        finished_at=datetime.now().isoformat())
+        return
+
+    try:
+        if reporter.cancel_requested:
+            raise JobCancelled()
+
+        from medical_rag_processor import MedicalDataProcessor
+        from vector_db_manager import MedicalVectorDB
+        from index_snapshots import create_version, publish_version
+
+        params = job['params']
+        snapshot_root = os.path.abspath(config.INDEX_SNAPSHOT_ROOT)
+        if params.get('data_dir'):
+            os.chdir(params['data_dir'])
+
+        processor = MedicalDataProcessor(progress=reporter.progress)
+        documents = processor.process_all_files()
+        if not documents:
+            raise RuntimeError("No documents were produced from the source files")
+
+        version_path = create_version(snapshot_root)
+        reporter.update(version=os.path.basename(version_path))
+        vector_db = MedicalVectorDB(db_path=version_path, encoder=processor.encoder, server="")
+        if not vector_db.add_documents(documents, progress=reporter.progress):
+            if reporter.cancel_requested:
+                raise JobCancelled()
+            raise RuntimeError("Storing documents failed")
+        processor.save_duplicate_members(os.path.join(version_path, "dedup_members"))
+
+        reporter.progress('indexes', 0, 4)
+        vector_db.build_attribute_index(documents)
+        reporter.progress('indexes', 1, 4)
+        processor.build_faq_index(os.path.join(version_path, "faq_index"))
+        reporter.progress('indexes', 2, 4)
+        processor.build_interaction_graph(os.path.join(version_path, "interaction_graph"))
+        reporter.progress('indexes', 3, 4)
+        processor.build_entity_index(os.path.join(version_path, "entity_index"))
+        reporter.progress('indexes', 4, 4)
+
+        if params.get('publish', True):
+            publish_version(version_path)
+        reporter.update(status='succeeded', documents=len(documents), published=params.get('publish', True),
+                        compaction=processor.dedup_stats, finished_at=datetime.now().isoformat())
+    except JobCancelled:
+        reporter.update(status='cancelled', finished_at=datetime.now().isoformat())
+    except Exception as e:
+        reporter.update(status='failed', error=str(e), finished_at=datetime.now().isoformat())
+    finally:
+        lock.close()
+
+
+class IndexJobManager:
+    """Submits, lists and cancels re-index jobs; one job runs at a time"""
+
+    def __init__(self, jobs_dir: str = config.INDEX_JOBS_DIR):
+        self.jobs_dir = os.path.abspath(jobs_dir)
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        self.processes = {}
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        if not job_id.isalnum():
+            return None
+        self._reap()
+        try:
+            with open(status_path(self.jobs_dir, job_id)) as f:
+                job = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if job['status'] == 'running' and not pid_alive(job.get('pid')):
+            job.update(status='failed', error='Job process exited unexpectedly')
+        elif job['status'] == 'queued':
+            waited = (datetime.now() - datetime.fromisoformat(job['submitted_at'])).total_seconds()
+            process = self.processes.get(job_id)
+            if (process is not None and process.poll() is not None) or waited > START_TIMEOUT:
+                job.update(status='failed', error='Job process did not start')
+        return job
+
+    def list(self, limit: int = 20) -> List[Dict]:
+        job_ids = [name[:-5] for name in os.listdir(self.jobs_dir) if name.endswith(".json")]
+        jobs = [job for job in (self.get(job_id) for job_id in job_ids) if job]
+        jobs.sort(key=lambda job: job['submitted_at'], reverse=True)
+        return jobs[:limit]
+
+    def active_job(self) -> Optional[Dict]:
+        for job in self.list(limit=1000):
+            if job['status'] in ACTIVE_STATES:
+                return job
+        return None
+
+    def submit(self, params: Dict) -> Dict:
+        """Start a job, or raise RuntimeError if one is already active"""
+        if config.CHROMA_SERVER or config.VECTOR_SHARDS:
+            raise RuntimeError("Re-index jobs publish local snapshots; rebuild the Chroma server or shards directly")
+        active = self.active_job()
+        if active:
+            raise RuntimeError(f"Index job {active['id']} is already {active['status']}")
+
+        job = {
+            'id': uuid.uuid4().hex[:12],
+            'status': 'queued',
+            'params': params,
+            'submitted_at': datetime.now().isoformat(),
+            'current_stage': None,
+            'stages': {}
+        }
+        write_status(self.jobs_dir, job)
+        # A fresh interpreter rather than a fork of the threaded service process
+        self.processes[job['id']] = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), self.jobs_dir, job['id']])
+        return job
+
+    def cancel(self, job_id: str) -> Optional[Dict]:
+        """Ask a job to stop at its next progress report; returns None if unknown"""
+        job = self.get(job_id)
+        if job is None:
+            return None
+        if job['status'] in ACTIVE_STATES:
+            open(status_path(self.jobs_dir, job_id) + ".cancel", 'w').close()
+            job['cancel_requested'] = True
+        return job
+
+    def _reap(self):
+        """Join finished job processes started by this service process"""
+        for job_id, process in list(self.processes.items()):
+            if process.poll() is not None:
+                del self.processes[job_id]
+
+
+if __name__ == "__main__":
+    run_job(sys.argv[1], sys.argv[2])
@@ -0,0 +1,337 @@
+"""
+Load-test harness for the Medical RAG AI Service
+Drives /api/ai/chat, /api/ai/search and /api/ai/stats with a configurable mix and reports
+throughput, latency percentiles and error rates for each step of a concurrency or rate sweep.
+
+By default the real Flask app is started in-process with Gemini replaced by the fake
+generation provider, so runs need no API key and the generator latency is configurable.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+ENDPOINTS = {
+    'chat': ('POST', '/api/ai/chat'),
+    'search': ('POST', '/api/ai/search'),
+    'stats': ('GET', '/api/ai/stats')
+}
+
+SAMPLE_QUESTIONS = [
+    "I have had a headache and mild fever for two days, what should I do?",
+    "What medicine can I take for a dry cough?",
+    "What are the early symptoms of diabetes?",
+    "How can I manage high blood pressure without medication?",
+    "I feel dizzy when I stand up quickly, is that serious?",
+    "What precautions should I take for dengue?",
+    "Is paracetamol safe to take with ibuprofen?",
+    "My child has a rash and itching after eating peanuts",
+    "What causes chest pain after exercise?",
+    "How long does the common cold usually last?",
+    "What are the side effects of metformin?",
+    "I have stomach pain and acidity after meals",
+]
+
+SEARCH_TYPES = [None, 'dialogue', 'faq', 'precaution', 'medicine_detailed', 'disease_description']
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    """Parse 'chat=0.2,search=0.7,stats=0.1' into normalized weights"""
+    weights = {}
+    for part in mix.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint '{name}' in mix. Use {', '.join(ENDPOINTS)}")
+        weights[name] = float(weight or 1)
+    total = sum(weights.values())
+    return {name: weight / total for name, weight in weights.items()}
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class RequestFactory:
+    """Builds request bodies from the endpoint mix or a recorded log"""
+
+    def __init__(self, mix: Dict[str, float], unique: bool = False, seed: int = 0,
+                 replay: Optional[List[Dict]] = None):
+        self.mix = mix
+        self.unique = unique
+        self.replay = replay
+        self._random = random.Random(seed)
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def next(self) -> Dict:
+        with self._lock:
+            self._counter += 1
+            counter = self._counter
+            if self.replay:
+                return self.replay[(counter - 1) % len(self.replay)]
+            endpoint = self._random.choices(list(self.mix), weights=list(self.mix.values()))[0]
+            question = self._random.choice(SAMPLE_QUESTIONS)
+            doc_type = self._random.choice(SEARCH_TYPES)
+
+        if self.unique:
+            # Defeat request coalescing so every request does real work
+            question = f"{question} (request {counter})"
+        if endpoint == 'chat':
+            body = {'message': question}
+        elif endpoint == 'search':
+            body = {'query': question}
+            if doc_type:
+                body['doc_type'] = doc_type
+        else:
+            body = None
+        return {'endpoint': endpoint, 'body': body}
+
+
+def load_replay_log(path: str) -> List[Dict]:
+    """Load a JSONL request log of {"endpoint", "body", "t"} records"""
+    records = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            endpoint = record['endpoint']
+            # Accept both short names and recorded paths
+            for name, (_, path_) in ENDPOINTS.items():
+                if endpoint == path_:
+                    endpoint = name
+            records.append({'endpoint': endpoint, 'body': record.get('body'), 't': float(record.get('t', 0))})
+    records.sort(key=lambda r: r['t'])
+    return records
+
+
+class Results:
+    """Thread-safe collection of request outcomes for one sweep step"""
+
+    def __init__(self):
+        self.samples = []
+        self._lock = threading.Lock()
+
+    def add(self, endpoint: str, latency: float, status: int):
+        with self._lock:
+            self.samples.append((endpoint, latency, status))
+
+    def summary(self, elapsed: float) -> Dict:
+        with self._lock:
+            samples = list(self.samples)
+
+        def summarize(rows):
+            latencies = sorted(r[1] * 1000.0 for r in rows)
+            errors = sum(1 for r in rows if r[2] == 0 or r[2] >= 400)
+            status_counts = {}
+            for r in rows:
+                status_counts[str(r[2])] = status_counts.get(str(r[2]), 0) + 1
+            return {
+                'requests': len(rows),
+                'throughput_rps': len(rows) / elapsed if elapsed else 0.0,
+                'errors': errors,
+                'error_rate': errors / len(rows) if rows else 0.0,
+                'status_counts': status_counts,
+                'latency_ms': {
+                    'p50': percentile(latencies, 50),
+                    'p90': percentile(latencies, 90),
+                    'p95': percentile(latencies, 95),
+                    'p99': percentile(latencies, 99),
+                    'max': latencies[-1] if latencies else 0.0
+                }
+            }
+
+        result = summarize(samples)
+        result['per_endpoint'] = {
+            name: summarize([s for s in samples if s[0] == name])
+            for name in sorted({s[0] for s in samples})
+        }
+        return result
+
+
+class LoadClient:
+    """Sends requests over one keep-alive connection per thread"""
+
+    def __init__(self, base_url: str, timeout: float):
+        parsed = urlparse(base_url)
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self) -> http.client.HTTPConnection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        return conn
+
+    def send(self, request: Dict) -> int:
+        """Send one request and return its HTTP status (0 on connection error)"""
+        method, path = ENDPOINTS[request['endpoint']]
+        body = json.dumps(request['body']).encode('utf-8') if request['body'] is not None else None
+        headers = {'Content-Type': 'application/json'} if body else {}
+        conn = self._connection()
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            return response.status
+        except Exception:
+            conn.close()
+            self._local.conn = None
+            return 0
+
+
+def run_closed_loop(client: LoadClient, factory: RequestFactory, concurrency: int,
+                    duration: float) -> Dict:
+    """Each of N workers sends its next request as soon as the previous one completes"""
+    results = Results()
+    stop_at = time.perf_counter() + duration
+
+    def worker():
+        while time.perf_counter() < stop_at:
+            request = factory.next()
+            start = time.perf_counter()
+            status = client.send(request)
+            results.add(request['endpoint'], time.perf_counter() - start, status)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results.summary(time.perf_counter() - start)
+
+
+def run_open_loop(client: LoadClient, factory: RequestFactory, rate: float, duration: float,
+                  max_in_flight: int, schedule: Optional[List[float]] = None) -> Dict:
+    """Send requests at fixed arrival times regardless of how fast responses come back.
+
+    Latency is measured from each request's scheduled send time, so queueing
+    inside the client is counted instead of hidden (no coordinated omission).
+    """
+    results = Results()
+    if schedule is None:
+        schedule = [i / rate for i in range(int(rate * duration))]
+
+    def fire(request, scheduled_at):
+        status = client.send(request)
+        results.add(request['endpoint'], time.perf_counter() - scheduled_at, status)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        for offset in schedule:
+            scheduled_at = start + offset
+            delay = scheduled_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(fire, factory.next(), scheduled_at)
+    return results.summary(time.perf_counter() - start)
+
+
+def start_local_service(fake_latency_ms: float, fake_jitter_ms: float) -> str:
+    """Start the real Flask app in-process with the fake generator and return its URL"""
+    os.environ['GENERATION_PROVIDER'] = 'fake'
+    os.environ['FAKE_GENERATION_LATENCY_MS'] = str(fake_latency_ms)
+    os.environ['FAKE_GENERATION_JITTER_MS'] = str(fake_jitter_ms)
+    logging_level = os.environ.get('LOADTEST_LOG_LEVEL', 'WARNING')
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import logging
+    from werkzeug.serving import make_server
+    import app as service
+
+    logging.getLogger().setLevel(logging_level)
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    if service.rag_client is None:
+        raise RuntimeError("AI service failed to initialize; see the log above")
+
+    server = make_server('127.0.0.1', 0, service.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+def print_step(label: str, summary: Dict):
+    latency = summary['latency_ms']
+    print(f"{label:>14} | {summary['requests']:>7} req | {summary['throughput_rps']:>8.1f} rps | "
+          f"p50 {latency['p50']:>8.1f} | p95 {latency['p95']:>8.1f} | p99 {latency['p99']:>8.1f} ms | "
+          f"errors {summary['error_rate'] * 100:>5.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the Medical RAG AI service")
+    parser.add_argument('--url', help="Target an already running service instead of starting one")
+    parser.add_argument('--mode', choices=['closed', 'open'], default='closed')
+    parser.add_argument('--concurrency', default='1,2,4,8,16,32',
+                        help="Closed loop: comma-separated worker counts to sweep")
+    parser.add_argument('--rates', default='5,10,20,40',
+                        help="Open loop: comma-separated arrival rates (req/s) to sweep")
+    parser.add_argument('--duration', type=float, default=20.0, help="Seconds per sweep step")
+    parser.add_argument('--mix', default='chat=0.2,search=0.7,stats=0.1')
+    parser.add_argument('--unique', action='store_true', help="Make every payload unique")
+    parser.add_argument('--replay', help="Replay a JSONL request log ({endpoint, body, t} per line)")
+    parser.add_argument('--speed', type=float, default=1.0, help="Replay time scale (2 = twice as fast)")
+    parser.add_argument('--max-in-flight', type=int, default=512, help="Open loop client thread cap")
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--fake-latency-ms', type=float, default=800.0)
+    parser.add_argument('--fake-jitter-ms', type=float, default=200.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Write the sweep results as JSON")
+    args = parser.parse_args()
+
+    base_url = args.url or start_local_service(args.fake_latency_ms, args.fake_jitter_ms)
+    replay = load_replay_log(args.replay) if args.replay else None
+    factory = RequestFactory(parse_mix(args.mix), args.unique, args.seed, replay)
+    client = LoadClient(base_url, args.timeout)
+
+    print(f"🏋️ Load testing {base_url} ({args.mode} loop, mix {args.mix})")
+    steps = []
+
+    if args.mode == 'open' and replay:
+        schedule = [r['t'] / args.speed for r in replay]
+        schedule = [t - schedule[0] for t in schedule]
+        summary = run_open_loop(client, factory, 0, 0, args.max_in_flight, schedule)
+        print_step("replay", summary)
+        steps.append({'step': 'replay', 'speed': args.speed, **summary})
+    elif args.mode == 'open':
+        for rate in [float(r) for r in args.rates.split(',')]:
+            summary = run_open_loop(client, factory, rate, args.duration, args.max_in_flight)
+            print_step(f"{rate:g} rps", summary)
+            steps.append({'step': rate, 'target_rps': rate, **summary})
+    else:
+        for concurrency in [int(c) for c in args.concurrency.split(',')]:
+            summary = run_closed_loop(client, factory, concurrency, args.duration)
+            print_step(f"{concurrency} workers", summary)
+            steps.append({'step': concurrency, 'concurrency': concurrency, **summary})
+
+    report = {
+        'target': base_url,
+        'mode': args.mode,
+        'mix': args.mix,
+        'duration_per_step': args.duration,
+        'fake_generator': None if args.url else {
+            'latency_ms': args.fake_latency_ms, 'jitter_ms': args.fake_jitter_ms
+        },
+        'steps': steps
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
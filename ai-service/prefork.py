@@ -0,0 +1,226 @@
+"""
+Pre-fork production server for the Medical RAG AI Service
+Loads the embedding model and vector index once in a master process, freezes them with
+gc.freeze() and forks workers that share those pages copy-on-write.
+
+Usage: python prefork.py --workers 4 --threads-per-worker 2 --port 5001
+"""
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from typing import Dict
+
+logger = logging.getLogger("prefork")
+
+# Environment variables that size native thread pools (BLAS, OpenMP, tokenizers)
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS",
+                   "NUMEXPR_NUM_THREADS", "VECLIB_MAXIMUM_THREADS")
+
+
+def limit_threads(threads: int):
+    """Cap native thread pools so workers do not oversubscribe cores.
+
+    The environment variables only take effect for libraries loaded afterwards,
+    so this is called before the app is imported and again in each worker.
+    """
+    for name in THREAD_ENV_VARS:
+        os.environ[name] = str(threads)
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        torch.set_num_threads(threads)
+
+
+def process_memory(pid="self") -> Dict[str, float]:
+    """Memory of a process in MB from /proc; uss is memory no other process shares"""
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0].endswith(":") and parts[1].isdigit():
+                    fields[parts[0][:-1]] = int(parts[1])
+    except OSError:
+        return {}
+    private = fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)
+    return {
+        "rss_mb": fields.get("Rss", 0) / 1024.0,
+        "pss_mb": fields.get("Pss", 0) / 1024.0,
+        "uss_mb": private / 1024.0,
+        "shared_mb": (fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0)) / 1024.0
+    }
+
+
+def chroma_needs_reopen() -> bool:
+    """Chroma 1.x runs a native runtime whose threads do not survive fork"""
+    try:
+        import chromadb
+        return int(chromadb.__version__.split(".")[0]) >= 1
+    except Exception:
+        return False
+
+
+class PreforkServer:
+    """Master that owns the listening socket and supervises forked workers"""
+
+    def __init__(self, host: str, port: int, workers: int, threads_per_worker: int,
+                 reopen_index: str, report_interval: float):
+        self.host = host
+        self.port = port
+        self.num_workers = workers
+        self.threads_per_worker = threads_per_worker
+        self.reopen_index = reopen_index
+        self.report_interval = report_interval
+        self.workers = {}  # pid -> worker id
+        self.stopping = False
+        self.sock = None
+        self.service = None
+
+    def load(self):
+        """Import the app (loading model and index) and warm it up before forking"""
+        limit_threads(self.threads_per_worker)
+        import app as service
+        self.service = service
+        if service.rag_client is None:
+            raise RuntimeError("RAG client failed to initialize")
+        if self.reopen_index == "auto":
+            self.reopen_index = chroma_needs_reopen()
+        else:
+            self.reopen_index = self.reopen_index == "yes"
+
+        # The snapshot watcher thread would not survive fork; workers restart it
+        if service.snapshot_manager is not None:
+            service.snapshot_manager.stop()
+
+        # Touch the encoder and index so their pages exist before fork
+        logger.info("Warming up encoder and vector index in master...")
+        service.rag_client.vector_db.search_similar("warm up query for shared memory", 1)
+
+        # Move everything allocated so far out of the GC's reach so collections
+        # in workers do not write to (and un-share) these pages
+        gc.collect()
+        gc.freeze()
+        logger.info(f"Froze {gc.get_freeze_count()} objects; master memory: {process_memory()}")
+
+    def bind(self):
+        self.sock = socket.create_server((self.host, self.port), backlog=1024, reuse_port=False)
+        self.sock.set_inheritable(True)
+        logger.info(f"Listening on {self.host}:{self.port}")
+
+    def spawn(self, worker_id: int):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                self.run_worker(worker_id)
+            finally:
+                os._exit(0)
+        self.workers[pid] = worker_id
+        logger.info(f"Started worker {worker_id} (pid {pid})")
+
+    def run_worker(self, worker_id: int):
+        """Serve requests on the inherited socket"""
+        from werkzeug.serving import make_server
+
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        os.environ["AI_WORKER_ID"] = str(worker_id)
+        limit_threads(self.threads_per_worker)
+
+        if self.reopen_index:
+            self.reopen_vector_db()
+        if self.service.snapshot_manager is not None:
+            self.service.snapshot_manager.start()
+
+        server = make_server(self.host, self.port, self.service.app, threaded=True, fd=self.sock.fileno())
+        signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+        server.serve_forever()
+
+    def reopen_vector_db(self):
+        """Re-open the Chroma client in this worker, keeping the shared encoder"""
+        from vector_db_manager import MedicalVectorDB
+        try:
+            from chromadb.api.client import SharedSystemClient
+            SharedSystemClient.clear_system_cache()
+        except Exception:
+            pass
+        rag_client = self.service.rag_client
+        old = rag_client.vector_db
+        if not isinstance(old, MedicalVectorDB):
+            return  # Shard clients open a connection per request
+        rag_client.vector_db = MedicalVectorDB(db_path=old.db_path, collection_name=old.collection_name,
+                                               encoder=old.encoder, server=old.server)
+
+    def report_memory(self):
+        for pid, worker_id in sorted(self.workers.items(), key=lambda item: item[1]):
+            memory = process_memory(pid)
+            if memory:
+                logger.info(f"Worker {worker_id} (pid {pid}): uss {memory['uss_mb']:.1f}MB, "
+                            f"pss {memory['pss_mb']:.1f}MB, rss {memory['rss_mb']:.1f}MB")
+
+    def stop(self, *_):
+        self.stopping = True
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        self.load()
+        self.bind()
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        for worker_id in range(self.num_workers):
+            self.spawn(worker_id)
+
+        last_report = time.monotonic()
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid:
+                worker_id = self.workers.pop(pid, None)
+                if not self.stopping and worker_id is not None:
+                    logger.warning(f"Worker {worker_id} (pid {pid}) exited with status {status}; restarting")
+                    self.spawn(worker_id)
+                continue
+
+            if self.report_interval and time.monotonic() - last_report >= self.report_interval:
+                self.report_memory()
+                last_report = time.monotonic()
+            time.sleep(0.5)
+
+        self.sock.close()
+        logger.info("All workers stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-fork server for the Medical RAG AI Service")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("AI_SERVICE_PORT", 5001)))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("AI_SERVICE_WORKERS", os.cpu_count() or 1)))
+    parser.add_argument("--threads-per-worker", type=int, default=int(os.getenv("AI_SERVICE_THREADS_PER_WORKER", 1)),
+                        help="Torch/BLAS threads per worker (workers x threads should not exceed cores)")
+    parser.add_argument("--reopen-index", choices=["auto", "yes", "no"], default="auto",
+                        help="Re-open the Chroma client in each worker (required for chromadb>=1.0)")
+    parser.add_argument("--report-interval", type=float, default=60.0,
+                        help="Seconds between worker memory reports (0 disables)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    server = PreforkServer(args.host, args.port, args.workers, args.threads_per_worker,
+                           args.reopen_index, args.report_interval)
+    server.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Sampling profiler for the Medical RAG AI Service
+A background thread reads Python stacks with sys._current_frames() at a fixed interval, so
+profiled code runs unmodified. Profiles are written in collapsed ("folded") stack format,
+one `frame;frame;frame count` line per distinct stack, for flamegraph.pl, speedscope or inferno.
+Two modes: a sampled fraction of requests (one file per request), and on-demand
+whole-process profiles for a fixed number of seconds. Only the newest max_files
+profiles are kept.
+"""
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+# code object -> frame label; labels are rebuilt only for code not seen before
+_labels = {}
+
+
+def frame_label(code) -> str:
+    label = _labels.get(code)
+    if label is None:
+        label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        _labels[code] = label
+    return label
+
+
+def collapse(frame) -> str:
+    """Folded stack of a frame, outermost call first"""
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame.f_code))
+        frame = frame.f_back
+    labels.reverse()
+    return ";".join(labels)
+
+
+def render_folded(stacks: Counter) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+class Profiler:
+    """Per-request sampling and on-demand process profiles, written to output_dir"""
+
+    def __init__(self, output_dir: str, sample_rate: float, interval_ms: float, max_files: int = 500):
+        self.output_dir = output_dir
+        self.max_files = max_files
+        self.sample_rate = sample_rate
+        self.interval = interval_ms / 1000
+        self._targets: Dict[int, Counter] = {}  # Thread ident -> stacks of the request it is serving
+        self._condition = threading.Condition()
+        self._sampler_pid = None
+        self._process_lock = threading.Lock()
+
+    def should_sample(self) -> bool:
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def start_request(self):
+        """Start sampling the calling thread"""
+        with self._condition:
+            # Threads do not survive fork, so each worker process starts its own sampler
+            if self._sampler_pid != os.getpid():
+                self._targets.clear()
+                threading.Thread(target=self._sample_requests, name="request-profiler", daemon=True).start()
+                self._sampler_pid = os.getpid()
+            self._targets[threading.get_ident()] = Counter()
+            self._condition.notify()
+
+    def finish_request(self, name: str, seconds: float) -> Optional[str]:
+        """Stop sampling the calling thread and write its profile; returns the file path"""
+        with self._condition:
+            stacks = self._targets.pop(threading.get_ident(), None)
+        if not stacks:
+            return None  # Finished within one sampling interval
+        return self.write(f"{name}-{seconds * 1000:.0f}ms", stacks, root=name)
+
+    def _sample_requests(self):
+        while True:
+            with self._condition:
+                while not self._targets:
+                    self._condition.wait()  # Idle (no profiled request in flight) costs nothing
+                frames = sys._current_frames()
+                for ident, stacks in self._targets.items():
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        stacks[collapse(frame)] += 1
+                del frames
+            time.sleep(self.interval)
+
+    def profile_process(self, seconds: float) -> Tuple[str, str]:
+        """Sample every thread except the caller for `seconds`; returns (folded stacks, file path).
+
+        Raises RuntimeError if another process profile is already running.
+        """
+        if not self._process_lock.acquire(blocking=False):
+            raise RuntimeError("A profile is already being captured")
+        try:
+            caller = threading.get_ident()
+            stacks = Counter()
+            names = {}
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                frames = sys._current_frames()
+                if not names.keys() >= frames.keys():
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for ident, frame in frames.items():
+                    if ident != caller:
+                        stacks[f"{names.get(ident, ident)};{collapse(frame)}"] += 1
+                del frames
+                time.sleep(self.interval)
+        finally:
+            self._process_lock.release()
+        return render_folded(stacks), self.write(f"process-{seconds:g}s", stacks)
+
+    def write(self, name: str, stacks: Counter, root: Optional[str] = None) -> str:
+        """Write folded stacks, optionally under a common root frame, and return the file path"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        if root:
+            stacks = Counter({f"{root};{stack}": count for stack, count in stacks.items()})
+        path = os.path.join(self.output_dir,
+                            f"{datetime.now():%Y%m%dT%H%M%S%f}-{os.getpid()}-{name}.folded")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(render_folded(stacks))
+        self.rotate()
+        return path
+
+    def rotate(self):
+        """Delete the oldest profiles beyond max_files (names start with their write time)"""
+        profiles = sorted(name for name in os.listdir(self.output_dir) if name.endswith(".folded"))
+        for name in profiles[:max(len(profiles) - self.max_files, 0)]:
+            try:
+                os.remove(os.path.join(self.output_dir, name))
+            except FileNotFoundError:
+                pass  # Another worker process rotated it first
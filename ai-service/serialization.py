@@ -0,0 +1,78 @@
+"""
+Response serialization for the Medical RAG AI Service
+Encodes JSON with orjson when it is installed and gzips bodies for clients that accept it
+"""
+import gzip
+import json
+from typing import Any, Dict, List, Optional
+from flask import Response
+
+try:
+    import orjson
+except ImportError:  # Standard library fallback, same output minus whitespace
+    orjson = None
+
+# Smaller bodies are not worth the CPU or the gzip header overhead
+GZIP_MIN_BYTES = 1024
+GZIP_LEVEL = 5
+
+
+def dumps(payload: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    """True unless the client did not list gzip or disabled it with q=0"""
+    for part in (accept_encoding or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        if coding.strip().lower() in ('gzip', '*'):
+            name, _, value = params.replace(' ', '').partition('=')
+            if name.lower() != 'q':
+                return True
+            try:
+                return float(value) > 0
+            except ValueError:
+                return False
+    return False
+
+
+def json_response(payload: Any, status: int = 200, accept_encoding: Optional[str] = None) -> Response:
+    """Build a JSON response, compressed when the client allows it"""
+    body = dumps(payload)
+    response = Response(body, status=status, mimetype='application/json')
+    response.headers['Vary'] = 'Accept-Encoding'
+    if len(body) >= GZIP_MIN_BYTES and accepts_gzip(accept_encoding):
+        response.set_data(gzip.compress(body, compresslevel=GZIP_LEVEL))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+def snippet(text: str, max_chars: int) -> str:
+    """Shorten text to about max_chars, cutting at a word boundary"""
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars]
+    space = cut.rfind(' ')
+    if space > max_chars // 2:
+        cut = cut[:space]
+    return cut.rstrip() + '...'
+
+
+def project(result: Dict, fields: Optional[List[str]], snippet_chars: Optional[int] = None) -> Dict:
+    """Keep only the requested fields of a search result.
+
+    'type' is a shortcut for metadata['type'] so list views can skip metadata.
+    """
+    if snippet_chars and 'document' in result:
+        result = dict(result, document=snippet(result['document'], snippet_chars))
+    if not fields:
+        return result
+    projected = {}
+    for field in fields:
+        if field == 'type':
+            projected['type'] = result.get('metadata', {}).get('type')
+        elif field in result:
+            projected[field] = result[field]
+    return projected
@@ -0,0 +1,101 @@
+"""
+Single-flight request coalescing for the AI service
+Concurrent callers with the same key share one in-flight computation
+"""
+import hashlib
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, Tuple
+
+
+class _Call:
+    """One in-flight computation and the callers waiting on it"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Deduplicates overlapping calls that share a key.
+
+    Only calls that overlap in time are coalesced; once the leader finishes,
+    the key is forgotten and the next call computes again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._stats = {
+            'leaders': 0,
+            'coalesced': 0,
+            'errors': 0,
+            'wait_seconds_total': 0.0,
+            'wait_seconds_max': 0.0
+        }
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Run fn once per key among concurrent callers.
+
+        Returns (result, shared) where shared is True if this caller waited
+        on another caller's computation. Exceptions raised by fn are
+        re-raised in every caller.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = _Call()
+                self._calls[key] = call
+                leader = True
+                self._stats['leaders'] += 1
+            else:
+                call.waiters += 1
+                leader = False
+                self._stats['coalesced'] += 1
+
+        if leader:
+            try:
+                call.result = fn()
+            except Exception as e:
+                call.error = e
+                with self._lock:
+                    self._stats['errors'] += 1
+            finally:
+                with self._lock:
+                    self._calls.pop(key, None)
+                call.done.set()
+        else:
+            start = time.perf_counter()
+            call.done.wait()
+            waited = time.perf_counter() - start
+            with self._lock:
+                self._stats['wait_seconds_total'] += waited
+                self._stats['wait_seconds_max'] = max(self._stats['wait_seconds_max'], waited)
+
+        if call.error is not None:
+            raise call.error
+        return call.result, not leader
+
+    def get_stats(self) -> Dict:
+        """Get coalescing counters and follower wait times"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = len(self._calls)
+        coalesced = stats['coalesced']
+        stats['avg_wait_seconds'] = stats['wait_seconds_total'] / coalesced if coalesced else 0.0
+        return stats
+
+
+def normalize_text(text: str) -> str:
+    """Normalize free text so trivially different requests share a key"""
+    return " ".join(str(text).lower().split())
+
+
+def make_key(endpoint: str, payload: Dict) -> str:
+    """Build a stable coalescing key from an endpoint and normalized payload"""
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    digest = hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+    return f"{endpoint}:{digest}"
@@ -83,6 +83,11 @@ if [ -f "../backend/.env" ] && [ ! -f ".env" ]; then
     cp ../backend/.env .env
 fi
 
-# Start the service
-echo "🚀 Starting AI service on port 5001 with $PYTHON_CMD..."
-$PYTHON_CMD app.py
+# Start the service (AI_SERVICE_MODE=prefork for the multi-worker production server)
+if [ "$AI_SERVICE_MODE" = "prefork" ]; then
+    echo "🚀 Starting AI service on port 5001 with ${AI_SERVICE_WORKERS:-all cores} pre-forked workers..."
+    $PYTHON_CMD prefork.py
+else
+    echo "🚀 Starting AI service on port 5001 with $PYTHON_CMD..."
+    $PYTHON_CMD app.py
+fi
@@ -0,0 +1,142 @@
+"""
+Tests for admission control: service-time EWMA, load shedding and the 429 response
+"""
+import os
+import sys
+import threading
+import time
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'ai-model'))
+import admission
+from admission import AdmissionController, AdmissionGate, Overloaded
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(admission, "time", clock)
+    return clock
+
+
+def hold(gate: AdmissionGate, clock: FakeClock, seconds: float):
+    with gate.admit():
+        clock.now += seconds
+
+
+def test_service_time_ewma(clock):
+    gate = AdmissionGate("test", max_concurrent=2, max_queue=4, max_wait_seconds=10, ewma_alpha=0.5)
+    assert gate.estimated_wait(3) == 0.0  # No samples yet
+
+    hold(gate, clock, 1.0)
+    assert gate.service_seconds == pytest.approx(1.0)
+    hold(gate, clock, 3.0)
+    assert gate.service_seconds == pytest.approx(2.0)
+    # Three requests ahead plus this one, over two slots
+    assert gate.estimated_wait(3) == pytest.approx(4.0)
+
+
+def test_sheds_when_estimated_wait_exceeds_limit(clock):
+    gate = AdmissionGate("test", max_concurrent=1, max_queue=4, max_wait_seconds=1.0)
+    hold(gate, clock, 2.0)
+
+    with gate.admit():
+        with pytest.raises(Overloaded) as shed:
+            with gate.admit():
+                pass
+    assert shed.value.reason == 'wait_estimate'
+    assert shed.value.retry_after == pytest.approx(2.0)
+    assert shed.value.retry_after_header == "2"
+    assert gate.get_stats()['shed'] == {'queue_full': 0, 'wait_estimate': 1, 'queue_timeout': 0}
+
+
+def test_sheds_when_queue_is_full():
+    gate = AdmissionGate("test", max_concurrent=1, max_queue=0, max_wait_seconds=1.0)
+    with gate.admit():
+        with pytest.raises(Overloaded) as shed:
+            with gate.admit():
+                pass
+    assert shed.value.reason == 'queue_full'
+    assert shed.value.retry_after_header == "1"  # Falls back to max_wait_seconds
+
+
+def test_queued_request_gives_up_after_max_wait():
+    gate = AdmissionGate("test", max_concurrent=1, max_queue=4, max_wait_seconds=0.05)
+    with gate.admit():
+        with pytest.raises(Overloaded) as shed:
+            with gate.admit():
+                pass
+    assert shed.value.reason == 'queue_timeout'
+    assert gate.get_stats()['queued'] == 0
+
+
+def test_queued_request_gets_released_slot():
+    gate = AdmissionGate("test", max_concurrent=1, max_queue=4, max_wait_seconds=5)
+    admitted = threading.Event()
+
+    def wait_for_slot():
+        with gate.admit():
+            admitted.set()
+
+    with gate.admit():
+        waiter = threading.Thread(target=wait_for_slot)
+        waiter.start()
+        while gate.get_stats()['queued'] == 0:
+            time.sleep(0.001)
+        assert not admitted.is_set()
+    waiter.join(timeout=5)
+
+    assert admitted.is_set()
+    assert gate.get_stats()['admitted'] == 2
+
+
+def test_routes_map_to_classes_by_longest_prefix():
+    controller = AdmissionController(
+        {"interactive": {"max_concurrent": 1, "max_queue": 1, "max_wait_seconds": 1},
+         "admin": {"max_concurrent": 1, "max_queue": 1, "max_wait_seconds": 1}},
+        {"/api/ai": "interactive", "/api/ai/index/jobs": "admin"})
+    assert controller.class_for("/api/ai/search") == "interactive"
+    assert controller.class_for("/api/ai/index/jobs/abc") == "admin"
+    assert controller.class_for("/api/aix") is None
+    assert controller.class_for("/health") is None
+
+    with pytest.raises(ValueError):
+        AdmissionController({}, {"/api/ai": "missing"})
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    """The AI service app, started in an empty directory"""
+    pytest.importorskip("flask")
+    pytest.importorskip("chromadb")
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("EMBEDDING_BACKEND", "hashing")
+    monkeypatch.setenv("GENERATION_PROVIDER", "fake")
+    import app
+    return app
+
+
+def test_shed_request_gets_429_with_retry_after(service, monkeypatch):
+    controller = AdmissionController(
+        {"interactive": {"max_concurrent": 1, "max_queue": 0, "max_wait_seconds": 3}},
+        {"/api/ai/stats": "interactive"})
+    monkeypatch.setattr(service, "admission", controller)
+    client = service.app.test_client()
+
+    with controller.admit("interactive"):
+        response = client.get("/api/ai/stats")
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "3"
+    assert response.get_json()['reason'] == 'queue_full'
+
+    # Unscheduled paths are never queued
+    with controller.admit("interactive"):
+        assert client.get("/health").status_code != 429
@@ -0,0 +1,86 @@
+"""
+Tests for single-flight coalescing of concurrent identical requests
+"""
+import threading
+import time
+import pytest
+from single_flight import SingleFlight, make_key, normalize_text
+
+
+def run_concurrently(flight: SingleFlight, key: str, fn, callers: int):
+    """Start callers that all call flight.do(key, fn); returns their (result, shared) or exception"""
+    outcomes = [None] * callers
+
+    def call(i):
+        try:
+            outcomes[i] = flight.do(key, fn)
+        except Exception as e:
+            outcomes[i] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(callers)]
+    for thread in threads:
+        thread.start()
+    return threads, outcomes
+
+
+def test_overlapping_calls_share_one_computation():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return "answer"
+
+    threads, outcomes = run_concurrently(flight, "k", compute, 5)
+    while flight.get_stats()['coalesced'] < 4:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert sorted(outcomes, key=lambda outcome: outcome[1]) == [("answer", False)] + [("answer", True)] * 4
+    stats = flight.get_stats()
+    assert (stats['leaders'], stats['coalesced'], stats['in_flight']) == (1, 4, 0)
+
+
+def test_errors_reach_every_waiter():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def compute():
+        release.wait(5)
+        raise ValueError("failed")
+
+    threads, outcomes = run_concurrently(flight, "k", compute, 3)
+    while flight.get_stats()['coalesced'] < 2:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert all(isinstance(outcome, ValueError) for outcome in outcomes)
+    assert flight.get_stats()['errors'] == 1
+
+
+def test_key_is_forgotten_once_the_leader_finishes():
+    flight = SingleFlight()
+    calls = []
+    assert flight.do("k", lambda: calls.append(1) or len(calls)) == (1, False)
+    assert flight.do("k", lambda: calls.append(1) or len(calls)) == (2, False)
+
+
+def test_different_keys_do_not_coalesce():
+    flight = SingleFlight()
+    assert flight.do("a", lambda: "a") == ("a", False)
+    assert flight.do("b", lambda: "b") == ("b", False)
+    assert flight.get_stats()['coalesced'] == 0
+
+
+def test_keys_ignore_case_whitespace_and_field_order():
+    first = make_key("/api/ai/chat", {"message": normalize_text("  What is   MALARIA?"), "n": 5})
+    second = make_key("/api/ai/chat", {"n": 5, "message": normalize_text("what is malaria?")})
+    assert first == second
+    assert first != make_key("/api/ai/search", {"n": 5, "message": normalize_text("what is malaria?")})
@@ -248,9 +248,9 @@ router.post("/chat", authenticateToken, async (req, res) => {
       status: err.response?.status
     });
 
-    // Fallback to direct Gemini API if AI service is unavailable
-    if (err.code === 'ECONNREFUSED' || err.response?.status >= 500) {
-      console.log("AI service unavailable, falling back to direct Gemini API...");
+    // Fallback to direct Gemini API if AI service is unavailable or shedding load (429)
+    if (err.code === 'ECONNREFUSED' || err.response?.status === 429 || err.response?.status >= 500) {
+      console.log(`AI service unavailable (${err.response?.status || err.code}), falling back to direct Gemini API...`);
       return fallbackToDirectGemini(req, res, message);
     }
 